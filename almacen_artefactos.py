@@ -0,0 +1,199 @@
+# almacen_artefactos.py - Directorios de trabajo y descargas de la API con caducidad.
+#
+# Cada trabajo de la API escribe en su propio directorio (MusicXML subido, PDF
+# anotado, informe). El almacen es el dueno de esos directorios y de los tokens de
+# descarga que apuntan a ellos:
+#   - TTL por entrada, renovado con cada uso (acierto de cache, descarga);
+#   - presupuesto total de disco: al superarlo se expulsan primero las entradas
+#     usadas hace mas tiempo;
+#   - las entradas en uso (trabajo sin terminar) nunca se expulsan;
+#   - barrer() aplica ambos limites; la API lo llama desde una tarea periodica.
+# Al expulsar una entrada se borra su directorio, se invalidan sus tokens y se
+# avisa a al_expulsar(id) para que la API olvide el trabajo asociado.
+# El lock solo protege los diccionarios: medir y borrar directorios se hace fuera
+# de el, para que el event loop (tocar, descargas) nunca espere a un os.walk o un
+# rmtree de otro hilo.
+
+import os
+import secrets
+import shutil
+import tempfile
+import threading
+import time
+
+
+def _tamano_directorio(ruta):
+    total = 0
+    for raiz, _, archivos in os.walk(ruta):
+        for nombre in archivos:
+            try:
+                total += os.path.getsize(os.path.join(raiz, nombre))
+            except OSError:
+                pass
+    return total
+
+
+class AlmacenArtefactos:
+    """Directorios de trabajo con TTL, cuota de disco y registro de descargas."""
+
+    def __init__(self, raiz=None, ttl_s=24 * 3600, max_bytes=1024 * 1024 * 1024, al_expulsar=None):
+        self.raiz = raiz or os.path.join(tempfile.gettempdir(), "contrapunto_artefactos")
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self._al_expulsar = al_expulsar
+        self._entradas = {}      # id -> {ruta, ttl_s, ultimo_uso, bytes, en_uso, tokens}
+        self._descargas = {}     # token -> (id, ruta_archivo)
+        self._lock = threading.Lock()
+        self.expulsiones = {"ttl": 0, "cuota": 0, "cache": 0, "lote": 0, "manual": 0}
+        os.makedirs(self.raiz, exist_ok=True)
+
+    # --- ciclo de vida de una entrada ---
+    def crear(self, ttl_s=None):
+        """Reserva un directorio nuevo (en uso). Devuelve (id, ruta)."""
+        id_entrada = secrets.token_urlsafe(12)
+        ruta = tempfile.mkdtemp(prefix="contrapunto_", dir=self.raiz)
+        with self._lock:
+            self._entradas[id_entrada] = {
+                "ruta": ruta, "ttl_s": ttl_s or self.ttl_s, "ultimo_uso": time.monotonic(),
+                "bytes": 0, "en_uso": True, "tokens": [],
+            }
+        return id_entrada, ruta
+
+    def liberar(self, id_entrada):
+        """El trabajo termino: se mide el directorio y pasa a ser expulsable."""
+        medidos = self._tamano(id_entrada)
+        with self._lock:
+            entrada = self._entradas.get(id_entrada)
+            if entrada is None:
+                return
+            entrada["bytes"] = medidos
+            entrada["en_uso"] = False
+            entrada["ultimo_uso"] = time.monotonic()
+            quitadas = self._aplicar_cuota()
+        self._descartar(quitadas)
+
+    def medir(self, id_entrada):
+        """Vuelve a medir una entrada en uso (p. ej. un lote que escribe mientras dura) y aplica la cuota.
+
+        Sus bytes cuentan para el presupuesto: al crecer se expulsan otras entradas
+        (nunca las que estan en uso). Devuelve los bytes medidos.
+        """
+        medidos = self._tamano(id_entrada)
+        with self._lock:
+            entrada = self._entradas.get(id_entrada)
+            if entrada is None:
+                return 0
+            entrada["bytes"] = medidos
+            quitadas = self._aplicar_cuota()
+        self._descartar(quitadas)
+        return medidos
+
+    def tocar(self, id_entrada):
+        """Renueva el TTL y la antiguedad de la entrada."""
+        with self._lock:
+            entrada = self._entradas.get(id_entrada)
+            if entrada is not None:
+                entrada["ultimo_uso"] = time.monotonic()
+
+    def eliminar(self, id_entrada, motivo="manual"):
+        """Quita la entrada y borra su directorio (en el hilo que llama: no desde el event loop)."""
+        with self._lock:
+            ruta = self._quitar(id_entrada, motivo)
+        if ruta is not None:
+            self._descartar([(id_entrada, ruta)])
+
+    # --- descargas ---
+    def registrar_descarga(self, id_entrada, ruta_archivo):
+        """Token de descarga para un archivo de la entrada (caduca con ella)."""
+        token = secrets.token_urlsafe(16)
+        with self._lock:
+            entrada = self._entradas.get(id_entrada)
+            if entrada is None:
+                return None
+            entrada["tokens"].append(token)
+            self._descargas[token] = (id_entrada, ruta_archivo)
+        return token
+
+    def resolver_descarga(self, token):
+        """Ruta del archivo del token, o None si no existe o ya expiro."""
+        with self._lock:
+            destino = self._descargas.get(token)
+            if destino is None:
+                return None
+            id_entrada, ruta = destino
+            self._entradas[id_entrada]["ultimo_uso"] = time.monotonic()
+        return ruta if os.path.exists(ruta) else None
+
+    # --- expulsion ---
+    def barrer(self):
+        """Expulsa las entradas caducadas y, si hace falta, las mas antiguas hasta cumplir la cuota."""
+        ahora = time.monotonic()
+        with self._lock:
+            caducadas = [i for i, e in self._entradas.items()
+                         if not e["en_uso"] and ahora - e["ultimo_uso"] > e["ttl_s"]]
+            quitadas = [(id_entrada, self._quitar(id_entrada, "ttl")) for id_entrada in caducadas]
+            quitadas += self._aplicar_cuota()
+        self._descartar(quitadas)
+        return len(quitadas)
+
+    def limpiar_huerfanos(self):
+        """Borra directorios de la raiz que no pertenecen a ninguna entrada (p. ej. de un arranque anterior)."""
+        with self._lock:
+            propias = {os.path.normpath(e["ruta"]) for e in self._entradas.values()}
+        borrados = 0
+        for nombre in os.listdir(self.raiz):
+            ruta = os.path.normpath(os.path.join(self.raiz, nombre))
+            if ruta not in propias and os.path.isdir(ruta):
+                shutil.rmtree(ruta, ignore_errors=True)
+                borrados += 1
+        return borrados
+
+    def _tamano(self, id_entrada):
+        """Bytes del directorio de la entrada, medidos sin el lock (0 si ya no existe)."""
+        with self._lock:
+            entrada = self._entradas.get(id_entrada)
+            ruta = entrada["ruta"] if entrada is not None else None
+        return _tamano_directorio(ruta) if ruta is not None else 0
+
+    def _aplicar_cuota(self):
+        """Quita entradas hasta cumplir la cuota (con el lock); devuelve [(id, ruta)] para _descartar."""
+        total = sum(e["bytes"] for e in self._entradas.values())
+        quitadas = []
+        if total <= self.max_bytes:
+            return quitadas
+        candidatas = sorted((e["ultimo_uso"], i) for i, e in self._entradas.items() if not e["en_uso"])
+        for _, id_entrada in candidatas:
+            if total <= self.max_bytes:
+                break
+            total -= self._entradas[id_entrada]["bytes"]
+            quitadas.append((id_entrada, self._quitar(id_entrada, "cuota")))
+        return quitadas
+
+    def _quitar(self, id_entrada, motivo):
+        """Saca la entrada y sus tokens (con el lock); devuelve su ruta, o None si no existia."""
+        entrada = self._entradas.pop(id_entrada, None)
+        if entrada is None:
+            return None
+        for token in entrada["tokens"]:
+            self._descargas.pop(token, None)
+        self.expulsiones[motivo] = self.expulsiones.get(motivo, 0) + 1
+        return entrada["ruta"]
+
+    def _descartar(self, quitadas):
+        """Borra los directorios de las entradas quitadas (sin el lock) y avisa a al_expulsar."""
+        for _, ruta in quitadas:
+            shutil.rmtree(ruta, ignore_errors=True)
+        if self._al_expulsar:
+            for id_entrada, _ in quitadas:
+                self._al_expulsar(id_entrada)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "entradas": len(self._entradas),
+                "en_uso": sum(1 for e in self._entradas.values() if e["en_uso"]),
+                "bytes": sum(e["bytes"] for e in self._entradas.values()),
+                "max_bytes": self.max_bytes,
+                "descargas": len(self._descargas),
+                "expulsiones": dict(self.expulsiones),
+            }
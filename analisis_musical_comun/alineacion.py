@@ -0,0 +1,32 @@
+# analisis_musical_comun/alineacion.py - Alineacion vertical CP/CF en un solo barrido.
+#
+# Sustituye las busquedas cf_flat.getElementsByOffset(...) por nota del CP: ambas
+# voces se recorren una sola vez en orden de offset (dos punteros), de modo que la
+# alineacion de un ejercicio es lineal en el numero de notas. Trabaja sobre las
+# voces compactas (voces.Voz): offset, pulso y compas ya vienen en cada Nota.
+
+from collections import namedtuple
+
+# cp: nota del contrapunto; cf: nota del CF que suena en su ataque (o None);
+# tiempo: pulso (beat) de la nota del CP; compas: numero de compas de la nota del CP.
+EventoVertical = namedtuple("EventoVertical", "cp cf tiempo compas")
+
+
+def alinear_voces(cp_voz, cf_voz):
+    """Devuelve un EventoVertical por cada nota del CP, en orden.
+
+    La nota del CF asociada es la que esta sonando en el ataque de la nota del CP
+    (empieza antes o a la vez y termina despues), igual que
+    getElementsByOffset(offset, mustBeginInSpan=False)[0].
+    """
+    cf_notas = cf_voz.notas
+    eventos = []
+    j, total_cf = 0, len(cf_notas)
+    for n_cp in cp_voz.notas:
+        offset = n_cp.offset
+        # Avanzar el puntero del CF hasta la primera nota que no ha terminado.
+        while j < total_cf and cf_notas[j].offset + cf_notas[j].duracion <= offset:
+            j += 1
+        n_cf = cf_notas[j] if j < total_cf and cf_notas[j].offset <= offset else None
+        eventos.append(EventoVertical(n_cp, n_cf, n_cp.tiempo, n_cp.compas))
+    return eventos
@@ -0,0 +1,168 @@
+# analisis_musical_comun/diagnosticos.py - Diagnosticos tipados de las reglas y su texto.
+#
+# Las reglas no escriben frases: devuelven Diagnostico (codigo, severidad y los
+# datos del hallazgo: compas, pulso, ids de nota, intervalo, tipo de movimiento...).
+# El texto se genera una sola vez en los bordes (consola, informe PDF, mensajes de
+# la API) con texto(d, especie), y a_dict da la forma JSON. El informe agrupa y
+# colorea por campos (codigo, voz, movimiento) en lugar de volver a leer frases.
+#
+# Campos de Diagnostico:
+#   codigo      que se encontro ("disonancia", "paralelas", "movimiento_melodico"...)
+#   severidad   ERROR u OBSERVACION
+#   regla       nombre de la regla del registro (lo pone ventanas.evaluar_reglas;
+#               None en los diagnosticos del analisis fuera del registro)
+#   compas, compas_fin   compas del hallazgo (y ultimo compas si abarca varios)
+#   tiempo      pulso en el compas (Nota.tiempo; 1.0 = tiempo fuerte)
+#   evento      numero de evento alineado, desde 1 (el "tiempo N" de primera especie)
+#   notas       ids de las notas implicadas
+#   intervalo   nombre simple del intervalo relevante ("P5", "M2"...)
+#   movimiento  melodico ("repeticion", "grado_conjunto", "salto") o entre voces
+#               ("parallel", "similar", "contrary", "oblique", "noMotion")
+#   voz         "cp" o "cf" si el hallazgo es de una sola voz
+#   datos       lo que solo necesita el texto (nombres de nota y de voz, nombre
+#               largo del intervalo, detalle de un error interno...)
+# Los diagnosticos son inmutables: la memo de las sesiones los reutiliza tal cual.
+# Modulo sin dependencias (ni music21): lo importan tambien la API y el informe.
+
+from collections import namedtuple
+
+ERROR = "error"
+OBSERVACION = "observacion"
+
+Diagnostico = namedtuple(
+    "Diagnostico",
+    "codigo severidad regla compas compas_fin tiempo evento notas intervalo movimiento voz datos",
+    defaults=(None, None, None, None, None, (), None, None, None, None))
+
+
+def error(codigo, **campos):
+    return Diagnostico(codigo, ERROR, **campos)
+
+
+def observacion(codigo, **campos):
+    return Diagnostico(codigo, OBSERVACION, **campos)
+
+
+# --- Texto ---
+
+def _rango(d):
+    """Compases de un movimiento como en el informe: "Compás 3:", "Compás 3 a 4:"..."""
+    if d.compas is not None and d.compas_fin is not None:
+        return f"Compás {d.compas}:" if d.compas == d.compas_fin else f"Compás {d.compas} a {d.compas_fin}:"
+    if d.compas is not None:
+        return f"Desde Compás {d.compas}:"
+    if d.compas_fin is not None:
+        return f"Hacia Compás {d.compas_fin}:"
+    return ""
+
+
+def rango_corto(d):
+    """Compases abreviados para el informe ("C. 3", "C. 3 a 4"); "" si no hay."""
+    return _rango(d).rstrip(":").replace("Compás", "C.").replace("Desde C.", "desde C.").replace("Hacia C.", "hacia C.")
+
+
+def describir_movimiento(d):
+    """Descripcion de un movimiento_melodico o movimiento_entre_voces, sin compases ni voz."""
+    datos = d.datos or {}
+    if d.codigo == "movimiento_melodico":
+        if d.movimiento == "repeticion":
+            return f"Repetición de {datos['nota_fin']}"
+        if d.movimiento is None:
+            return f"No se pudo calcular movimiento melódico ({datos['error']})"
+        tipo = "Grado Conjunto" if d.movimiento == "grado_conjunto" else "Salto"
+        # 1 / -1: intervalos.ASCENDENTE / DESCENDENTE (sin importar music21 aqui).
+        direccion = {1: "Ascendente", -1: "Descendente"}.get(datos["direccion"], "")
+        return f"{tipo} de {datos['intervalo_largo']} {direccion} (de {datos['nota_inicio']} a {datos['nota_fin']})"
+    if d.movimiento is None:
+        if datos.get("error") is None:
+            return "No se pudo determinar (elemento no es una nota válida con pitch)."
+        return f"No se pudo determinar el movimiento (error interno: {datos['error']})."
+    detalle = f" (formando {d.intervalo}s)" if d.movimiento == "parallel" and d.intervalo else ""
+    return f"Movimiento {d.movimiento.capitalize()}{detalle}"
+
+
+def _movimiento_melodico(d, campos):
+    return f"{_rango(d)} {campos['voz_nombre']} - {describir_movimiento(d)}"
+
+
+def _movimiento_entre_voces(d, campos):
+    return f"{_rango(d)} Entre voces: {describir_movimiento(d)}"
+
+
+def _disonancia_debil(d, campos):
+    problema = (f"Disonancia mal tratada ({', '.join(campos['detalles'])})"
+                if campos.get("detalles") else "Disonancia no justificada")
+    return f"Error en Compás {d.compas}: {problema}. Disonancia ({campos['intervalo']}) debe ser nota de paso."
+
+
+# codigo -> plantilla (str.format sobre los campos y datos) o funcion(d, campos);
+# un dict por especie cuando la redaccion de cada una es distinta.
+_TEXTOS = {
+    "sin_voces": "Partes CF/CP no proporcionadas para el análisis de reglas.",
+    "sin_notas": "Una o ambas voces designadas no contienen notas musicales para analizar.",
+    "error_interno": {"primera": "Error técnico en análisis de reglas: {mensaje}",
+                      "segunda": "Error interno: {mensaje}"},
+    "voces_vacias": {"primera": "Voces vacías, no se puede verificar inicio/final.",
+                     "segunda": "Error: Partes vacías o inválidas."},
+    "error_inicio": "Error calculando intervalo de inicio: {mensaje}",
+    "error_final": "Error calculando intervalo final o movimiento a la final: {mensaje}",
+    "inicio_no_valido": {
+        "primera": "Intervalo de inicio no convencional: {intervalo_largo}. Se espera P1, P5, P8 (o M/m3 si CP arriba).",
+        "segunda": "Regla Inicio: Debe comenzar con consonancia perfecta (1, 5, 8). Encontrado: {intervalo}."},
+    "silencio_inicial_sin_nota": "Regla Inicio: Silencio inicial no seguido de nota.",
+    "silencio_inicial_no_blanca": "Regla Inicio: El silencio inicial debe ser de blanca.",
+    "inicio_desconocido": "Regla Inicio: Elemento inicial desconocido.",
+    "final_no_redonda": "Regla Final: La última nota del CP debe ser una redonda. Es {tipo_nota}.",
+    "final_no_valido": {
+        "primera": "Intervalo final no válido: {intervalo_largo}. Se espera P1 o P8.",
+        "segunda": "Regla Final: Debe terminar en Octava o Unísono. Encontrado: {intervalo}."},
+    "final_por_salto": {
+        "primera": "El Contrapunto no llega a la última nota por grado conjunto (movimiento de {intervalo}).",
+        "segunda": "Regla Final: Se debe llegar a la nota final por grado conjunto. Salto: {intervalo}."},
+    "disonancia": {
+        "primera": "Error de consonancia en tiempo {evento}. Intervalo: {intervalo_largo} ({nota_cp} vs {nota_cf}).",
+        "segunda": "Error en Compás {compas}: Disonancia ({intervalo}) en tiempo fuerte. Debe ser consonancia."},
+    "disonancia_debil": _disonancia_debil,
+    "nota_de_paso": "Compás {compas}: Nota de paso correcta.",
+    "unisono_fuerte": "Error en Compás {compas}: Unísono en tiempo fuerte. Solo permitido al inicio o final.",
+    "nota_repetida": {
+        "primera": "Nota repetida en {voz_nombre} (eventos {evento_anterior} y {evento}: {nota}).",
+        "segunda": "Compás {compas}: Nota repetida. En 2da especie debe haber movimiento constante."},
+    "cruce": {
+        "primera": "Cruce de voces en tiempo {evento}: {cp_nombre} ({nota_cp}) está por debajo del {cf_nombre} ({nota_cf}).",
+        "segunda": "Compás {compas}: Cruce de voces detectado ({intervalo_largo}). Evitar cruces."},
+    "paralelas": {
+        "primera": "Quintas u octavas paralelas entre tiempo {evento_anterior} y {evento}.",
+        "segunda": "Error: {intervalo} paralelas consecutivas en compás {compas}."},
+    "paralelas_fuertes": "Error Crítico: {intervalo} paralelas entre tiempos fuertes (Compases {compas}-{compas_fin}).",
+    "movimiento_directo": "Movimiento directo a consonancia perfecta ({intervalo}) hacia tiempo {evento}.",
+    "movimiento_melodico": _movimiento_melodico,
+    "movimiento_entre_voces": _movimiento_entre_voces,
+    "movimiento_no_disponible": "Entre voces: Herramienta de análisis de movimiento no disponible.",
+    "llegada_perfecta_por_salto": ("Patrón: En el tiempo {evento}, se llega a una consonancia perfecta ({intervalo}) "
+                                   "con un salto en el Contrapunto ({salto}). (Revisar regla de movimiento directo)."),
+    "sin_patrones": "No se identificaron patrones especiales adicionales para destacar en esta primera especie.",
+}
+
+
+def texto(d, especie=None):
+    """Mensaje en castellano del diagnostico (el de la consola, el informe y la API)."""
+    plantilla = _TEXTOS[d.codigo]
+    if isinstance(plantilla, dict):
+        plantilla = plantilla[especie]
+    campos = d._asdict()
+    if d.intervalo is None:
+        campos["intervalo"] = "?"
+    campos.update(d.datos or {})
+    if callable(plantilla):
+        return plantilla(d, campos)
+    return plantilla.format(**campos)
+
+
+def a_dict(d, especie=None):
+    """Forma JSON del diagnostico, con su mensaje."""
+    resultado = d._asdict()
+    resultado["notas"] = list(d.notas)
+    resultado["datos"] = dict(d.datos or {})
+    resultado["mensaje"] = texto(d, especie)
+    return resultado
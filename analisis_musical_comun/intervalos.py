@@ -0,0 +1,135 @@
+# analisis_musical_comun/intervalos.py - Clasificador de intervalos por tablas.
+#
+# Sustituye la construccion de music21.interval.Interval en las reglas y los
+# anotadores. Un intervalo queda determinado por la diferencia diatonica (grados)
+# y la diferencia en semitonos entre dos alturas; ambas se usan como indice de una
+# tabla precalculada de objetos Intervalo inmutables y compartidos.
+#
+# La semantica replica la de music21 (name, simpleName, niceName, isStep,
+# direction, isConsonant) para que los mensajes y las reglas no cambien.
+
+from music21 import interval as m21interval
+from music21.common.numberTools import musicOrdinals, ordinalAbbreviation
+
+# Semitonos del intervalo mayor/justo para cada generico simple (1..7).
+_SEMITONOS_REFERENCIA = (0, 2, 4, 5, 7, 9, 11)
+_GENERICOS_JUSTOS = (1, 4, 5)
+
+# Desviacion en semitonos respecto a la referencia -> especificador.
+_ESPECIFICADOR_JUSTO = {0: "P", 1: "A", -1: "d", 2: "AA", -2: "dd",
+                        3: "AAA", -3: "ddd", 4: "AAAA", -4: "dddd"}
+_ESPECIFICADOR_MAYOR = {0: "M", -1: "m", 1: "A", -2: "d", 2: "AA", -3: "dd",
+                        3: "AAA", -4: "ddd", 4: "AAAA", -5: "dddd"}
+_NOMBRE_LARGO_ESPECIFICADOR = {str(e): e.niceName for e in m21interval.Specifier}
+
+CONSONANCIAS = frozenset(("P5", "m3", "M3", "m6", "M6", "P1"))
+CONSONANCIAS_PERFECTAS = frozenset(("P1", "P5"))
+CONSONANCIAS_IMPERFECTAS = frozenset(("m3", "M3", "m6", "M6"))
+
+ASCENDENTE, OBLICUO, DESCENDENTE = 1, 0, -1
+
+
+class Intervalo:
+    """Intervalo clasificado (equivalente ligero de music21.interval.Interval)."""
+    __slots__ = ("nombre", "nombre_simple", "nombre_largo", "especificador",
+                 "generico", "semitonos", "direccion", "es_grado_conjunto",
+                 "es_consonante", "es_perfecta", "es_imperfecta")
+
+    def __init__(self, especificador, generico, semitonos, nombre_largo):
+        no_dirigido = abs(generico)
+        simple = (no_dirigido - 1) % 7 + 1
+        self.especificador = especificador
+        self.generico = generico                      # dirigido, como generic.value
+        self.semitonos = semitonos                    # dirigido
+        self.nombre = f"{especificador}{no_dirigido}"
+        self.nombre_simple = f"{especificador}{simple}"
+        self.nombre_largo = nombre_largo
+        # music21 toma la direccion del intervalo cromatico.
+        self.direccion = (semitonos > 0) - (semitonos < 0)
+        self.es_grado_conjunto = abs(semitonos) == 1 or no_dirigido == 2
+        self.es_consonante = self.nombre_simple in CONSONANCIAS
+        self.es_perfecta = self.nombre_simple in CONSONANCIAS_PERFECTAS
+        self.es_imperfecta = self.nombre_simple in CONSONANCIAS_IMPERFECTAS
+
+    def __repr__(self):
+        return f"<Intervalo {self.nombre}>"
+
+
+def _construir(diatonico, semitonos):
+    """Clasifica (diferencia diatonica, diferencia en semitonos). None si no es tabulable."""
+    if semitonos != int(semitonos):
+        return None  # microtonos: fuera de la tabla
+    semitonos = int(semitonos)
+    generico = diatonico + 1 if diatonico >= 0 else diatonico - 1
+    # El especificador se calcula sobre el intervalo ascendente equivalente;
+    # el unisono conserva el signo (C->C- es d1, no A1).
+    signo = -1 if diatonico < 0 else 1
+    grados = abs(diatonico)
+    octavas, simple_idx = divmod(grados, 7)
+    desviacion = signo * semitonos - (_SEMITONOS_REFERENCIA[simple_idx] + 12 * octavas)
+    tabla = _ESPECIFICADOR_JUSTO if (simple_idx + 1) in _GENERICOS_JUSTOS else _ESPECIFICADOR_MAYOR
+    especificador = tabla.get(desviacion)
+    if especificador is None:
+        return None
+    if grados + 1 < len(musicOrdinals):
+        ordinal = musicOrdinals[grados + 1]
+    else:
+        ordinal = f"{grados + 1}{ordinalAbbreviation(grados + 1)}"
+    nombre_largo = f"{_NOMBRE_LARGO_ESPECIFICADOR[especificador]} {ordinal}"
+    return Intervalo(especificador, generico, semitonos, nombre_largo)
+
+
+# Tabla precalculada: tres octavas en cada direccion, todas las calidades.
+_TABLA = {}
+for _d in range(-21, 22):
+    _octavas, _idx = divmod(abs(_d), 7)
+    _base = _SEMITONOS_REFERENCIA[_idx] + 12 * _octavas
+    for _desv in range(-5, 5):
+        _s = (_base + _desv) * (-1 if _d < 0 else 1)
+        _iv = _construir(_d, _s)
+        if _iv is not None:
+            _TABLA[(_d, _s)] = _iv
+del _d, _octavas, _idx, _base, _desv, _s, _iv
+
+
+def clasificar_alturas(diatonico_inicio, ps_inicio, diatonico_fin, ps_fin):
+    """Clasifica el intervalo entre dos alturas (numero diatonico, pitch space)."""
+    clave = (diatonico_fin - diatonico_inicio, ps_fin - ps_inicio)
+    iv = _TABLA.get(clave)
+    if iv is None:
+        iv = _construir(*clave)
+        if iv is None:
+            raise ValueError(f"Intervalo no tabulable: {clave}")
+        _TABLA[clave] = iv
+    return iv
+
+
+def clasificar(nota_inicio, nota_fin):
+    """Intervalo de nota_inicio a nota_fin (mismo sentido que Interval(noteStart, noteEnd)).
+
+    Las notas son voces.Nota (diatonico y ps ya extraidos); tambien admite notas de music21.
+    """
+    try:
+        return clasificar_alturas(nota_inicio.diatonico, nota_inicio.ps, nota_fin.diatonico, nota_fin.ps)
+    except AttributeError:
+        p1, p2 = nota_inicio.pitch, nota_fin.pitch
+        return clasificar_alturas(p1.diatonicNoteNum, p1.ps, p2.diatonicNoteNum, p2.ps)
+
+
+def tipo_movimiento(cf_ant, cf_curr, cp_ant, cp_curr):
+    """Tipo de movimiento entre voces, con los mismos criterios que
+    music21.voiceLeading.VoiceLeadingQuartet(cf_ant, cf_curr, cp_ant, cp_curr).motionType().
+
+    Devuelve 'oblique', 'parallel', 'similar', 'contrary' o 'noMotion'.
+    """
+    mel_cf = clasificar(cf_ant, cf_curr)
+    mel_cp = clasificar(cp_ant, cp_curr)
+    if mel_cf.nombre == "P1" and mel_cp.nombre == "P1":
+        return "noMotion"
+    if mel_cf.nombre == "P1" or mel_cp.nombre == "P1":
+        return "oblique"
+    if mel_cf.direccion == mel_cp.direccion:
+        if clasificar(cf_ant, cp_ant).generico == clasificar(cf_curr, cp_curr).generico:
+            return "parallel"
+        return "similar"
+    return "contrary"
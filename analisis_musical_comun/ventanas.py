@@ -0,0 +1,179 @@
+# analisis_musical_comun/ventanas.py - Registro declarativo de reglas y motor de una pasada.
+#
+# Las reglas de primera y segunda especie son locales. Cada una declara la forma
+# de las ventanas que lee sobre el flujo de eventos alineados (ctx["eventos"]:
+# EventoVertical con cp, cf, tiempo y compas; en primera especie una de las voces
+# puede faltar al final):
+#   VERTICAL       el evento i, con las dos voces
+#   PAR            el evento i y el anterior con las dos voces
+#   PAR_FUERTE     el evento i en tiempo fuerte y el anterior en tiempo fuerte
+#   TERNA          los eventos i-1, i, i+1 (centrada en i, con las dos voces)
+#   melodica(voz)  dos notas consecutivas de una voz (i-1, i)
+#   EXTREMOS       una vez por ejercicio: los dos primeros eventos y las dos
+#                  ultimas notas de cada voz
+# Una regla es Regla(nombre, formas, evaluar[, sin_hallazgos]):
+#   evaluar(ctx, i) -> Hallazgos (errores, observaciones, ids_rojos) o None; errores
+#                   y observaciones son diagnosticos.Diagnostico, y el motor les
+#                   pone regla=nombre
+#   sin_hallazgos   Diagnostico de observaciones si la regla no encuentra nada
+#
+# evaluar_reglas recorre los eventos una sola vez y en cada uno despacha las reglas
+# cuya forma aplica ahi; los hallazgos se guardan por regla y se concatenan en el
+# orden del registro (el de los antiguos bucles de cada especie). Mide cada regla
+# (subetapa "reglas.<nombre>" de metricas) y la lista de reglas se puede filtrar
+# por nombre (seleccionar_reglas).
+#
+# Re-evaluacion incremental: con un dict `memo` (el de la pasada anterior), cada
+# evento se compara por su firma (alturas, duraciones, compas, ids...) y solo se
+# evaluan las ventanas que leen algun evento cambiado; el resto reutiliza sus
+# hallazgos. Si cambia la clave global (numero de eventos, nombres de las voces,
+# reglas activas...) se evalua todo.
+
+import time
+from collections import namedtuple
+
+from metricas import sumar
+
+Hallazgos = namedtuple("Hallazgos", "errores observaciones ids_rojos", defaults=((), (), ()))
+SIN_HALLAZGOS = Hallazgos()
+
+# por_evento: se ancla en cada evento donde `aplica`; si no, una vez por ejercicio.
+Forma = namedtuple("Forma", "nombre por_evento aplica lee")
+Regla = namedtuple("Regla", "nombre formas evaluar sin_hallazgos", defaults=(None,))
+
+
+class Flujo:
+    """Vecinos de cada evento alineado, calculados una vez por pasada."""
+
+    def __init__(self, eventos):
+        self.eventos = eventos
+        n = len(eventos)
+        self.completo = [ev.cp is not None and ev.cf is not None for ev in eventos]
+        self.previo = [None] * n         # evento anterior con las dos voces
+        self.previo_fuerte = [None] * n  # idem, en tiempo fuerte
+        ultimo = ultimo_fuerte = None
+        for i, ev in enumerate(eventos):
+            self.previo[i], self.previo_fuerte[i] = ultimo, ultimo_fuerte
+            if self.completo[i]:
+                ultimo = i
+                if ev.tiempo == 1.0:
+                    ultimo_fuerte = i
+        self.extremos = {i for i in (0, 1) if i < n}
+        for voz in ("cp", "cf"):
+            presentes = [i for i, ev in enumerate(eventos) if getattr(ev, voz) is not None]
+            self.extremos.update(presentes[-2:])
+
+    def __len__(self):
+        return len(self.eventos)
+
+
+VERTICAL = Forma("vertical", True, lambda f, i: f.completo[i], lambda f, i: (i,))
+PAR = Forma("par", True, lambda f, i: f.completo[i] and f.previo[i] is not None,
+            lambda f, i: (f.previo[i], i))
+PAR_FUERTE = Forma("par_fuerte", True,
+                   lambda f, i: f.completo[i] and f.eventos[i].tiempo == 1.0 and f.previo_fuerte[i] is not None,
+                   lambda f, i: (f.previo_fuerte[i], i))
+TERNA = Forma("terna", True, lambda f, i: f.completo[i],
+              lambda f, i: tuple(j for j in (i - 1, i, i + 1) if 0 <= j < len(f)))
+EXTREMOS = Forma("extremos", False, None, lambda f, i: f.extremos)
+
+
+def melodica(voz):
+    """Dos notas consecutivas de la voz ("cp" o "cf"), ancladas en la segunda."""
+    def aplica(f, i):
+        return i > 0 and getattr(f.eventos[i], voz) is not None and getattr(f.eventos[i - 1], voz) is not None
+    return Forma(f"melodica_{voz}", True, aplica, lambda f, i: (i - 1, i))
+
+
+def seleccionar_reglas(reglas, sin_reglas=None):
+    """Reglas del registro menos las desactivadas por nombre; ValueError si alguna no existe."""
+    if not sin_reglas:
+        return list(reglas)
+    nombres = [r.nombre for r in reglas]
+    desconocidas = [n for n in sin_reglas if n not in nombres]
+    if desconocidas:
+        raise ValueError(f"Reglas no validas: {desconocidas}. Use {nombres}.")
+    return [r for r in reglas if r.nombre not in sin_reglas]
+
+
+def _lee(regla, flujo, i):
+    leidos = set()
+    for forma in regla.formas:
+        leidos.update(forma.lee(flujo, i))
+    return leidos
+
+
+def evaluar_reglas(reglas, ctx, firmas, clave_global=None, memo=None, tiempos=None):
+    """Hallazgos de todas las reglas sobre ctx (listas en el orden de las reglas).
+
+    ctx["eventos"]: el flujo de eventos alineados; ctx["flujo"] recibe sus vecinos.
+    firmas: una firma (hashable) por evento. Si se pasa `memo`, se reutilizan las
+    ventanas de la pasada anterior que no leen eventos cambiados, y memo se
+    actualiza para la siguiente; memo["evaluadas"] y memo["reutilizadas"] cuentan
+    las ventanas de esta pasada. `tiempos`: dict de metricas para "reglas.<nombre>".
+    """
+    flujo = ctx["flujo"] = Flujo(ctx["eventos"])
+    clave_global = (clave_global, tuple(r.nombre for r in reglas))
+    anteriores, cambiados = {}, None
+    if memo is not None and memo.get("clave") == clave_global and len(memo.get("firmas", ())) == len(firmas):
+        anteriores = memo["ventanas"]
+        cambiados = {i for i, (antes, ahora) in enumerate(zip(memo["firmas"], firmas)) if antes != ahora}
+
+    por_regla = {r.nombre: [] for r in reglas}
+    segundos = dict.fromkeys(por_regla, 0.0)
+    ventanas, evaluadas = {}, 0
+    inicio = time.perf_counter()
+
+    def despachar(regla, i):
+        nonlocal evaluadas
+        clave = (regla.nombre, i)
+        hallazgos = anteriores.get(clave)
+        if hallazgos is None or cambiados.intersection(_lee(regla, flujo, i)):
+            t = time.perf_counter()
+            hallazgos = _con_regla(regla.evaluar(ctx, i) or SIN_HALLAZGOS, regla.nombre)
+            segundos[regla.nombre] += time.perf_counter() - t
+            evaluadas += 1
+        ventanas[clave] = hallazgos
+        por_regla[regla.nombre].append(hallazgos)
+
+    por_evento = []
+    for regla in reglas:
+        if regla.formas[0].por_evento:
+            por_evento.append(regla)
+        else:
+            despachar(regla, 0)
+    for i in range(len(flujo)):
+        for regla in por_evento:
+            if any(forma.aplica(flujo, i) for forma in regla.formas):
+                despachar(regla, i)
+
+    errores, observaciones, ids_rojos = [], [], []
+    for regla in reglas:
+        antes = len(observaciones)
+        for hallazgos in por_regla[regla.nombre]:
+            errores.extend(hallazgos.errores)
+            observaciones.extend(hallazgos.observaciones)
+            ids_rojos.extend(hallazgos.ids_rojos)
+        if regla.sin_hallazgos and len(observaciones) == antes:
+            observaciones.append(regla.sin_hallazgos._replace(regla=regla.nombre))
+    for nombre, s in segundos.items():
+        sumar(tiempos, f"reglas.{nombre}", s, inicio)
+
+    if memo is not None:
+        memo.update(clave=clave_global, firmas=list(firmas), ventanas=ventanas,
+                    evaluadas=evaluadas, reutilizadas=len(ventanas) - evaluadas)
+    return Hallazgos(errores, observaciones, ids_rojos)
+
+
+def _con_regla(hallazgos, nombre):
+    if not hallazgos.errores and not hallazgos.observaciones:
+        return hallazgos
+    return hallazgos._replace(errores=[d._replace(regla=nombre) for d in hallazgos.errores],
+                              observaciones=[d._replace(regla=nombre) for d in hallazgos.observaciones])
+
+
+def firma_nota(nota):
+    """Lo que una regla puede leer de una nota (voces.Nota): id, altura escrita, duracion y compas."""
+    if nota is None:
+        return None
+    return (nota.id, nota.nombre, nota.duracion, nota.compas)
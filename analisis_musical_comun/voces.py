@@ -0,0 +1,128 @@
+# analisis_musical_comun/voces.py - Modelo compacto de las voces para el analisis.
+#
+# Las reglas y los anotadores solo leen de cada nota su altura, posicion y id.
+# Tras el parseo (y la asignacion de ids) cada voz se recorre una vez y se
+# convierte en una Voz de Notas con __slots__: los valores se leen como atributos
+# planos, sin las busquedas de contexto de music21 (beat y measureNumber buscan
+# el compas y la indicacion de compas en cada acceso), y el score se puede liberar
+# en cuanto se exporta el MusicXML para Verovio.
+
+from collections import namedtuple
+
+# Primeras figuras de la voz (segunda especie: silencio inicial de blanca).
+# clase: "nota", "silencio" u "otro" (acordes, notas sin altura...).
+Figura = namedtuple("Figura", "clase duracion")
+
+
+class Nota:
+    """Nota de una voz: altura, posicion e id (lo que leen reglas y anotadores)."""
+    __slots__ = ("id", "ps", "diatonico", "nombre", "offset", "duracion", "tipo",
+                 "tiempo", "compas")
+
+    def __init__(self, id, ps, diatonico, nombre, offset, duracion, tipo, tiempo, compas):
+        self.id = id                  # xml id (el de _asignar_ids_notas)
+        self.ps = ps                  # pitch space (semitonos, 60 = C4)
+        self.diatonico = diatonico    # numero diatonico (pitch.diatonicNoteNum)
+        self.nombre = nombre          # nameWithOctave
+        self.offset = offset          # offset absoluto en la parte (negras)
+        self.duracion = duracion      # quarterLength
+        self.tipo = tipo              # duration.type ("whole", "half"...)
+        self.tiempo = tiempo          # pulso en el compas (beat, 1.0 = tiempo fuerte)
+        self.compas = compas          # numero de compas
+
+    def __repr__(self):
+        return f"<Nota {self.nombre} c{self.compas} t{self.tiempo}>"
+
+
+class Voz:
+    """Notas de una parte en orden, su nombre y sus primeras figuras."""
+    __slots__ = ("id", "nombre", "notas", "inicio")
+
+    def __init__(self, id, nombre, notas, inicio):
+        self.id = id
+        self.nombre = nombre          # partName (o None)
+        self.notas = notas            # lista de Nota, por offset
+        self.inicio = inicio          # hasta dos Figura: las primeras notas/silencios
+
+    def __len__(self):
+        return len(self.notas)
+
+    def __repr__(self):
+        return f"<Voz {self.id} ({len(self.notas)} notas)>"
+
+
+def _clase(el):
+    from music21 import note
+    if isinstance(el, note.Note):
+        return "nota"
+    return "silencio" if isinstance(el, note.Rest) else "otro"
+
+
+def _nota(n, offset, tiempo, compas):
+    p = n.pitch
+    return Nota(n.id, p.ps, p.diatonicNoteNum, p.nameWithOctave, offset,
+                n.duration.quarterLength, n.duration.type, tiempo, compas)
+
+
+def _pulso(ts, ts_offset, offset_compas, cache):
+    """Como Music21Object.beat, con el offset de la nota en su compas ya conocido."""
+    clave = (offset_compas, ts_offset)
+    if clave not in cache:
+        compas = ts.barDuration.quarterLength
+        local = offset_compas
+        if local + ts_offset >= compas:
+            local = (local - ts_offset) % compas
+        cache[clave] = ts.getBeatProportion(local)
+    return cache[clave]
+
+
+def extraer_voz(part):
+    """Voz compacta de una parte de music21 (un recorrido por sus compases)."""
+    from music21 import common, meter, note, stream
+    notas, inicio = [], []
+
+    def figura(el):
+        if len(inicio) < 2:
+            inicio.append(Figura(_clase(el), el.duration.quarterLength))
+
+    compases = list(part.getElementsByClass(stream.Measure))
+    if not compases:
+        # Parte sin compases: music21 resuelve pulso y compas por contexto.
+        for el in part.flatten().notesAndRests:
+            figura(el)
+            if isinstance(el, note.Note):
+                notas.append(_nota(el, el.offset, el.beat, el.measureNumber))
+        return Voz(part.id, part.partName, notas, tuple(inicio))
+
+    ts, ts_offset, pulsos = None, 0.0, {}
+    for m in compases:
+        if ts is None:
+            ts = m.getContextByClass(meter.TimeSignature)  # compas heredado de fuera de la parte
+        # Un recorrido por compas: indicaciones de compas, voces y figuras en orden de offset.
+        figuras, con_voces = [], False
+        for el in m:
+            if isinstance(el, meter.TimeSignature):
+                ts, ts_offset, pulsos = el, m.elementOffset(el), {}
+            elif isinstance(el, stream.Voice):
+                con_voces = True
+            elif isinstance(el, note.GeneralNote):
+                figuras.append((el, m.elementOffset(el)))
+        if con_voces:
+            # Compases con voces: las figuras de todas, ordenadas por offset.
+            figuras = [(el, el.offset) for el in m.flatten().notesAndRests]
+        for el, local in figuras:
+            figura(el)
+            if not isinstance(el, note.Note):
+                continue
+            tiempo = _pulso(ts, ts_offset, local + m.paddingLeft, pulsos) if ts is not None else float("nan")
+            notas.append(_nota(el, common.opFrac(m.offset + local), tiempo, m.number))
+    notas.sort(key=lambda n: n.offset)  # estable: como part.flatten()
+    return Voz(part.id, part.partName, notas, tuple(inicio))
+
+
+def misma_altura(a, b):
+    """Misma altura escrita: nombre, alteracion y octava (y microtono).
+
+    A diferencia de pitch == pitch en music21, un becuadro de cortesia no la cambia.
+    """
+    return a.nombre == b.nombre and a.ps == b.ps
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# benchmarks/bench_arranque.py - Tiempo de arranque del CLI y de la API (procesos nuevos).
+#
+# Uso (desde la raiz del proyecto):
+#   python benchmarks/bench_arranque.py [-n 5] [-c 8]
+#
+# Cada caso lanza un interprete nuevo, asi que mide imports incluidos:
+#   --help             cli_runner.py --help
+#   error de args      cli_runner.py sin argumentos (argparse sale con 2)
+#   import main        importar la API (sin levantar uvicorn ni el pool)
+#   un archivo         cli_runner.py sobre un ejercicio sintetico de -c compases
+#                      (segunda especie, PDF vectorial, sin informe)
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from generador_ejercicios import generar_ejercicio
+
+
+def _medir(n, comando):
+    tiempos = []
+    for _ in range(n):
+        inicio = time.perf_counter()
+        subprocess.run(comando, cwd=RAIZ, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return tiempos
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de arranque del CLI y la API.")
+    parser.add_argument("-n", "--iteraciones", type=int, default=5)
+    parser.add_argument("-c", "--compases", type=int, default=8,
+                        help="Compases del ejercicio del caso 'un archivo' (por defecto: 8).")
+    args = parser.parse_args(argv)
+
+    cli = [sys.executable, os.path.join(RAIZ, "cli_runner.py")]
+    with tempfile.TemporaryDirectory(prefix="bench_arranque_") as tmp:
+        entrada = os.path.join(tmp, "ejercicio.musicxml")
+        with open(entrada, "w", encoding="utf-8") as f:
+            f.write(generar_ejercicio("segunda", args.compases))
+        casos = [
+            ("--help", cli + ["--help"]),
+            ("error de args", cli),
+            ("import main", [sys.executable, "-c", "import main"]),
+            ("un archivo", cli + [entrada, "-o", os.path.join(tmp, "salida.pdf"),
+                                  "--no-report", "--pdf-mode", "vectorial"]),
+        ]
+        print(f"Arranque en proceso nuevo ({args.iteraciones} iteraciones)")
+        print(f"{'caso':<16}{'mediana ms':>12}{'min ms':>10}{'max ms':>10}")
+        for nombre, comando in casos:
+            tiempos = _medir(args.iteraciones, comando)
+            print(f"{nombre:<16}{statistics.median(tiempos):>12.0f}{min(tiempos):>10.0f}"
+                  f"{max(tiempos):>10.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# benchmarks/bench_cache_partituras.py - converter.parse vs. cache de partituras (freeze/thaw).
+#
+# Uso (desde la raiz del proyecto):
+#   python benchmarks/bench_cache_partituras.py [-e primera segunda] [-c 8 32 128 500] [-n 5]
+#                                               [--corpus DIR]
+#
+# Para cada ejercicio (sinteticos de generador_ejercicios o los MusicXML de --corpus)
+# mide, con la mediana de -n iteraciones y una cache vacia en un directorio temporal:
+#   parseo - converter.parse de los bytes (sin cache);
+#   fallo  - primera consulta: parseo + congelar + escribir + descongelar;
+#   acierto - consultas siguientes: leer + descongelar;
+# y el tamano en disco de la entrada.
+
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cli_runner
+from cache_partituras import CachePartituras
+from generador_ejercicios import COMPASES_MAX, COMPASES_MIN, generar_ejercicio
+
+
+def _ms(funcion):
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        funcion()
+    return (time.perf_counter() - inicio) * 1000
+
+
+def medir(datos, n, raiz):
+    parsear = lambda: cli_runner._parsear_music21(datos)  # noqa: E731
+    _ms(parsear)  # calentamiento: modulos y caches de music21 fuera de la medida
+    parseo, fallo, acierto = [], [], []
+    for _ in range(n):
+        cache = CachePartituras(raiz)
+        cache.vaciar()
+        parseo.append(_ms(parsear))
+        fallo.append(_ms(lambda: cache.obtener(datos, parsear)))
+        acierto.append(_ms(lambda: cache.obtener(datos, parsear)))
+    kb = os.path.getsize(cache.ruta(datos)) / 1024
+    cache.vaciar()
+    return statistics.median(parseo), statistics.median(fallo), statistics.median(acierto), kb
+
+
+def _casos(args):
+    if args.corpus:
+        for nombre in sorted(os.listdir(args.corpus)):
+            if nombre.lower().endswith(cli_runner.EXTENSIONES_MUSICXML):
+                with open(os.path.join(args.corpus, nombre), "rb") as f:
+                    yield nombre, f.read()
+        return
+    for especie in args.species:
+        for compases in args.compases:
+            yield f"{especie}/{compases}", generar_ejercicio(especie, compases).encode("utf-8")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de la cache de partituras (freeze/thaw).")
+    parser.add_argument("-e", "--species", nargs="+", choices=["primera", "segunda"],
+                        default=["primera", "segunda"])
+    parser.add_argument("-c", "--compases", nargs="+", type=int, default=[8, 32, 128, 500],
+                        help=f"Longitudes a medir ({COMPASES_MIN}-{COMPASES_MAX} compases).")
+    parser.add_argument("-n", "--iteraciones", type=int, default=5)
+    parser.add_argument("--corpus", default=None,
+                        help="Directorio de MusicXML a medir en lugar de los ejercicios sinteticos.")
+    args = parser.parse_args(argv)
+
+    fuera = [c for c in args.compases if not COMPASES_MIN <= c <= COMPASES_MAX]
+    if fuera:
+        parser.error(f"compases fuera de rango ({COMPASES_MIN}-{COMPASES_MAX}): {fuera}")
+    if args.corpus and not os.path.isdir(args.corpus):
+        parser.error(f"--corpus no es un directorio: {args.corpus}")
+
+    print(f"{'caso':<32}{'parseo ms':>11}{'fallo ms':>10}{'acierto ms':>12}{'x':>6}{'KB':>8}")
+    with tempfile.TemporaryDirectory(prefix="bench_partituras_") as raiz:
+        for caso, datos in _casos(args):
+            parseo, fallo, acierto, kb = medir(datos, args.iteraciones, raiz)
+            print(f"{caso:<32}{parseo:>11.1f}{fallo:>10.1f}{acierto:>12.1f}"
+                  f"{parseo / acierto:>6.1f}{kb:>8.0f}")
+    print("x: parseo / acierto. ms: mediana de -n iteraciones con la cache vacia al empezar cada una.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# benchmarks/bench_etapas.py - Tiempo por etapa del pipeline y comparacion con una linea base.
+#
+# Uso (desde la raiz del proyecto):
+#   python benchmarks/bench_etapas.py [-e primera segunda] [-c 8 32 128] [-n 3]
+#                                     [--pdf-mode raster|vectorial]
+#                                     [--baseline benchmarks/baseline_etapas.json]
+#                                     [--guardar] [--tolerancia 0.25] [--umbral-ms 5]
+#                                     [--por-regla]
+#
+# Genera ejercicios sinteticos (generador_ejercicios) de cada especie y longitud
+# (8 a 500 compases), los procesa en memoria con procesar_primera/procesar_segunda
+# y mide cada etapa (metricas.ETAPAS) con la mediana de -n iteraciones, tras una
+# pasada de calentamiento. Con --guardar escribe la linea base; si no, compara con
+# ella y sale con codigo 1 si alguna etapa es mas lenta que base * (1 + tolerancia)
+# y ademas supera la base en mas de --umbral-ms (ruido en etapas muy cortas).
+# La linea base depende de la maquina: regenerarla al cambiar de equipo.
+# --por-regla desglosa ademas la etapa de reglas regla a regla (subetapas reglas.*).
+
+import argparse
+import contextlib
+import datetime
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cli_runner
+from generador_ejercicios import COMPASES_MAX, COMPASES_MIN, generar_ejercicio
+from metricas import ETAPAS
+
+BASELINE_DEFECTO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline_etapas.json")
+
+
+def _ejecutar(especie, datos, modo_pdf):
+    """Una pasada completa en memoria; devuelve los segundos por etapa."""
+    # Sin basura de la pasada anterior: una coleccion completa a mitad de una
+    # etapa corta (p. ej. anotacion) la haria parecer una regresion.
+    gc.collect()
+    detalle = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        if especie == "primera":
+            ruta = cli_runner.procesar_primera(datos, io.BytesIO(), detalle=detalle,
+                                               modo_pdf=modo_pdf, informe=io.BytesIO())
+        else:
+            ruta = cli_runner.procesar_segunda(datos, io.BytesIO(), detalle=detalle,
+                                               modo_pdf=modo_pdf, informe=io.BytesIO())
+    if ruta is None:
+        raise RuntimeError(f"{especie}: no se genero el PDF anotado")
+    return detalle["tiempos"]
+
+
+def medir(especie, compases, n, modo_pdf):
+    """Mediana en ms de cada etapa (y del total) sobre n iteraciones."""
+    datos = generar_ejercicio(especie, compases).encode("utf-8")
+    _ejecutar(especie, datos, modo_pdf)  # calentamiento: imports, toolkit de Verovio
+    muestras = [_ejecutar(especie, datos, modo_pdf) for _ in range(n)]
+    resultado = {e: round(statistics.median(m.get(e, 0.0) for m in muestras) * 1000, 2)
+                 for e in ETAPAS}
+    # Solo las etapas: las subetapas ("anotacion.<capa>") ya cuentan dentro de la suya.
+    resultado["total"] = round(statistics.median(sum(m.get(e, 0.0) for e in ETAPAS)
+                                                 for m in muestras) * 1000, 2)
+    for regla in (k for k in muestras[0] if k.startswith("reglas.")):
+        resultado[regla] = round(statistics.median(m.get(regla, 0.0) for m in muestras) * 1000, 2)
+    return resultado
+
+
+def _imprimir_tabla(resultados):
+    columnas = ETAPAS + ["total"]
+    print(f"{'caso':<15}" + "".join(f"{c:>11}" for c in columnas) + "   (ms, mediana)")
+    for caso, tiempos in resultados.items():
+        print(f"{caso:<15}" + "".join(f"{tiempos[c]:>11.1f}" for c in columnas))
+
+
+def _imprimir_reglas(resultados):
+    for caso, tiempos in resultados.items():
+        reglas = {k.split(".", 1)[1]: v for k, v in tiempos.items() if k.startswith("reglas.")}
+        print(f"\n{caso} - reglas (ms, mediana):")
+        for regla, ms in sorted(reglas.items(), key=lambda par: -par[1]):
+            print(f"  {regla:<22}{ms:>10.2f}")
+
+
+def comparar(resultados, baseline, tolerancia, umbral_ms):
+    """Lineas del informe y numero de regresiones frente a la linea base."""
+    lineas, regresiones = [], 0
+    base_resultados = baseline.get("resultados", {})
+    for caso, tiempos in resultados.items():
+        base = base_resultados.get(caso)
+        if base is None:
+            lineas.append(f"  {caso}: sin linea base")
+            continue
+        for etapa in ETAPAS + ["total"]:
+            antes, ahora = base.get(etapa), tiempos[etapa]
+            if not antes:
+                continue
+            cambio = (ahora - antes) / antes
+            if ahora > antes * (1 + tolerancia) and ahora - antes > umbral_ms:
+                regresiones += 1
+                marca = "REGRESION"
+            elif ahora < antes * (1 - tolerancia) and antes - ahora > umbral_ms:
+                marca = "mejora"
+            else:
+                continue
+            lineas.append(f"  {marca:<10}{caso:<15}{etapa:<10}{antes:>10.1f} ms -> {ahora:>10.1f} ms "
+                          f"({cambio:+.0%})")
+    return lineas, regresiones
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark por etapa del pipeline con linea base.")
+    parser.add_argument("-e", "--species", nargs="+", choices=["primera", "segunda"],
+                        default=["primera", "segunda"])
+    parser.add_argument("-c", "--compases", nargs="+", type=int, default=[8, 32, 128],
+                        help=f"Longitudes a medir ({COMPASES_MIN}-{COMPASES_MAX} compases).")
+    parser.add_argument("-n", "--iteraciones", type=int, default=3)
+    parser.add_argument("--pdf-mode", choices=["raster", "vectorial"], default="raster")
+    parser.add_argument("--baseline", default=BASELINE_DEFECTO,
+                        help="Archivo JSON de la linea base (por defecto: benchmarks/baseline_etapas.json).")
+    parser.add_argument("--guardar", action="store_true",
+                        help="Guardar los resultados como nueva linea base en lugar de comparar.")
+    parser.add_argument("--tolerancia", type=float, default=0.25,
+                        help="Aumento relativo tolerado por etapa (por defecto: 0.25).")
+    parser.add_argument("--umbral-ms", type=float, default=5.0,
+                        help="Diferencia absoluta minima para contar como regresion (por defecto: 5).")
+    parser.add_argument("--por-regla", action="store_true",
+                        help="Desglosar la etapa de reglas regla a regla.")
+    args = parser.parse_args(argv)
+
+    fuera = [c for c in args.compases if not COMPASES_MIN <= c <= COMPASES_MAX]
+    if fuera:
+        parser.error(f"compases fuera de rango ({COMPASES_MIN}-{COMPASES_MAX}): {fuera}")
+
+    resultados = {}
+    for especie in args.species:
+        for compases in args.compases:
+            caso = f"{especie}/{compases}"
+            print(f"Midiendo {caso} ({args.pdf_mode}, {args.iteraciones} iteraciones)...", file=sys.stderr)
+            resultados[caso] = medir(especie, compases, args.iteraciones, args.pdf_mode)
+    _imprimir_tabla(resultados)
+    if args.por_regla:
+        _imprimir_reglas(resultados)
+
+    if args.guardar:
+        baseline = {
+            "meta": {"fecha": datetime.date.today().isoformat(), "python": platform.python_version(),
+                     "maquina": platform.machine(), "pdf_mode": args.pdf_mode,
+                     "iteraciones": args.iteraciones},
+            "resultados": resultados,
+        }
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"Linea base guardada en {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"Sin linea base en {args.baseline}: ejecute con --guardar para crearla.")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("meta", {}).get("pdf_mode", args.pdf_mode) != args.pdf_mode:
+        print(f"Aviso: la linea base se midio con --pdf-mode {baseline['meta']['pdf_mode']}.")
+    lineas, regresiones = comparar(resultados, baseline, args.tolerancia, args.umbral_ms)
+    print(f"\nComparacion con {args.baseline} (tolerancia {args.tolerancia:.0%}, "
+          f"umbral {args.umbral_ms:g} ms):")
+    print("\n".join(lineas) if lineas else "  sin cambios significativos")
+    print(f"{regresiones} regresiones.")
+    return 1 if regresiones else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
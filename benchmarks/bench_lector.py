@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# benchmarks/bench_lector.py - Lectura del MusicXML: converter.parse de music21 vs. lector rapido.
+#
+# Uso (desde la raiz del proyecto):
+#   python benchmarks/bench_lector.py [-e primera segunda] [-c 8 32 128 500] [-n 5]
+#                                     [--corpus DIR]
+#
+# Mide, con la mediana de -n iteraciones, lo que cuesta pasar de los bytes del
+# MusicXML a lo que necesita el resto del pipeline (voces con ids y MusicXML para
+# Verovio):
+#   music21 - converter.parse + ids de nota + voces compactas + exportacion a MusicXML
+#             (etapas parseo, ids y musicxml del camino de music21);
+#   rapido  - lector_musicxml.leer_musicxml + Partitura.musicxml.
+# Por defecto usa ejercicios sinteticos (generador_ejercicios); con --corpus, todos
+# los MusicXML de un directorio. Los archivos que el lector rapido no admite se
+# cuentan aparte con el motivo (en el pipeline irian por converter.parse).
+
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cli_runner
+from analisis_musical_comun.voces import extraer_voz
+from generador_ejercicios import COMPASES_MAX, COMPASES_MIN, generar_ejercicio
+from lector_musicxml import LecturaNoSoportada, leer_musicxml
+
+
+def _music21(datos):
+    with contextlib.redirect_stdout(io.StringIO()):
+        score = cli_runner._parsear_music21(datos)
+    parts = cli_runner._normalizar_part_ids(score)
+    for p in parts:
+        cli_runner._asignar_ids_notas(p)
+    voces = [extraer_voz(p) for p in parts]
+    return voces, cli_runner._exportar_musicxml(score)
+
+
+def _rapido(datos):
+    partitura = leer_musicxml(datos)
+    return partitura.voces, partitura.musicxml()
+
+
+def _cronometrar(funcion, datos, n):
+    funcion(datos)  # calentamiento: modulos y caches fuera de la medida
+    muestras = []
+    for _ in range(n):
+        inicio = time.perf_counter()
+        funcion(datos)
+        muestras.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(muestras)
+
+
+def medir(datos, n):
+    """(notas, ms music21, ms lector rapido); LecturaNoSoportada si el lector no lo admite."""
+    voces, _ = _rapido(datos)
+    notas = sum(len(v) for v in voces)
+    return notas, _cronometrar(_music21, datos, n), _cronometrar(_rapido, datos, n)
+
+
+def _casos(args):
+    if args.corpus:
+        for nombre in sorted(os.listdir(args.corpus)):
+            if nombre.lower().endswith(cli_runner.EXTENSIONES_MUSICXML):
+                with open(os.path.join(args.corpus, nombre), "rb") as f:
+                    yield nombre, f.read()
+        return
+    for especie in args.species:
+        for compases in args.compases:
+            yield f"{especie}/{compases}", generar_ejercicio(especie, compases).encode("utf-8")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de lectura: music21 vs. lector rapido de MusicXML.")
+    parser.add_argument("-e", "--species", nargs="+", choices=["primera", "segunda"],
+                        default=["primera", "segunda"])
+    parser.add_argument("-c", "--compases", nargs="+", type=int, default=[8, 32, 128, 500],
+                        help=f"Longitudes a medir ({COMPASES_MIN}-{COMPASES_MAX} compases).")
+    parser.add_argument("-n", "--iteraciones", type=int, default=5)
+    parser.add_argument("--corpus", default=None,
+                        help="Directorio de MusicXML a medir en lugar de los ejercicios sinteticos.")
+    args = parser.parse_args(argv)
+
+    fuera = [c for c in args.compases if not COMPASES_MIN <= c <= COMPASES_MAX]
+    if fuera:
+        parser.error(f"compases fuera de rango ({COMPASES_MIN}-{COMPASES_MAX}): {fuera}")
+    if args.corpus and not os.path.isdir(args.corpus):
+        parser.error(f"--corpus no es un directorio: {args.corpus}")
+
+    print(f"{'caso':<32}{'notas':>7}{'music21 ms':>12}{'rapido ms':>11}{'x':>7}")
+    total_m21 = total_rapido = 0.0
+    no_soportados = []
+    for caso, datos in _casos(args):
+        try:
+            notas, ms_m21, ms_rapido = medir(datos, args.iteraciones)
+        except LecturaNoSoportada as e:
+            no_soportados.append((caso, str(e)))
+            continue
+        total_m21 += ms_m21
+        total_rapido += ms_rapido
+        print(f"{caso:<32}{notas:>7}{ms_m21:>12.2f}{ms_rapido:>11.2f}{ms_m21 / ms_rapido:>7.1f}")
+    if total_rapido:
+        print(f"{'total':<32}{'':>7}{total_m21:>12.2f}{total_rapido:>11.2f}{total_m21 / total_rapido:>7.1f}")
+    print("ms: mediana por archivo de bytes -> voces con ids + MusicXML para Verovio.")
+    if no_soportados:
+        print(f"\n{len(no_soportados)} archivo(s) van por converter.parse (lector rapido no aplicable):")
+        for caso, motivo in no_soportados:
+            print(f"  {caso}: {motivo}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# benchmarks/bench_lote_zip.py - POST /analyze/batch: tiempo y memoria de la API segun el tamano del ZIP.
+#
+# Uso (desde la raiz del proyecto):
+#   python benchmarks/bench_lote_zip.py [-a 10 50 200] [-c 8] [-w 2] [--puerto 8799]
+#
+# Levanta la API con uvicorn en un proceso nuevo (CONTRAPUNTO_WORKERS=-w) y, por
+# cada tamano de -a, sube un ZIP de ese numero de ejercicios sinteticos de segunda
+# especie (-c compases) y lee la respuesta en streaming. Mide:
+#   1er PDF - segundos hasta recibir la primera entrada del ZIP de resultados;
+#   total   - segundos hasta el final del ZIP;
+#   RSS max - memoria residente maxima del proceso de la API (sin los workers)
+#             muestreada mientras dura la peticion: no deberia crecer con -a.
+
+import argparse
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import httpx
+
+from generador_ejercicios import COMPASES_MAX, COMPASES_MIN, generar_ejercicio
+
+
+def _rss_kb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for linea in f:
+            if linea.startswith("VmRSS:"):
+                return int(linea.split()[1])
+    return 0
+
+
+def _zip(archivos, compases):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        for i in range(archivos):
+            zf.writestr(f"clase/alumno_{i:04d}.musicxml", generar_ejercicio("segunda", compases))
+    return buffer.getvalue()
+
+
+def medir(url, pid, datos):
+    """(segundos hasta el primer bloque, segundos totales, bytes recibidos, RSS maximo en KB)."""
+    maximo, fin = [_rss_kb(pid)], threading.Event()
+
+    def muestrear():
+        while not fin.wait(0.2):
+            maximo[0] = max(maximo[0], _rss_kb(pid))
+
+    hilo = threading.Thread(target=muestrear, daemon=True)
+    hilo.start()
+    primero, recibidos = None, 0
+    inicio = time.perf_counter()
+    try:
+        with httpx.stream("POST", f"{url}/analyze/batch", files={"file": ("clase.zip", datos)},
+                          data={"especie": "segunda"}, timeout=None) as r:
+            r.raise_for_status()
+            for bloque in r.iter_raw():
+                if primero is None:
+                    primero = time.perf_counter() - inicio
+                recibidos += len(bloque)
+    finally:
+        fin.set()
+        hilo.join()
+    return primero, time.perf_counter() - inicio, recibidos, maximo[0]
+
+
+def _esperar(url, proceso, limite_s=60):
+    inicio = time.perf_counter()
+    while time.perf_counter() - inicio < limite_s:
+        if proceso.poll() is not None:
+            raise RuntimeError("uvicorn termino antes de arrancar")
+        try:
+            httpx.get(f"{url}/", timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.5)
+    raise RuntimeError("uvicorn no respondio a tiempo")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de POST /analyze/batch (tiempo y memoria).")
+    parser.add_argument("-a", "--archivos", nargs="+", type=int, default=[10, 50, 200],
+                        help="Numero de ejercicios de cada ZIP.")
+    parser.add_argument("-c", "--compases", type=int, default=8,
+                        help=f"Compases de cada ejercicio ({COMPASES_MIN}-{COMPASES_MAX}).")
+    parser.add_argument("-w", "--workers", type=int, default=2)
+    parser.add_argument("--puerto", type=int, default=8799)
+    args = parser.parse_args(argv)
+    if not COMPASES_MIN <= args.compases <= COMPASES_MAX:
+        parser.error(f"compases fuera de rango ({COMPASES_MIN}-{COMPASES_MAX}): {args.compases}")
+
+    url = f"http://127.0.0.1:{args.puerto}"
+    with tempfile.TemporaryDirectory(prefix="bench_lote_") as artefactos:
+        entorno = dict(os.environ, CONTRAPUNTO_WORKERS=str(args.workers),
+                       CONTRAPUNTO_ARTEFACTOS_DIR=artefactos)
+        proceso = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.puerto), "--log-level", "warning"],
+            cwd=RAIZ, env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            _esperar(url, proceso)
+            print(f"{'archivos':>9}{'ZIP KB':>9}{'salida KB':>11}{'1er PDF s':>11}{'total s':>9}"
+                  f"{'s/archivo':>11}{'RSS max MB':>12}")
+            for archivos in args.archivos:
+                datos = _zip(archivos, args.compases)
+                primero, total, recibidos, rss = medir(url, proceso.pid, datos)
+                print(f"{archivos:>9}{len(datos) / 1024:>9.0f}{recibidos / 1024:>11.0f}{primero:>11.2f}"
+                      f"{total:>9.2f}{total / archivos:>11.3f}{rss / 1024:>12.1f}")
+        finally:
+            proceso.terminate()
+            proceso.wait()
+    print(f"RSS: proceso de la API (uvicorn), sin los {args.workers} workers del pool.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# benchmarks/bench_memoria.py - Memoria y coste de acceso: score de music21 vs. voces compactas.
+#
+# Uso (desde la raiz del proyecto):
+#   python benchmarks/bench_memoria.py [-e primera segunda] [-c 8 32 128 500] [-n 5]
+#
+# Para cada ejercicio sintetico mide con tracemalloc:
+#   score  - memoria retenida por el score parseado (con ids), lo que antes seguia
+#            vivo durante reglas, SVG, anotacion y PDF;
+#   voces  - memoria retenida por las dos voces compactas (voces.extraer_voz) una vez
+#            liberado el score, lo que sigue vivo ahora tras exportar el MusicXML;
+#   extraer - tiempo de construir las voces (etapa "ids").
+# y el tiempo de leer lo que leen las reglas de cada nota (altura, nombre, duracion,
+# pulso y compas) en las notas de music21 y en las Nota (mediana de -n pasadas).
+
+import argparse
+import contextlib
+import gc
+import io
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cli_runner
+from analisis_musical_comun.voces import extraer_voz
+from generador_ejercicios import COMPASES_MAX, COMPASES_MIN, generar_ejercicio
+
+
+def _parsear(datos):
+    with contextlib.redirect_stdout(io.StringIO()):
+        score = cli_runner._parsear_music21(datos)
+    parts = cli_runner._normalizar_part_ids(score)
+    for p in parts:
+        cli_runner._asignar_ids_notas(p)
+    return score, parts
+
+
+def _retenido(base):
+    gc.collect()
+    return (tracemalloc.get_traced_memory()[0] - base) / 1024
+
+
+def _leer_music21(notas):
+    for n in notas:
+        n.pitch.ps, n.pitch.diatonicNoteNum, n.nameWithOctave
+        n.duration.quarterLength, n.beat, n.measureNumber
+
+
+def _leer_voces(notas):
+    for n in notas:
+        n.ps, n.diatonico, n.nombre
+        n.duracion, n.tiempo, n.compas
+
+
+def _cronometrar(funcion, notas, n):
+    muestras = []
+    for _ in range(n):
+        inicio = time.perf_counter()
+        funcion(notas)
+        muestras.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(muestras)
+
+
+def medir(especie, compases, n):
+    datos = generar_ejercicio(especie, compases).encode("utf-8")
+    from music21 import note
+    _parsear(datos)  # calentamiento: modulos y caches de music21 fuera de la medida
+
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    score, parts = _parsear(datos)
+    kb_score = _retenido(base)
+    inicio = time.perf_counter()
+    voces = [extraer_voz(p) for p in parts]
+    ms_extraer = (time.perf_counter() - inicio) * 1000
+    notas_m21 = [el for p in parts for el in p.flatten().notes if isinstance(el, note.Note)]
+    notas = [nota for voz in voces for nota in voz.notas]
+    acceso_m21 = _cronometrar(_leer_music21, notas_m21, n)
+    acceso_voces = _cronometrar(_leer_voces, notas, n)
+    del score, parts, notas_m21
+    kb_voces = _retenido(base)
+    tracemalloc.stop()
+    return {
+        "notas": len(notas),
+        "kb_score": kb_score,
+        "kb_voces": kb_voces,
+        "ms_extraer": ms_extraer,
+        "acceso_m21": acceso_m21,
+        "acceso_voces": acceso_voces,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de memoria: score de music21 vs. voces compactas.")
+    parser.add_argument("-e", "--species", nargs="+", choices=["primera", "segunda"],
+                        default=["primera", "segunda"])
+    parser.add_argument("-c", "--compases", nargs="+", type=int, default=[8, 32, 128, 500],
+                        help=f"Longitudes a medir ({COMPASES_MIN}-{COMPASES_MAX} compases).")
+    parser.add_argument("-n", "--iteraciones", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    fuera = [c for c in args.compases if not COMPASES_MIN <= c <= COMPASES_MAX]
+    if fuera:
+        parser.error(f"compases fuera de rango ({COMPASES_MIN}-{COMPASES_MAX}): {fuera}")
+
+    print(f"{'caso':<15}{'notas':>7}{'score KB':>11}{'voces KB':>11}{'extraer ms':>12}"
+          f"{'acceso m21':>12}{'acceso voces':>14}")
+    for especie in args.species:
+        for compases in args.compases:
+            r = medir(especie, compases, args.iteraciones)
+            print(f"{especie + '/' + str(compases):<15}{r['notas']:>7}{r['kb_score']:>11.0f}"
+                  f"{r['kb_voces']:>11.0f}{r['ms_extraer']:>12.2f}{r['acceso_m21']:>12.2f}"
+                  f"{r['acceso_voces']:>14.3f}")
+    print("KB retenidos tras gc (tracemalloc); acceso: ms por pasada sobre todas las notas, mediana.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# benchmarks/bench_pdf_vectorial.py - Partitura anotada en PDF: raster (resvg) vs vectorial.
+#
+# Uso (desde la raiz del proyecto):
+#   python benchmarks/bench_pdf_vectorial.py [archivo.musicxml] [-n 10] [-e primera|segunda] [-c 32]
+#                                            [-w 4]
+#
+# Sin archivo se genera un ejercicio sintetico (generador_ejercicios) de -c compases.
+# Se generan una vez las paginas SVG anotadas y se mide solo la conversion SVG -> PDF.
+# -w: procesos del rasterizado por paginas (el modo vectorial es secuencial).
+
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cli_runner
+import verovio_pdf
+from generador_ejercicios import generar_ejercicio
+
+
+def _svg_anotado(entrada, especie):
+    """Ejecuta el pipeline una vez y captura las paginas SVG anotadas que irian al PDF."""
+    capturado = {}
+
+    def capturar(paginas, destino, workers=1):
+        capturado["svg"] = list(paginas)
+        return False
+
+    verovio_pdf.MODOS_PDF["_captura"] = capturar
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            if especie == "primera":
+                cli_runner.procesar_primera(entrada, os.devnull, generar_reporte=False, modo_pdf="_captura")
+            else:
+                cli_runner.procesar_segunda(entrada, os.devnull, generar_reporte=False, modo_pdf="_captura")
+    finally:
+        del verovio_pdf.MODOS_PDF["_captura"]
+    return capturado["svg"]
+
+
+def _medir(n, svg, conversor, workers):
+    tiempos, tamano = [], 0
+    for _ in range(n):
+        inicio = time.perf_counter()
+        destino = io.BytesIO()
+        with contextlib.redirect_stdout(io.StringIO()):
+            ok = conversor(svg, destino, workers=workers)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        if not ok:
+            raise RuntimeError(f"{conversor.__name__} no genero el PDF")
+        tamano = len(destino.getvalue())
+    return tiempos, tamano
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de la salida PDF raster vs vectorial.")
+    parser.add_argument("input", nargs="?", help="MusicXML a analizar (por defecto: sintetico).")
+    parser.add_argument("-n", "--iteraciones", type=int, default=10)
+    parser.add_argument("-e", "--species", choices=["primera", "segunda"], default="segunda")
+    parser.add_argument("-c", "--compases", type=int, default=32,
+                        help="Compases del ejercicio sintetico (por defecto: 32).")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="Procesos para rasterizar las paginas (por defecto: 1).")
+    args = parser.parse_args(argv)
+
+    entrada = args.input or generar_ejercicio(args.species, args.compases).encode("utf-8")
+    paginas = _svg_anotado(entrada, args.species)
+
+    print(f"SVG anotado -> PDF ({args.species}, {len(paginas)} paginas, "
+          f"{sum(map(len, paginas)) / 1024:.0f} KiB de SVG, {args.workers} workers, "
+          f"{args.iteraciones} iteraciones)")
+    print(f"{'modo':<11}{'mediana ms':>12}{'min ms':>10}{'max ms':>10}{'PDF KiB':>10}")
+    resultados = {}
+    for modo, conversor in verovio_pdf.MODOS_PDF.items():
+        tiempos, tamano = _medir(args.iteraciones, paginas, conversor, args.workers)
+        resultados[modo] = (statistics.median(tiempos), tamano)
+        print(f"{modo:<11}{statistics.median(tiempos):>12.1f}{min(tiempos):>10.1f}"
+              f"{max(tiempos):>10.1f}{tamano / 1024:>10.1f}")
+    (t_r, s_r), (t_v, s_v) = resultados["raster"], resultados["vectorial"]
+    print(f"Vectorial: {t_r / t_v:.1f}x mas rapido, {s_r / s_v:.1f}x mas pequeno")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# benchmarks/bench_sesiones.py - Re-analisis incremental de una sesion de correccion.
+#
+# Uso (desde la raiz del proyecto):
+#   python benchmarks/bench_sesiones.py [-e primera segunda] [-c 8 32 128] [-n 3]
+#                                       [--pdf-mode raster|vectorial]
+#
+# Para cada ejercicio sintetico mide, con la mediana de -n iteraciones:
+#   completo - primera version de una sesion nueva (parseo, todas las reglas, PDFs);
+#   parche   - cambiar una nota del contrapunto en el compas central (PATCH);
+#   identico - reenviar el mismo MusicXML (PUT sin cambios: ni analisis ni render).
+# y cuenta las ventanas de reglas evaluadas y reutilizadas por el parche.
+
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generador_ejercicios import COMPASES_MAX, COMPASES_MIN, generar_ejercicio
+from sesiones import SesionAnalisis
+
+
+def _parche_central(sesion):
+    """Sube un semitono la primera nota del contrapunto en el compas central."""
+    cp = sesion.voces()["cp"]
+    compases = cp.getElementsByClass("Measure")
+    medida = compases[len(compases) // 2]
+    figuras = [el.nameWithOctave if el.isNote else "r" for el in medida.recurse().notesAndRests]
+    primera = next(i for i, el in enumerate(medida.recurse().notesAndRests) if el.isNote)
+    figuras[primera] = medida.recurse().notesAndRests[primera].transpose(1).nameWithOctave
+    return {"compases": {str(medida.number): {"cp": figuras}}}
+
+
+def _cronometrar(funcion, *args):
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        resultado = funcion(*args)
+    return (time.perf_counter() - inicio) * 1000, resultado
+
+
+def medir(especie, compases, n, modo_pdf):
+    datos = generar_ejercicio(especie, compases).encode("utf-8")
+    _cronometrar(SesionAnalisis(especie, modo_pdf=modo_pdf).actualizar, datos)  # calentamiento
+    completo, parche, identico = [], [], []
+    for _ in range(n):
+        sesion = SesionAnalisis(especie, modo_pdf=modo_pdf)
+        ms, _ = _cronometrar(sesion.actualizar, datos)
+        completo.append(ms)
+        ms, _ = _cronometrar(sesion.actualizar, datos)
+        identico.append(ms)
+        ms, resultado = _cronometrar(sesion.parchear, _parche_central(sesion))
+        parche.append(ms)
+    return {
+        "completo": statistics.median(completo),
+        "parche": statistics.median(parche),
+        "identico": statistics.median(identico),
+        "evaluadas": resultado["reglas_evaluadas"],
+        "reutilizadas": resultado["reglas_reutilizadas"],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de sesiones de re-analisis incremental.")
+    parser.add_argument("-e", "--species", nargs="+", choices=["primera", "segunda"],
+                        default=["primera", "segunda"])
+    parser.add_argument("-c", "--compases", nargs="+", type=int, default=[8, 32, 128],
+                        help=f"Longitudes a medir ({COMPASES_MIN}-{COMPASES_MAX} compases).")
+    parser.add_argument("-n", "--iteraciones", type=int, default=3)
+    parser.add_argument("--pdf-mode", choices=["raster", "vectorial"], default="raster")
+    args = parser.parse_args(argv)
+
+    fuera = [c for c in args.compases if not COMPASES_MIN <= c <= COMPASES_MAX]
+    if fuera:
+        parser.error(f"compases fuera de rango ({COMPASES_MIN}-{COMPASES_MAX}): {fuera}")
+
+    print(f"{'caso':<15}{'completo':>11}{'parche':>11}{'identico':>11}{'ventanas':>16}   (ms, mediana)")
+    for especie in args.species:
+        for compases in args.compases:
+            r = medir(especie, compases, args.iteraciones, args.pdf_mode)
+            ventanas = f"{r['evaluadas']}/{r['evaluadas'] + r['reutilizadas']}"
+            print(f"{especie + '/' + str(compases):<15}{r['completo']:>11.1f}{r['parche']:>11.1f}"
+                  f"{r['identico']:>11.1f}{ventanas:>16}")
+    print("ventanas: evaluadas por el parche / total.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
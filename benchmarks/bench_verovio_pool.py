@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# benchmarks/bench_verovio_pool.py - Latencia de render Verovio: toolkit en frio vs pool caliente.
+#
+# Uso (desde la raiz del proyecto):
+#   python benchmarks/bench_verovio_pool.py [archivo.musicxml] [-n 30] [-e primera|segunda]
+#
+# Sin archivo se usa un ejercicio sintetico de primera especie.
+
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cli_runner
+import verovio_pdf
+
+
+def _ejercicio_sintetico(compases=16):
+    """MusicXML de primera especie (redondas, dos voces) como texto."""
+    from music21 import note, stream
+    score = stream.Score()
+    for octava, nombre in ((4, "Contrapunto"), (3, "Cantus Firmus")):
+        part = stream.Part(id=nombre)
+        part.partName = nombre
+        for i in range(compases):
+            part.append(note.Note(f"{'CDEFGAB'[(i * 3) % 7]}{octava}", quarterLength=4.0))
+        score.insert(0, part.makeMeasures())
+    return cli_runner._exportar_musicxml(score)
+
+
+def _medir(n, musicxml, opts, vaciar_pool):
+    tiempos = []
+    for _ in range(n):
+        if vaciar_pool:
+            verovio_pdf._POOL_TOOLKITS.clear()
+        inicio = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            _, err = verovio_pdf.generar_svg_de_musicxml(musicxml, opts)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        if err:
+            raise RuntimeError(err)
+    return tiempos
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark del pool de toolkits de Verovio.")
+    parser.add_argument("input", nargs="?", help="MusicXML a renderizar (por defecto: sintetico).")
+    parser.add_argument("-n", "--iteraciones", type=int, default=30)
+    parser.add_argument("-e", "--species", choices=["primera", "segunda"], default="primera")
+    args = parser.parse_args(argv)
+
+    if args.input:
+        with open(args.input, encoding="utf-8") as f:
+            musicxml = f.read()
+    else:
+        musicxml = _ejercicio_sintetico()
+    opts = cli_runner.VEROVIO_OPTS_1RA if args.species == "primera" else cli_runner.VEROVIO_OPTS_2DA
+
+    frio = _medir(args.iteraciones, musicxml, opts, vaciar_pool=True)
+    verovio_pdf.precalentar_toolkits(opts)
+    caliente = _medir(args.iteraciones, musicxml, opts, vaciar_pool=False)
+
+    print(f"Render Verovio ({args.species}, {args.iteraciones} iteraciones, ms)")
+    print(f"{'modo':<10}{'mediana':>10}{'media':>10}{'min':>10}{'max':>10}")
+    for nombre, t in (("frio", frio), ("caliente", caliente)):
+        print(f"{nombre:<10}{statistics.median(t):>10.2f}{statistics.mean(t):>10.2f}"
+              f"{min(t):>10.2f}{max(t):>10.2f}")
+    ahorro = statistics.median(frio) - statistics.median(caliente)
+    print(f"Ahorro por trabajo (mediana): {ahorro:.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+# benchmarks/generador_ejercicios.py - Ejercicios sinteticos de primera y segunda especie.
+#
+# generar_ejercicio("primera" | "segunda", compases, semilla) devuelve el MusicXML
+# como texto: Contrapunto arriba (parte 0) y Cantus Firmus abajo (parte 1), en Do
+# mayor y 4/4. El CF se mueve por grados conjuntos y saltos de tercera y cadencia
+# Re-Do; el CP usa consonancias sobre el CF (terceras, quintas, sextas, octavas,
+# decimas) sin quintas ni octavas paralelas, empieza y acaba en octava y, en
+# segunda especie, rellena la parte debil con notas de paso o consonancias.
+# La misma semilla da siempre el mismo ejercicio.
+
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from music21 import note, stream
+
+import cli_runner
+
+ESCALA = "CDEFGAB"
+COMPASES_MIN, COMPASES_MAX = 8, 500
+
+# Intervalos diatonicos (en grados) consonantes sobre el CF; 4 y 7 son justos.
+_CONSONANCIAS = (2, 4, 5, 7, 9)
+_JUSTAS = (4, 7)
+
+
+def _nota(grado, duracion):
+    """Grado diatonico contado desde Do3 (0 = C3, 7 = C4) -> music21 Note."""
+    return note.Note(f"{ESCALA[grado % 7]}{3 + grado // 7}", quarterLength=duracion)
+
+
+def _cantus_firmus(compases, rnd):
+    cf = [0]
+    for _ in range(compases - 3):
+        paso = rnd.choice((-2, -1, -1, 1, 1, 2))
+        siguiente = cf[-1] + paso
+        if not -2 <= siguiente <= 5:
+            siguiente = cf[-1] - paso
+        cf.append(siguiente)
+    return cf + [1, 0]  # cadencia Re-Do
+
+
+def _consonancias(grado_cf):
+    # Sobre Si la quinta es disminuida.
+    return [iv for iv in _CONSONANCIAS if not (iv == 4 and grado_cf % 7 == 6)]
+
+
+def _contrapunto_fuerte(cf, rnd, penultima, octavas=True):
+    """Una nota consonante por compas sobre el CF; a las justas solo por movimiento contrario."""
+    cp = [cf[0] + 7]
+    for i in range(1, len(cf) - 2):
+        mov_cf = cf[i] - cf[i - 1]
+        opciones = []
+        for iv in _consonancias(cf[i]):
+            mov_cp = cf[i] + iv - cp[-1]
+            if iv == 7 and not octavas:
+                continue
+            if not 0 < abs(mov_cp) <= 4 or (iv in _JUSTAS and mov_cp * mov_cf >= 0):
+                continue
+            if i == len(cf) - 3 and (cf[i] + iv == cf[-2] + penultima or iv == penultima):
+                continue  # ni nota repetida ni justas paralelas hacia la cadencia
+            opciones.append(cf[i] + iv)
+        if not opciones:  # sin salida cercana: cualquier tercera o sexta que no repita
+            opciones = [cf[i] + iv for iv in (2, 5, 9) if cf[i] + iv not in (cp[-1], cf[-2] + penultima)]
+        cp.append(rnd.choice(opciones))
+    return cp + [cf[-2] + penultima, cf[-1] + 7]
+
+
+def _parte(nombre, grados, duracion):
+    parte = stream.Part(id=nombre)
+    parte.partName = nombre
+    for grado in grados:
+        parte.append(_nota(grado, duracion))
+    return parte
+
+
+def generar_ejercicio(especie="primera", compases=16, semilla=0):
+    """MusicXML (texto) de un ejercicio valido de `compases` compases."""
+    if not COMPASES_MIN <= compases <= COMPASES_MAX:
+        raise ValueError(f"compases debe estar entre {COMPASES_MIN} y {COMPASES_MAX}.")
+    rnd = random.Random(f"{especie}-{compases}-{semilla}")
+    cf = _cantus_firmus(compases, rnd)
+
+    if especie == "primera":
+        cp = _parte("Contrapunto", _contrapunto_fuerte(cf, rnd, penultima=5), 4.0)  # sexta -> octava
+    else:
+        # Cadencia: quinta y sensible en el penultimo compas, octava al final. La
+        # segunda especie no admite octavas (unisono simple) en tiempo fuerte interior.
+        fuertes = _contrapunto_fuerte(cf, rnd, penultima=4, octavas=False)
+        cp = stream.Part(id="Contrapunto")
+        cp.partName = "Contrapunto"
+        for i, grado in enumerate(fuertes[:-1]):
+            cp.append(_nota(grado, 2.0))
+            destino = fuertes[i + 1]
+            iv_destino = (destino - cf[i + 1]) % 7
+
+            def paralela(debil):
+                return iv_destino in (0, 4) and (debil - cf[i]) % 7 == iv_destino
+
+            paso = (grado + destino) // 2
+            if abs(destino - grado) == 2 and not paralela(paso):
+                debil = paso  # nota de paso
+            else:
+                # Consonancia a distancia de salto pequeno que no repita nota.
+                opciones = [cf[i] + iv for iv in _consonancias(cf[i])
+                            if cf[i] + iv not in (grado, destino) and not paralela(cf[i] + iv)]
+                cercanas = [n for n in opciones if abs(n - grado) <= 4]
+                debil = rnd.choice(cercanas or opciones)
+            cp.append(_nota(debil, 2.0))
+        cp.append(_nota(fuertes[-1], 4.0))
+
+    score = stream.Score()
+    score.insert(0, cp.makeMeasures())
+    score.insert(0, _parte("Cantus Firmus", cf, 4.0).makeMeasures())
+    return cli_runner._exportar_musicxml(score)
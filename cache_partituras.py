@@ -0,0 +1,200 @@
+# cache_partituras.py - Cache en disco de partituras ya parseadas por music21.
+#
+# converter.parse es la etapa mas cara de los archivos que no admite el lector
+# rapido (lector_musicxml): cantus firmi de referencia, ejemplos del profesor y
+# reenvios llegan una y otra vez con los mismos bytes. La cache guarda el score
+# congelado (music21.freezeThaw, pickle) bajo el sha256 de los bytes y la version
+# de music21; un acierto descongela en lugar de parsear.
+#   - Cada entrada es un archivo <raiz>/<sha256>-m21-<version>.p: la comparten los
+#     workers del pool y sobrevive a reinicios (escritura atomica con os.replace).
+#   - LRU por presupuesto de bytes: un acierto renueva la fecha del archivo y, al
+#     guardar, se borran los menos usados hasta quedar por debajo de max_bytes.
+#   - Un archivo ilegible (pickle de otra version de Python, escritura a medias)
+#     se borra y cuenta como fallo.
+#   - Seguridad: descongelar es deshacer un pickle, que puede ejecutar codigo. El
+#     directorio por defecto es de cada usuario (<tmp>/contrapunto_partituras-<uid>),
+#     se crea con modo 0o700 y se rechaza (PermissionError) si es de otro usuario o
+#     lo puede escribir el grupo u otros. Ademas cada entrada empieza por un HMAC
+#     (sha256) de su contenido con una clave aleatoria de la instalacion
+#     (<raiz>/.clave, modo 0o600): un archivo que no escribio este proceso o sus
+#     hermanos no se descongela nunca; se borra y cuenta como fallo.
+# Los contadores (aciertos, fallos, expulsiones) son del proceso que usa la cache.
+
+import hashlib
+import hmac
+import os
+import stat
+import tempfile
+import threading
+
+EXTENSION = ".p"
+CLAVE = ".clave"
+_LONGITUD_MAC = hashlib.sha256().digest_size
+
+
+def raiz_por_defecto():
+    """Directorio de la cache del usuario actual en el directorio temporal."""
+    uid = os.getuid() if hasattr(os, "getuid") else None  # en Windows el temporal ya es del usuario
+    nombre = "contrapunto_partituras" if uid is None else f"contrapunto_partituras-{uid}"
+    return os.path.join(tempfile.gettempdir(), nombre)
+
+
+def _comprobar_privado(ruta, modo_prohibido):
+    """PermissionError si la ruta no es del usuario actual o tiene algun bit de modo_prohibido."""
+    st = os.lstat(ruta)
+    if hasattr(os, "getuid") and st.st_uid != os.getuid():
+        raise PermissionError(f"{ruta} pertenece a otro usuario (uid {st.st_uid}).")
+    if stat.S_ISLNK(st.st_mode):
+        raise PermissionError(f"{ruta} es un enlace simbolico.")
+    if hasattr(os, "getuid") and st.st_mode & modo_prohibido:
+        raise PermissionError(f"{ruta} tiene permisos demasiado abiertos ({stat.filemode(st.st_mode)}).")
+
+
+class CachePartituras:
+    """Scores de music21 congelados en disco por contenido, con expulsion LRU por tamano."""
+
+    def __init__(self, raiz=None, max_bytes=256 * 1024 * 1024):
+        from importlib.metadata import version
+        self.raiz = raiz or raiz_por_defecto()
+        self.max_bytes = max_bytes
+        self.version = version("music21")  # sin importar music21 (la API solo lee estadisticas)
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+        os.makedirs(self.raiz, mode=0o700, exist_ok=True)
+        _comprobar_privado(self.raiz, stat.S_IWGRP | stat.S_IWOTH)
+        self._clave = self._leer_clave()
+
+    def _leer_clave(self):
+        """Clave HMAC de la instalacion: se crea una vez (enlace atomico) y la leen todos los workers."""
+        ruta = os.path.join(self.raiz, CLAVE)
+        if not os.path.exists(ruta):
+            fd, temporal = tempfile.mkstemp(dir=self.raiz, suffix=".tmp")  # modo 0o600
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(os.urandom(32))
+                os.link(temporal, ruta)
+            except FileExistsError:
+                pass  # otro worker la creo a la vez: se usa la suya
+            finally:
+                self._borrar(temporal)
+        _comprobar_privado(ruta, stat.S_IRWXG | stat.S_IRWXO)
+        with open(ruta, "rb") as f:
+            clave = f.read()
+        if len(clave) != 32:
+            raise PermissionError(f"Clave de la cache invalida: {ruta}.")
+        return clave
+
+    def _firma(self, congelado):
+        return hmac.new(self._clave, congelado, hashlib.sha256).digest()
+
+    def ruta(self, datos):
+        """Archivo de la entrada de esos bytes (exista o no)."""
+        return os.path.join(self.raiz, f"{hashlib.sha256(datos).hexdigest()}-m21-{self.version}{EXTENSION}")
+
+    def obtener(self, datos, parsear):
+        """Score de esos bytes: descongelado si esta en cache; si no, parsear() y se guarda.
+
+        Devuelve (score, acierto). El score guardado es el que se devuelve en un
+        fallo (descongelado de lo que se acaba de escribir), asi ambos caminos dan
+        exactamente el mismo objeto.
+        """
+        from music21 import freezeThaw
+        ruta = self.ruta(datos)
+        score = self._descongelar(ruta)
+        if score is not None:
+            with self._lock:
+                self.aciertos += 1
+            return score, True
+        with self._lock:
+            self.fallos += 1
+        score = parsear()
+        # fastButUnsafe: sin copia previa, pero deja el score original inservible.
+        congelado = freezeThaw.StreamFreezer(score, fastButUnsafe=True).writeStr(fmt="pickle")
+        self._escribir(ruta, self._firma(congelado) + congelado)
+        thawer = freezeThaw.StreamThawer()
+        thawer.openStr(congelado)
+        return thawer.stream, False
+
+    def _descongelar(self, ruta):
+        from music21 import freezeThaw
+        try:
+            with open(ruta, "rb") as f:
+                firmado = f.read()
+        except OSError:
+            return None
+        mac, congelado = firmado[:_LONGITUD_MAC], firmado[_LONGITUD_MAC:]
+        if not hmac.compare_digest(mac, self._firma(congelado)):
+            self._borrar(ruta)  # no lo escribio esta instalacion: nunca se descongela
+            return None
+        try:
+            thawer = freezeThaw.StreamThawer()
+            thawer.openStr(congelado)
+        except Exception:
+            self._borrar(ruta)
+            return None
+        try:
+            os.utime(ruta)  # antiguedad LRU
+        except OSError:
+            pass
+        return thawer.stream
+
+    def _escribir(self, ruta, congelado):
+        fd, temporal = tempfile.mkstemp(dir=self.raiz, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(congelado)
+            os.replace(temporal, ruta)
+        except OSError:
+            self._borrar(temporal)
+            return
+        self._podar()
+
+    def _entradas(self):
+        """(ultimo uso, bytes, ruta) de cada archivo de la cache."""
+        entradas = []
+        for nombre in os.listdir(self.raiz):
+            if not nombre.endswith(EXTENSION):
+                continue
+            ruta = os.path.join(self.raiz, nombre)
+            try:
+                st = os.stat(ruta)
+            except OSError:
+                continue  # otro worker acaba de expulsarla
+            entradas.append((st.st_mtime, st.st_size, ruta))
+        return entradas
+
+    def _podar(self):
+        entradas = self._entradas()
+        total = sum(tamano for _, tamano, _ in entradas)
+        for _, tamano, ruta in sorted(entradas):
+            if total <= self.max_bytes:
+                break
+            if self._borrar(ruta):
+                with self._lock:
+                    self.expulsiones += 1
+            total -= tamano
+
+    @staticmethod
+    def _borrar(ruta):
+        try:
+            os.remove(ruta)
+            return True
+        except OSError:
+            return False
+
+    def vaciar(self):
+        for _, _, ruta in self._entradas():
+            self._borrar(ruta)
+
+    def estadisticas(self):
+        entradas = self._entradas()
+        with self._lock:
+            return {
+                "entradas": len(entradas),
+                "bytes": sum(tamano for _, tamano, _ in entradas),
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "expulsiones": self.expulsiones,
+            }
@@ -0,0 +1,95 @@
+# cache_resultados.py - Cache de resultados de la API direccionada por contenido.
+#
+# La clave es el sha256 de los bytes subidos mas los parametros que cambian la
+# salida (especie, cf_index, modo de PDF, opciones de Verovio). Cada entrada es el
+# dict de un trabajo de la cola (con su 'future' y su 'work_dir'):
+#   - una peticion identica a otra ya terminada reutiliza sus PDFs al instante;
+#   - una peticion identica a otra en curso comparte el mismo trabajo (single-flight);
+#   - las entradas terminadas se expulsan en orden LRU al superar el numero maximo
+#     de entradas; las que estan en curso nunca se expulsan.
+# El espacio en disco y la caducidad de los directorios los gestiona
+# almacen_artefactos; si el almacen expulsa un trabajo, la API lo descarta aqui.
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+
+def clave_contenido(datos, **parametros):
+    """Clave de cache: sha256 de los bytes y de los parametros (JSON ordenado)."""
+    h = hashlib.sha256(datos)
+    h.update(json.dumps(parametros, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _fallido(trabajo):
+    fut = trabajo["future"]
+    if not fut.done():
+        return False
+    if fut.cancelled() or fut.exception() is not None:
+        return True
+    return fut.result().get("estado") != "ok"
+
+
+class CacheResultados:
+    """Trabajos por clave de contenido con expulsion LRU por numero de entradas."""
+
+    def __init__(self, max_entradas=256, al_expulsar=None):
+        self.max_entradas = max_entradas
+        self._al_expulsar = al_expulsar
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, clave):
+        """Trabajo en curso o terminado con exito para esa clave, o None.
+
+        Un trabajo terminado con error no se sirve desde la cache: se descarta
+        para que la siguiente peticion lo recalcule.
+        """
+        with self._lock:
+            trabajo = self._entradas.get(clave)
+            if trabajo is not None and _fallido(trabajo):
+                del self._entradas[clave]
+                trabajo = None
+            if trabajo is None:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return trabajo
+
+    def guardar(self, clave, trabajo):
+        with self._lock:
+            self._entradas[clave] = trabajo
+            self._entradas.move_to_end(clave)
+            expulsados = self._podar()
+        for trabajo_expulsado in expulsados:
+            if self._al_expulsar:
+                self._al_expulsar(trabajo_expulsado)
+
+    def descartar(self, clave, trabajo):
+        """Quita la entrada si sigue apuntando a ese trabajo (sin avisar a al_expulsar)."""
+        with self._lock:
+            if self._entradas.get(clave) is trabajo:
+                del self._entradas[clave]
+
+    def _podar(self):
+        """Expulsa entradas terminadas (las menos usadas primero) hasta cumplir el limite."""
+        expulsados = []
+        while len(self._entradas) > self.max_entradas:
+            victima = next((c for c, t in self._entradas.items() if t["future"].done()), None)
+            if victima is None:
+                break  # todo lo que queda esta en curso
+            expulsados.append(self._entradas.pop(victima))
+        return expulsados
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "entradas": len(self._entradas),
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+            }
@@ -7,22 +7,24 @@
 # Sin Streamlit ni Firebase. Pensado para ser reutilizado por un backend FastAPI local.
 
 import argparse
+import concurrent.futures
+import csv
+import glob
+import io
+import json
 import os
-import re
 import sys
-import tempfile
 import datetime
+import time
 import traceback
-
-from music21 import converter, note as m21note, stream as m21stream
+from collections import Counter
 
 import verovio_pdf
-import exportar_pdf
-from primera_especie.analisis import seccion_analizar_ejercicio
-from segunda_especie.analisis import (
-    analizar_segunda_especie,
-    identificar_cantus_firmus_y_contrapunto,
-)
+from metricas import Traza, etapa
+
+# music21, reportlab (exportar_pdf) y los paquetes de analisis se importan en la
+# etapa que los usa: `--help`, un error de argumentos o el arranque de la API no
+# pagan su carga. precalentar() la adelanta en los workers.
 
 VEROVIO_OPTS_1RA = {
     "pageHeight": 600, "adjustPageHeight": True, "scale": 60, "svgHtml5": True,
@@ -31,14 +33,47 @@ VEROVIO_OPTS_2DA = {
     "pageHeight": 600, "adjustPageHeight": True, "scale": 60,
     "pageMarginTop": 40, "pageMarginBottom": 40,
     "pageMarginLeft": 40, "pageMarginRight": 40,
-    "breaks": "none", "landscape": 0, "svgHtml5": True,
+    "pageWidth": 4000, "adjustPageWidth": True, "breaks": "auto",
+    "landscape": 0, "svgHtml5": True,
 }
+# Opciones de Verovio por especie (tambien forman parte de la clave de cache de la API).
+OPCIONES_VEROVIO = {"primera": VEROVIO_OPTS_1RA, "segunda": VEROVIO_OPTS_2DA}
 
 
 def log(msg):
     print(f"[cli_runner] {msg}")
 
 
+# Cola de progreso de los workers de la API (iniciar_worker): procesar_trabajo deja
+# en ella (id, etapa) al empezar cada etapa. put_nowait no espera a quien la lee.
+_COLA_PROGRESO = None
+
+
+def iniciar_worker(cola_progreso=None):
+    """Initializer de los workers de la API: guarda la cola de progreso y precalienta."""
+    global _COLA_PROGRESO
+    _COLA_PROGRESO = cola_progreso
+    precalentar()
+
+
+def _avisar_progreso(id_progreso, etapa):
+    try:
+        _COLA_PROGRESO.put_nowait((id_progreso, etapa))
+    except Exception:
+        pass  # el progreso es informativo: nunca interrumpe el analisis
+
+
+def precalentar():
+    """Carga el pipeline completo y deja listos los toolkits de Verovio de ambas especies."""
+    import music21.converter
+    import exportar_pdf
+    import primera_especie.analisis
+    import primera_especie.anotador_svg_intervalos
+    import segunda_especie.analisis
+    import segunda_especie.anotador_svg_segunda
+    verovio_pdf.precalentar_toolkits(*OPCIONES_VEROVIO.values())
+
+
 # ----------------------------------------------------------------------
 # Utilidades del pipeline
 # ----------------------------------------------------------------------
@@ -57,9 +92,9 @@ def _asignar_ids_notas(part):
     sin empezar por digito). Si no, Verovio descarta el id al renderizar y genera
     uno aleatorio, rompiendo el mapeo de coordenadas del anotador.
     """
-    prefix = re.sub(r"[^A-Za-z0-9_-]", "_", str(part.id))
-    if not prefix or not (prefix[0].isalpha() or prefix[0] == "_"):
-        prefix = f"p_{prefix}"
+    from music21 import note as m21note
+    from lector_musicxml import prefijo_ids
+    prefix = prefijo_ids(part.id)
     idx = 0
     for element in part.recurse().getElementsByClass(m21note.GeneralNote):
         if element.isNote:
@@ -67,34 +102,184 @@ def _asignar_ids_notas(part):
             idx += 1
 
 
-def _escribir_musicxml_temporal(score, prefijo):
-    """Reescribe el score (ya con IDs) a un MusicXML temporal para Verovio."""
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".musicxml", prefix=prefijo)
-    tmp.close()
-    score.write('musicxml', fp=tmp.name)
-    return tmp.name
+# Cache en disco de los scores que parsea music21 (cache_partituras.py). Se
+# configura por entorno para que la hereden los workers del lote y de la API:
+# CONTRAPUNTO_CACHE_PARTITURAS_DIR (por defecto, uno por usuario en el directorio temporal) y
+# CONTRAPUNTO_CACHE_PARTITURAS_MB (presupuesto, 256 por defecto; 0 la desactiva).
+_CACHE_PARTITURAS = None
 
 
-def _safe_remove(path):
-    if path and os.path.exists(path):
-        try:
-            os.remove(path)
-        except OSError:
-            pass
+def cache_partituras():
+    """Cache de partituras del proceso, creada al primer uso (None si esta desactivada)."""
+    global _CACHE_PARTITURAS
+    if _CACHE_PARTITURAS is None:
+        mb = float(os.environ.get("CONTRAPUNTO_CACHE_PARTITURAS_MB") or 256)
+        if mb <= 0:
+            _CACHE_PARTITURAS = False
+        else:
+            from cache_partituras import CachePartituras
+            try:
+                _CACHE_PARTITURAS = CachePartituras(os.environ.get("CONTRAPUNTO_CACHE_PARTITURAS_DIR") or None,
+                                                    int(mb * 1024 * 1024))
+            except OSError as e:  # directorio ajeno o con permisos abiertos: sin cache
+                log(f"Cache de partituras desactivada: {e}")
+                _CACHE_PARTITURAS = False
+    return _CACHE_PARTITURAS or None
+
+
+def _parsear_partitura(origen, detalle=None):
+    """Parsea el MusicXML desde una ruta o desde los bytes ya leidos (sin pasar por disco).
+
+    Un score de music21 ya parseado (sesiones de re-analisis) se devuelve tal cual.
+    Con la cache de partituras activa, unos bytes ya vistos se descongelan en vez
+    de parsearse; detalle["cache_partitura"] recibe "acierto" o "fallo".
+    """
+    from music21 import stream
+    if isinstance(origen, stream.Score):
+        return origen
+    cache = cache_partituras()
+    if cache is None:
+        return _parsear_music21(origen)
+    if isinstance(origen, (bytes, bytearray)):
+        datos = bytes(origen)
+    else:
+        with open(origen, "rb") as f:
+            datos = f.read()
+    score, acierto = cache.obtener(datos, lambda: _parsear_music21(origen))
+    if acierto:
+        log("Partitura recuperada de la cache (sin parsear).")
+    if detalle is not None:
+        detalle["cache_partitura"] = "acierto" if acierto else "fallo"
+    return score
+
+
+def _parsear_music21(origen):
+    from music21 import converter
+    if isinstance(origen, (bytes, bytearray)):
+        log(f"Parseando MusicXML en memoria ({len(origen)} bytes)")
+        return converter.parseData(bytes(origen), format="musicxml")
+    log(f"Parseando MusicXML: {origen}")
+    return converter.parse(origen)
+
+
+def _leer_rapido(origen, tiempos):
+    """Partitura de lector_musicxml (voces ya con ids) o None si hay que usar music21.
+
+    Solo para rutas y bytes; un score ya parseado (sesiones) sigue el camino de
+    music21. Si el documento tiene algo que el lector no cubre se dice por que y se
+    vuelve a converter.parse (el intento cuenta en la etapa "parseo").
+    """
+    if not isinstance(origen, (str, os.PathLike, bytes, bytearray)):
+        return None
+    from lector_musicxml import LecturaNoSoportada, leer_musicxml
+    try:
+        with etapa(tiempos, "parseo"):
+            partitura = leer_musicxml(origen)
+    except LecturaNoSoportada as e:
+        log(f"Lector rapido no aplicable ({e}); se usa music21.")
+        return None
+    if len(partitura.voces) != 2:
+        raise ValueError(f"La partitura debe tener exactamente 2 voces (encontradas: {len(partitura.voces)}).")
+    log("MusicXML leido con el lector rapido.")
+    return partitura
+
+
+def _exportar_musicxml(score):
+    """Serializa el score (ya con IDs) a MusicXML en memoria para Verovio.
+
+    Usa el mismo exportador que score.write('musicxml'), sin pasar por disco: los
+    ids de nota viajan tal cual y Verovio los conserva como xml:id.
+    """
+    from music21.musicxml.m21ToXml import GeneralObjectExporter
+    return GeneralObjectExporter(score).parse().decode("utf-8")
 
 
-def _reportar_consola(errores, evaluacion):
+def _reportar_consola(errores, evaluacion, especie):
+    from analisis_musical_comun.diagnosticos import texto
     if errores:
         log(f"Se encontraron {len(errores)} errores/observaciones:")
         for e in errores:
-            print(f"   - {e}")
+            print(f"   - {texto(e, especie)}")
     else:
         log(f"OK: {evaluacion}")
 
 
-def _generar_reporte_pdf(output_pdf, especie, errores, evaluacion, observaciones,
+def _volcar_detalle(detalle, resultado, especie):
+    """Copia errores y evaluacion al dict `detalle` del llamador (si lo hay).
+
+    detalle["errores"] lleva el texto de cada error y detalle["diagnosticos"] su
+    forma JSON (analisis_musical_comun.diagnosticos.a_dict).
+    """
+    from analisis_musical_comun.diagnosticos import a_dict
+    if detalle is not None:
+        detalle["diagnosticos"] = [a_dict(e, especie) for e in resultado.errores]
+        detalle["errores"] = [d["mensaje"] for d in detalle["diagnosticos"]]
+        detalle["evaluacion"] = resultado.evaluacion
+
+
+def parsear_capas(texto, especie):
+    """'intervalos,flechas' -> lista de capas de anotacion validas para la especie.
+
+    None o vacio -> None (todas las capas); "ninguna" -> [] (sin anotar). ValueError
+    si alguna no existe para esa especie (verovio_pdf.CAPAS_ANOTACION).
+    """
+    if texto is None or not texto.strip():
+        return None
+    capas = [c.strip().lower() for c in texto.split(",") if c.strip()]
+    if capas == ["ninguna"]:
+        return []
+    disponibles = verovio_pdf.capas_disponibles(especie)
+    desconocidas = [c for c in capas if c not in disponibles]
+    if desconocidas:
+        raise ValueError(f"Capas no validas para {especie}: {desconocidas}. Use {disponibles}.")
+    return capas
+
+
+def reglas_disponibles(especie):
+    """Nombres del registro de reglas de la especie, en orden de evaluacion."""
+    if especie == "primera":
+        from primera_especie.reglas import REGLAS_PRIMERA as reglas
+    else:
+        from segunda_especie.reglas import REGLAS_SEGUNDA as reglas
+    return [r.nombre for r in reglas]
+
+
+def parsear_reglas(texto, especie):
+    """'cruce,nota_repetida' -> reglas a desactivar (None o vacio: ninguna).
+
+    ValueError si alguna no existe para esa especie (reglas_disponibles). Importa el
+    registro (music21) solo si hay algo que validar.
+    """
+    if texto is None or not texto.strip():
+        return None
+    reglas = [r.strip().lower() for r in texto.split(",") if r.strip()]
+    disponibles = reglas_disponibles(especie)
+    desconocidas = [r for r in reglas if r not in disponibles]
+    if desconocidas:
+        raise ValueError(f"Reglas no validas para {especie}: {desconocidas}. Use {disponibles}.")
+    return reglas
+
+
+def _tiempos(detalle):
+    """Dict de segundos por etapa dentro de `detalle` (None si el llamador no lo pide)."""
+    return detalle.setdefault("tiempos", {}) if detalle is not None else None
+
+
+def _ruta_depuracion(output_pdf):
+    """Directorio de depuracion de un trabajo: <output_pdf sin extension>_depuracion."""
+    base, _ = os.path.splitext(output_pdf)
+    return f"{base}_depuracion"
+
+
+def _ruta_informe(output_pdf):
+    base, _ = os.path.splitext(output_pdf)
+    return f"{base}_informe.pdf"
+
+
+def _generar_reporte_pdf(destino, especie, errores, evaluacion, observaciones,
                          cp_name=None, cf_name=None):
-    """Genera el PDF de informe textual junto al PDF de partitura anotada."""
+    """Genera el PDF de informe textual en `destino` (ruta o fichero binario)."""
+    import exportar_pdf
     datos = {
         "especie": especie,
         "errores": errores,
@@ -108,111 +293,418 @@ def _generar_reporte_pdf(output_pdf, especie, errores, evaluacion, observaciones
         datos["cf_part_name"] = cf_name
 
     buffer = exportar_pdf.generar_pdf_analisis_estable(datos)
-    base, _ = os.path.splitext(output_pdf)
-    reporte_path = f"{base}_informe.pdf"
-    with open(reporte_path, "wb") as f:
-        f.write(buffer.read())
-    log(f"Informe textual generado: {reporte_path}")
-    return reporte_path
+    if not isinstance(destino, (str, os.PathLike)):
+        destino.write(buffer.getvalue())
+        return destino
+    with open(destino, "wb") as f:
+        f.write(buffer.getvalue())
+    log(f"Informe textual generado: {destino}")
+    return destino
 
 
 # ----------------------------------------------------------------------
 # Pipelines por especie
 # ----------------------------------------------------------------------
-def procesar_primera(input_path, output_pdf, cf_index=1, generar_reporte=True):
-    log(f"Parseando MusicXML: {input_path}")
-    score = converter.parse(input_path)
-    parts = _normalizar_part_ids(score)
-    if len(parts) != 2:
-        raise ValueError(f"La partitura debe tener exactamente 2 voces (encontradas: {len(parts)}).")
-
+# input_path admite tambien los bytes del MusicXML o un score ya parseado, y
+# output_pdf / informe un fichero binario (BytesIO): asi la API procesa una subida
+# sin tocar disco. Por defecto el informe va junto al PDF anotado (<output_pdf>_informe.pdf). Si se
+# pasa `detalle`, detalle["tiempos"] recibe los segundos de cada etapa (metricas.ETAPAS).
+# Con `depuracion` (un directorio), se vuelcan alli los artefactos intermedios
+# (ver verovio_pdf.generar_pdf_partitura); por defecto no hay E/S de depuracion.
+# `capas` elige las capas de anotacion a dibujar (None: todas; ver parsear_capas).
+# `workers_pdf`: procesos que rasterizan las paginas de la partitura en paralelo.
+# `memo`: estado de las reglas de la pasada anterior sobre el mismo ejercicio; solo
+# se re-evaluan las ventanas de reglas con notas cambiadas (ver sesiones.py).
+# `sin_reglas`: reglas del registro de la especie que no se aplican (parsear_reglas).
+def procesar_primera(input_path, output_pdf, cf_index=1, generar_reporte=True, detalle=None,
+                     modo_pdf="raster", informe=None, depuracion=None, capas=None, workers_pdf=1,
+                     memo=None, sin_reglas=None):
+    from analisis_musical_comun.voces import extraer_voz
+    from primera_especie.analisis import seccion_analizar_ejercicio
+    tiempos = _tiempos(detalle)
     cp_index = 0 if cf_index == 1 else 1
-    cf_part, cp_part = parts[cf_index], parts[cp_index]
-    log(f"CF = parte[{cf_index}] (id={cf_part.id}) | CP = parte[{cp_index}] (id={cp_part.id})")
+    partitura = _leer_rapido(input_path, tiempos)
+    if partitura is not None:
+        # Lector rapido: voces e ids salen de la lectura; el MusicXML es el mismo arbol.
+        cf_voz, cp_voz = partitura.voces[cf_index], partitura.voces[cp_index]
+        log(f"CF = parte[{cf_index}] (id={cf_voz.id}) | CP = parte[{cp_index}] (id={cp_voz.id})")
+        with etapa(tiempos, "musicxml"):
+            musicxml_ids = partitura.musicxml()
+        del partitura
+    else:
+        with etapa(tiempos, "parseo"):
+            score = _parsear_partitura(input_path, detalle)
+        parts = _normalizar_part_ids(score)
+        if len(parts) != 2:
+            raise ValueError(f"La partitura debe tener exactamente 2 voces (encontradas: {len(parts)}).")
+
+        cf_part, cp_part = parts[cf_index], parts[cp_index]
+        log(f"CF = parte[{cf_index}] (id={cf_part.id}) | CP = parte[{cp_index}] (id={cp_part.id})")
+
+        with etapa(tiempos, "ids"):
+            for p in (cf_part, cp_part):
+                _asignar_ids_notas(p)
+            cf_voz, cp_voz = extraer_voz(cf_part), extraer_voz(cp_part)
+
+        with etapa(tiempos, "musicxml"):
+            musicxml_ids = _exportar_musicxml(score)
+        # Reglas y anotacion leen solo las voces compactas: el score no sigue vivo
+        # durante el render (salvo que el llamador lo conserve, como las sesiones).
+        del score, parts, cf_part, cp_part
+    log("Aplicando reglas de primera especie...")
+    with etapa(tiempos, "reglas"):
+        resultado = seccion_analizar_ejercicio(cf_voz, cp_voz, memo, tiempos, sin_reglas)
+    _reportar_consola(resultado.errores, resultado.evaluacion, "primera")
+    _volcar_detalle(detalle, resultado, "primera")
+
+    datos_anot = {
+        'tipo': 'primera',
+        'movimientos_cf': resultado.movimientos_cf,
+        'movimientos_cp': resultado.movimientos_cp,
+        'intervalos': resultado.datos_intervalos_svg,
+    }
+    log("Generando partitura anotada (Verovio -> SVG -> PDF)...")
+    ruta = verovio_pdf.generar_pdf_partitura(
+        musicxml_ids, output_pdf, VEROVIO_OPTS_1RA,
+        cf_voz, cp_voz, "primera", datos_anot, modo_pdf, tiempos, depuracion, capas,
+        workers_pdf)
+
+    if generar_reporte:
+        if informe is None:
+            informe = _ruta_informe(output_pdf)
+        with etapa(tiempos, "informe"):
+            _generar_reporte_pdf(informe, "Primera",
+                                 resultado.errores, resultado.evaluacion,
+                                 getattr(resultado, "observaciones", []))
+    return ruta
+
+
+def procesar_segunda(input_path, output_pdf, generar_reporte=True, detalle=None,
+                     modo_pdf="raster", informe=None, depuracion=None, capas=None, workers_pdf=1,
+                     memo=None, sin_reglas=None):
+    from music21 import stream as m21stream
+    from analisis_musical_comun.voces import extraer_voz
+    from segunda_especie.analisis import (
+        analizar_segunda_especie,
+        identificar_cantus_firmus_y_contrapunto,
+        identificar_cf_cp_voces,
+    )
+    tiempos = _tiempos(detalle)
+    partitura = _leer_rapido(input_path, tiempos)
+    if partitura is not None:
+        with etapa(tiempos, "reglas"):
+            cf_voz, cp_voz, mensaje = identificar_cf_cp_voces(*partitura.voces)
+        log(f"Identificacion automatica CF/CP: {mensaje}")
+        # Verovio espera CP arriba y CF abajo (como en el camino de music21).
+        orden = [partitura.voces.index(cp_voz), partitura.voces.index(cf_voz)]
+        with etapa(tiempos, "musicxml"):
+            musicxml_ids = partitura.musicxml(orden)
+        del partitura
+    else:
+        with etapa(tiempos, "parseo"):
+            score = _parsear_partitura(input_path, detalle)
+        parts = _normalizar_part_ids(score)
+        if len(parts) != 2:
+            raise ValueError(f"La partitura debe tener exactamente 2 voces (encontradas: {len(parts)}).")
+
+        with etapa(tiempos, "reglas"):
+            cf_part, cp_part, mensaje = identificar_cantus_firmus_y_contrapunto(score)
+        log(f"Identificacion automatica CF/CP: {mensaje}")
+
+        with etapa(tiempos, "ids"):
+            for p in (cf_part, cp_part):
+                _asignar_ids_notas(p)
+            cf_voz, cp_voz = extraer_voz(cf_part), extraer_voz(cp_part)
+
+        # Verovio espera CP arriba y CF abajo (mismo orden que usaba la app original).
+        score_verovio = m21stream.Score()
+        score_verovio.append(cp_part)
+        score_verovio.append(cf_part)
+
+        with etapa(tiempos, "musicxml"):
+            musicxml_ids = _exportar_musicxml(score_verovio)
+        # Como en primera especie: desde aqui solo se leen las voces compactas.
+        del score, score_verovio, parts, cf_part, cp_part
+    log("Aplicando reglas de segunda especie...")
+    with etapa(tiempos, "reglas"):
+        resultado = analizar_segunda_especie(cf_voz, cp_voz, memo, tiempos, sin_reglas)
+    _reportar_consola(resultado.errores, resultado.evaluacion, "segunda")
+    _volcar_detalle(detalle, resultado, "segunda")
+
+    datos_anot = {
+        'tipo': 'segunda',
+        'intervalos': resultado.datos_intervalos_svg,
+        'ids_rojos': resultado.ids_notas_rojas,
+        'movimientos_cp': resultado.movimientos_cp,
+    }
+    log("Generando partitura anotada (Verovio -> SVG -> PDF)...")
+    ruta = verovio_pdf.generar_pdf_partitura(
+        musicxml_data=musicxml_ids, output_pdf=output_pdf,
+        verovio_options=VEROVIO_OPTS_2DA, cf_voz=cf_voz, cp_voz=cp_voz,
+        species_str="segunda", datos_anotacion_especie=datos_anot, modo_pdf=modo_pdf,
+        tiempos=tiempos, depuracion=depuracion, capas=capas, workers_pdf=workers_pdf)
+
+    if generar_reporte:
+        if informe is None:
+            informe = _ruta_informe(output_pdf)
+        with etapa(tiempos, "informe"):
+            _generar_reporte_pdf(informe, "Segunda",
+                                 resultado.errores, resultado.evaluacion,
+                                 resultado.observaciones,
+                                 cp_name=(cp_voz.nombre or cp_voz.id),
+                                 cf_name=(cf_voz.nombre or cf_voz.id))
+    return ruta
 
-    for p in (cf_part, cp_part):
-        _asignar_ids_notas(p)
 
-    musicxml_ids = _escribir_musicxml_temporal(score, "m21_ids_1ra_")
-    try:
-        log("Aplicando reglas de primera especie...")
-        resultado = seccion_analizar_ejercicio(score, cf_part, cp_part)
-        _reportar_consola(resultado.errores, resultado.evaluacion)
-
-        datos_anot = {
-            'tipo': 'primera',
-            'movimientos_cf': resultado.movimientos_cf,
-            'movimientos_cp': resultado.movimientos_cp,
-            'intervalos': resultado.datos_intervalos_svg,
-        }
-        log("Generando partitura anotada (Verovio -> SVG -> PDF)...")
-        ruta = verovio_pdf.generar_pdf_partitura(
-            musicxml_ids, output_pdf, VEROVIO_OPTS_1RA,
-            score, cf_part, cp_part, "primera", datos_anot)
+# ----------------------------------------------------------------------
+# Modo lote (batch): muchos ejercicios en un pool de procesos
+# ----------------------------------------------------------------------
+EXTENSIONES_MUSICXML = (".xml", ".musicxml")
 
-        if generar_reporte:
-            _generar_reporte_pdf(output_pdf, "Primera",
-                                 resultado.errores, resultado.evaluacion,
-                                 getattr(resultado, "observaciones", []))
-        return ruta
-    finally:
-        _safe_remove(musicxml_ids)
 
+def _expandir_entradas(entrada):
+    """Devuelve la lista ordenada de MusicXML de un directorio o patron glob."""
+    if os.path.isdir(entrada):
+        candidatos = [os.path.join(entrada, f) for f in os.listdir(entrada)]
+    else:
+        candidatos = glob.glob(entrada)
+    return sorted(f for f in candidatos
+                  if os.path.isfile(f) and f.lower().endswith(EXTENSIONES_MUSICXML))
 
-def procesar_segunda(input_path, output_pdf, generar_reporte=True):
-    log(f"Parseando MusicXML: {input_path}")
-    score = converter.parse(input_path)
-    parts = _normalizar_part_ids(score)
-    if len(parts) != 2:
-        raise ValueError(f"La partitura debe tener exactamente 2 voces (encontradas: {len(parts)}).")
 
-    cf_part, cp_part, mensaje = identificar_cantus_firmus_y_contrapunto(score)
-    log(f"Identificacion automatica CF/CP: {mensaje}")
+def procesar_trabajo(input_path, output_dir, especie="segunda", cf_index=1,
+                     generar_reporte=True, modo_pdf="raster", depurar=False, capas=None,
+                     sin_reglas=None, id_progreso=None, nombre=None):
+    """Procesa un ejercicio (modo lote o cola de la API). Nunca lanza: devuelve el estado como dict.
 
-    for p in (cf_part, cp_part):
-        _asignar_ids_notas(p)
+    La salida es <output_dir>/<nombre>_anotada.pdf; nombre, por defecto, el del
+    archivo sin extension (procesar_lote lo pasa para no pisar homonimos).
 
-    # Verovio espera CP arriba y CF abajo (mismo orden que usaba la app original).
-    score_verovio = m21stream.Score()
-    score_verovio.append(cp_part)
-    score_verovio.append(cf_part)
+    La fila incluye los diagnosticos de los errores (diagnosticos.a_dict), la traza
+    del trabajo (metricas.Traza.arbol: un span por etapa)
+    y, con depurar=True, el directorio de artefactos de depuracion del archivo.
+    Con id_progreso (y un worker de iniciar_worker), cada etapa que empieza se
+    avisa en la cola de progreso como (id_progreso, etapa).
 
-    musicxml_ids = _escribir_musicxml_temporal(score_verovio, "m21_ids_2da_")
+    Se ejecuta dentro de un worker del pool; el interprete (music21, Verovio,
+    reportlab ya importados) se reutiliza entre archivos.
+    """
+    base = nombre or os.path.splitext(os.path.basename(input_path))[0]
+    output_pdf = os.path.join(output_dir, f"{base}_anotada.pdf")
+    fila = {"archivo": input_path, "estado": "error", "errores": None, "diagnosticos": None,
+            "tiempo_s": None, "salida": None, "mensaje": "", "traza": None, "depuracion": None,
+            "cache_partitura": None}
+    depuracion = _ruta_depuracion(output_pdf) if depurar else None
+    traza = Traza(os.path.basename(input_path))
+    if id_progreso is not None and _COLA_PROGRESO is not None:
+        traza.al_empezar = lambda nombre: _avisar_progreso(id_progreso, nombre)
+    detalle = {"tiempos": traza}
+    inicio = time.perf_counter()
     try:
-        log("Aplicando reglas de segunda especie...")
-        resultado = analizar_segunda_especie(score_verovio, cf_part, cp_part)
-        _reportar_consola(resultado.errores, resultado.evaluacion)
-
-        datos_anot = {
-            'tipo': 'segunda',
-            'intervalos': resultado.datos_intervalos_svg,
-            'ids_rojos': resultado.ids_notas_rojas,
-            'movimientos_cp': resultado.movimientos_cp,
+        if especie == "primera":
+            ruta = procesar_primera(input_path, output_pdf, cf_index, generar_reporte, detalle,
+                                    modo_pdf, depuracion=depuracion, capas=capas,
+                                    sin_reglas=sin_reglas)
+        else:
+            ruta = procesar_segunda(input_path, output_pdf, generar_reporte, detalle, modo_pdf,
+                                    depuracion=depuracion, capas=capas, sin_reglas=sin_reglas)
+        if ruta and os.path.exists(ruta):
+            fila["estado"] = "ok"
+            fila["salida"] = ruta
+        else:
+            fila["mensaje"] = "No se genero el PDF anotado."
+    except Exception as e:
+        fila["mensaje"] = f"{type(e).__name__}: {e}"
+    fila["tiempo_s"] = round(time.perf_counter() - inicio, 3)
+    fila["traza"] = traza.arbol()
+    if depuracion and os.path.isdir(depuracion):
+        fila["depuracion"] = depuracion
+    if "errores" in detalle:
+        fila["errores"] = len(detalle["errores"])
+        fila["diagnosticos"] = detalle["diagnosticos"]
+    fila["cache_partitura"] = detalle.get("cache_partitura")
+    return fila
+
+
+def procesar_en_memoria(datos, especie="segunda", cf_index=1, generar_reporte=True,
+                        modo_pdf="raster", capas=None, sin_reglas=None):
+    """Como procesar_trabajo, pero de los bytes subidos a los bytes de los PDFs, sin disco.
+
+    Devuelve un dict con estado, errores, diagnosticos, tiempo_s, mensaje, traza, pdf
+    e informe (bytes o None). Nunca lanza.
+    """
+    resultado = {"estado": "error", "errores": None, "diagnosticos": None, "tiempo_s": None, "mensaje": "",
+                 "traza": None, "pdf": None, "informe": None, "cache_partitura": None}
+    pdf, informe = io.BytesIO(), io.BytesIO() if generar_reporte else None
+    traza = Traza("memoria")
+    detalle = {"tiempos": traza}
+    inicio = time.perf_counter()
+    try:
+        if especie == "primera":
+            ruta = procesar_primera(datos, pdf, cf_index, generar_reporte, detalle, modo_pdf, informe,
+                                    capas=capas, sin_reglas=sin_reglas)
+        else:
+            ruta = procesar_segunda(datos, pdf, generar_reporte, detalle, modo_pdf, informe,
+                                    capas=capas, sin_reglas=sin_reglas)
+        if ruta is not None:
+            resultado["estado"] = "ok"
+            resultado["pdf"] = pdf.getvalue()
+            resultado["informe"] = informe.getvalue() if informe is not None else None
+        else:
+            resultado["mensaje"] = "No se genero el PDF anotado."
+    except Exception as e:
+        resultado["mensaje"] = f"{type(e).__name__}: {e}"
+    resultado["tiempo_s"] = round(time.perf_counter() - inicio, 3)
+    resultado["traza"] = traza.arbol()
+    if "errores" in detalle:
+        resultado["errores"] = len(detalle["errores"])
+        resultado["diagnosticos"] = detalle["diagnosticos"]
+    resultado["cache_partitura"] = detalle.get("cache_partitura")
+    return resultado
+
+
+def _escribir_resumen(filas, ruta_resumen):
+    """Escribe el resumen del lote en JSON o CSV segun la extension (el CSV sin la traza ni los diagnosticos)."""
+    if ruta_resumen.lower().endswith(".csv"):
+        campos = [c for c in filas[0] if c not in ("traza", "diagnosticos")] if filas else ["archivo"]
+        with open(ruta_resumen, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=campos, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(filas)
+    else:
+        with open(ruta_resumen, "w", encoding="utf-8") as f:
+            json.dump(filas, f, ensure_ascii=False, indent=2)
+
+
+def _nombres_salida(entradas):
+    """Nombre base de la salida de cada entrada, sin repetidos dentro del lote.
+
+    Un glob puede abarcar varios directorios: a los archivos con el mismo nombre se
+    les antepone su directorio relativo al comun ("a/ej.musicxml" -> "a_ej") y, si
+    aun coinciden, el indice de la entrada ("ej_00003").
+    """
+    nombres = [os.path.splitext(os.path.basename(r))[0] for r in entradas]
+    repetidos = {n for n, veces in Counter(nombres).items() if veces > 1}
+    if repetidos:
+        directorios = [os.path.dirname(os.path.abspath(r)) for r in entradas]
+        comun = os.path.commonpath(directorios)
+        for i, directorio in enumerate(directorios):
+            relativo = os.path.relpath(directorio, comun)
+            if nombres[i] in repetidos and relativo != os.curdir:
+                nombres[i] = f"{relativo.replace(os.sep, '_')}_{nombres[i]}"
+    veces = Counter(nombres)
+    return [f"{n}_{i:05d}" if veces[n] > 1 else n for i, n in enumerate(nombres)]
+
+
+def procesar_lote(entradas, output_dir, especie="segunda", cf_index=1,
+                  generar_reporte=True, workers=None, modo_pdf="raster", depurar=False,
+                  capas=None, sin_reglas=None):
+    """Reparte los ejercicios en un pool de procesos y devuelve una fila por archivo.
+
+    Un fallo en un archivo (o la caida de un worker) queda registrado en su fila
+    y no detiene el resto del lote. Cada archivo tiene su propia salida aunque se
+    repitan nombres (_nombres_salida).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    filas = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=precalentar) as pool:
+        futuros = {
+            pool.submit(procesar_trabajo, ruta, output_dir, especie, cf_index,
+                        generar_reporte, modo_pdf, depurar, capas, sin_reglas,
+                        nombre=nombre): ruta
+            for ruta, nombre in zip(entradas, _nombres_salida(entradas))
         }
-        log("Generando partitura anotada (Verovio -> SVG -> PDF)...")
-        ruta = verovio_pdf.generar_pdf_partitura(
-            musicxml_path=musicxml_ids, output_pdf=output_pdf,
-            verovio_options=VEROVIO_OPTS_2DA, score_m21_obj=score_verovio,
-            cf_part_m21_obj=cf_part, cp_part_m21_obj=cp_part,
-            species_str="segunda", datos_anotacion_especie=datos_anot)
-
-        if generar_reporte:
-            _generar_reporte_pdf(output_pdf, "Segunda",
-                                 resultado.errores, resultado.evaluacion,
-                                 resultado.observaciones,
-                                 cp_name=(cp_part.partName or cp_part.id),
-                                 cf_name=(cf_part.partName or cf_part.id))
-        return ruta
-    finally:
-        _safe_remove(musicxml_ids)
+        for fut in concurrent.futures.as_completed(futuros):
+            ruta = futuros[fut]
+            try:
+                fila = fut.result()
+            except Exception as e:
+                fila = {"archivo": ruta, "estado": "error", "errores": None, "diagnosticos": None,
+                        "tiempo_s": None, "salida": None,
+                        "mensaje": f"Worker caido: {type(e).__name__}: {e}", "traza": None,
+                        "depuracion": None, "cache_partitura": None}
+            log(f"[lote] {fila['estado'].upper()} {ruta} ({fila['tiempo_s']} s)")
+            filas[ruta] = fila
+    return [filas[r] for r in entradas]
+
+
+def main_lote(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="cli_runner.py batch",
+        description="Procesa en paralelo todos los MusicXML de un directorio o patron glob.")
+    parser.add_argument("entrada", help="Directorio o patron glob (entre comillas) de MusicXML.")
+    parser.add_argument("-d", "--output-dir", default=".",
+                        help="Directorio de salida de los PDFs (por defecto: directorio actual).")
+    parser.add_argument("-e", "--species", choices=["primera", "segunda"], default="segunda",
+                        help="Especie de contrapunto (por defecto: segunda).")
+    parser.add_argument("--cf-index", type=int, choices=[0, 1], default=1,
+                        help="(Solo primera) indice de la parte que es Cantus Firmus (por defecto: 1).")
+    parser.add_argument("--no-report", action="store_true",
+                        help="No generar el PDF de informe textual adicional.")
+    parser.add_argument("--pdf-mode", choices=list(verovio_pdf.MODOS_PDF), default="raster",
+                        help="Partitura anotada raster (PNG incrustado) o vectorial (por defecto: raster).")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="Numero de procesos worker (por defecto: numero de CPUs).")
+    parser.add_argument("--capas", default=None,
+                        help="Capas de anotacion separadas por comas, en el orden de dibujo de la "
+                             "especie (primera: intervalos,flechas; segunda: intervalos,movimiento,"
+                             "flechas,notas_rojas), o 'ninguna'. Por defecto: todas.")
+    parser.add_argument("--sin-reglas", default=None,
+                        help="Reglas a desactivar, separadas por comas (primera: consonancia,"
+                             "paralelas,movimiento_directo,inicio_final,nota_repetida,cruce,"
+                             "melodico_cp,melodico_cf,entre_voces,patrones; segunda: inicio_final,"
+                             "figuras,paralelas). Por defecto: todas activas.")
+    parser.add_argument("--debug", action="store_true",
+                        help="Volcar MusicXML, SVG crudo, SVG anotado y coordenadas de cada "
+                             "ejercicio en <output-dir>/<nombre>_anotada_depuracion/.")
+    parser.add_argument("--summary", default=None,
+                        help="Resumen .json o .csv (por defecto: <output-dir>/resumen_lote.json).")
+    args = parser.parse_args(argv)
+
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers debe ser >= 1")
+    try:
+        capas = parsear_capas(args.capas, args.species)
+        sin_reglas = parsear_reglas(args.sin_reglas, args.species)
+    except ValueError as e:
+        parser.error(str(e))
+
+    entradas = _expandir_entradas(args.entrada)
+    if not entradas:
+        log(f"ERROR: no se encontraron MusicXML en: {args.entrada}")
+        return 2
+
+    log(f"[lote] {len(entradas)} ejercicios, workers={args.workers or os.cpu_count()}")
+    inicio = time.perf_counter()
+    filas = procesar_lote(entradas, args.output_dir, args.species, args.cf_index,
+                          not args.no_report, args.workers, args.pdf_mode, args.debug, capas,
+                          sin_reglas)
+    total = time.perf_counter() - inicio
+
+    ruta_resumen = args.summary or os.path.join(args.output_dir, "resumen_lote.json")
+    _escribir_resumen(filas, ruta_resumen)
+    fallidos = sum(1 for f in filas if f["estado"] != "ok")
+    log(f"[lote] {len(filas) - fallidos} OK, {fallidos} con error en {total:.1f} s. "
+        f"Resumen: {ruta_resumen}")
+    consultas = [f["cache_partitura"] for f in filas if f.get("cache_partitura")]
+    if consultas:
+        log(f"[lote] Cache de partituras: {consultas.count('acierto')} aciertos, "
+            f"{consultas.count('fallo')} fallos (el resto, lector rapido).")
+    return 1 if fallidos else 0
 
 
 # ----------------------------------------------------------------------
 # CLI
 # ----------------------------------------------------------------------
 def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == "batch":
+        return main_lote(argv[1:])
+
     parser = argparse.ArgumentParser(
-        description="Nucleo CLI del Asistente de Contrapunto: MusicXML -> PDF anotado.")
+        description="Nucleo CLI del Asistente de Contrapunto: MusicXML -> PDF anotado. "
+                    "Use 'batch' como primer argumento para procesar un directorio.")
     parser.add_argument("input", help="Archivo MusicXML de entrada (.xml / .musicxml).")
     parser.add_argument("-o", "--output", default=None,
                         help="PDF anotado de salida (por defecto: <input>_anotada.pdf).")
@@ -222,7 +714,32 @@ def main(argv=None):
                         help="(Solo primera) indice de la parte que es Cantus Firmus (por defecto: 1).")
     parser.add_argument("--no-report", action="store_true",
                         help="No generar el PDF de informe textual adicional.")
+    parser.add_argument("--pdf-mode", choices=list(verovio_pdf.MODOS_PDF), default="raster",
+                        help="Partitura anotada raster (PNG incrustado) o vectorial (por defecto: raster).")
+    parser.add_argument("--capas", default=None,
+                        help="Capas de anotacion separadas por comas, en el orden de dibujo de la "
+                             "especie (primera: intervalos,flechas; segunda: intervalos,movimiento,"
+                             "flechas,notas_rojas), o 'ninguna'. Por defecto: todas.")
+    parser.add_argument("--sin-reglas", default=None,
+                        help="Reglas a desactivar, separadas por comas (primera: consonancia,"
+                             "paralelas,movimiento_directo,inicio_final,nota_repetida,cruce,"
+                             "melodico_cp,melodico_cf,entre_voces,patrones; segunda: inicio_final,"
+                             "figuras,paralelas). Por defecto: todas activas.")
+    parser.add_argument("--debug", action="store_true",
+                        help="Volcar MusicXML, SVG crudo, SVG anotado y coordenadas en "
+                             "<output sin .pdf>_depuracion/.")
+    parser.add_argument("--pdf-workers", type=int, default=None,
+                        help="Procesos que rasterizan en paralelo las paginas de la partitura "
+                             "(por defecto: numero de CPUs).")
     args = parser.parse_args(argv)
+    try:
+        capas = parsear_capas(args.capas, args.species)
+        sin_reglas = parsear_reglas(args.sin_reglas, args.species)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.pdf_workers is not None and args.pdf_workers < 1:
+        parser.error("--pdf-workers debe ser >= 1")
+    workers_pdf = args.pdf_workers or os.cpu_count() or 1
 
     if not os.path.exists(args.input):
         log(f"ERROR: no existe el archivo de entrada: {args.input}")
@@ -234,11 +751,16 @@ def main(argv=None):
         output_pdf = f"{base}_anotada.pdf"
 
     generar_reporte = not args.no_report
+    depuracion = _ruta_depuracion(output_pdf) if args.debug else None
     try:
         if args.species == "primera":
-            ruta = procesar_primera(args.input, output_pdf, args.cf_index, generar_reporte)
+            ruta = procesar_primera(args.input, output_pdf, args.cf_index, generar_reporte,
+                                    modo_pdf=args.pdf_mode, depuracion=depuracion, capas=capas,
+                                    workers_pdf=workers_pdf, sin_reglas=sin_reglas)
         else:
-            ruta = procesar_segunda(args.input, output_pdf, generar_reporte)
+            ruta = procesar_segunda(args.input, output_pdf, generar_reporte,
+                                    modo_pdf=args.pdf_mode, depuracion=depuracion, capas=capas,
+                                    workers_pdf=workers_pdf, sin_reglas=sin_reglas)
     except Exception as e:
         log(f"ERROR en el pipeline: {e}")
         traceback.print_exc()
@@ -246,6 +768,8 @@ def main(argv=None):
 
     if ruta and os.path.exists(ruta):
         log(f"PDF anotado generado correctamente: {ruta}")
+        if depuracion:
+            log(f"Artefactos de depuracion en: {depuracion}")
         return 0
     log("ERROR: no se genero el PDF anotado.")
     return 1
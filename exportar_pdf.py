@@ -8,10 +8,11 @@ from reportlab.lib.units import inch
 from reportlab.lib.pagesizes import letter, landscape
 from reportlab.lib import colors
 import datetime
-import re
 import os
 import traceback
 
+from analisis_musical_comun.diagnosticos import describir_movimiento, rango_corto, texto
+
 # _header_footer_info_with_background (sin cambios)
 def _header_footer_info_with_background(canvas, doc):
     canvas.saveState()
@@ -85,7 +86,9 @@ def generar_pdf_analisis_estable(ejercicio_data):
     story.append(HRFlowable(width="100%", thickness=0.5, color=colors.lightgrey, spaceBefore=0.05*inch, spaceAfter=0.2*inch))
 
     story.append(Paragraph("Diagnóstico General", styles['MySectionHeadingEstable']))
+    # errores y observaciones: diagnosticos (analisis_musical_comun.diagnosticos).
     errores = ejercicio_data.get("errores", [])
+    especie_texto = str(ejercicio_data.get("especie", "Primera")).lower()
     evaluacion_general_texto = ejercicio_data.get("evaluacion", "Evaluación no disponible.")
     if not errores:
         story.append(Paragraph(f"🎉 ¡Excelente! {evaluacion_general_texto}", styles['MySuccessTextEstable']))
@@ -95,46 +98,23 @@ def generar_pdf_analisis_estable(ejercicio_data):
 
     if errores:
         story.append(Paragraph("Correcciones Necesarias: Errores de Reglas", styles['MySectionHeadingEstable']))
-        for error_msg in errores:
-            story.append(Paragraph(error_msg, styles['MyErrorListItemEstable']))
+        for d in errores:
+            story.append(Paragraph(texto(d, especie_texto), styles['MyErrorListItemEstable']))
         story.append(Spacer(1, 0.1*inch))
 
+    # Secciones por campos de los diagnosticos (codigo, voz); las observaciones de
+    # otros codigos (p. ej. notas de paso de 2da especie) no tienen seccion propia.
     observaciones = ejercicio_data.get("observaciones", [])
     mov_melodico_cp_data, mov_melodico_cf_data, mov_entre_voces_data, patrones_especificos_data = [], [], [], [] # Renombrado violin/viola a cp/cf
     
-    current_section = None
-    measure_pattern = re.compile(r"^(Compás\s*\d+\s*(?:(?:a|-)\s*\d+)?|Del\s*tiempo\s*\d+\s*(?:(?:al|-)\s*\d+)?)\s*:\s*", re.IGNORECASE)
-    
-    for obs_line in observaciones:
-        obs_line_stripped = obs_line.strip()
-        if not obs_line_stripped: continue
-
-        # Lógica de asignación de sección (ajustada para ser más genérica con CP/CF)
-        # El nombre de la parte vendrá de `cp_part_name_display` o `cf_part_name_display` en las observaciones
-        if "Movimiento Melódico del" in obs_line_stripped:
-            if "Contrapunto" in obs_line_stripped or ejercicio_data.get("cp_part_name", "Contrapunto") in obs_line_stripped : # Asumimos que cp_part_name podría pasarse en ejercicio_data
-                current_section = "cp_melodico"; continue
-            elif "Cantus Firmus" in obs_line_stripped or ejercicio_data.get("cf_part_name", "Cantus Firmus") in obs_line_stripped:
-                current_section = "cf_melodico"; continue
-        elif "Movimiento Entre Voces" in obs_line_stripped: # Esto capturará "Movimiento Entre Voces (entre Tiempos Fuertes)"
-            current_section = "entre_voces"; continue
-        elif "Patrones Específicos" in obs_line_stripped:
-            current_section = "patrones"; continue
-        
-        measure_info_str, main_content_str = "", obs_line_stripped
-        match = measure_pattern.match(obs_line_stripped)
-        if match:
-            measure_info_str = match.group(1).replace("Del tiempo", "T.").replace("Compás", "C.")
-            main_content_str = measure_pattern.sub("", obs_line_stripped).strip()
-        
-        # Eliminar prefijos genéricos si aún están en main_content_str
-        main_content_str = re.sub(r"^(?:.*?Contrapunto\s*-\s*|.*?Cantus Firmus\s*-\s*|Entre voces\s*-\s*)", "", main_content_str, flags=re.IGNORECASE)
-
-
-        if current_section == "cp_melodico": mov_melodico_cp_data.append((measure_info_str, main_content_str))
-        elif current_section == "cf_melodico": mov_melodico_cf_data.append((measure_info_str, main_content_str))
-        elif current_section == "entre_voces": mov_entre_voces_data.append((measure_info_str, main_content_str))
-        elif current_section == "patrones": patrones_especificos_data.append((measure_info_str, main_content_str))
+    for d in observaciones:
+        if d.codigo == "movimiento_melodico":
+            datos_voz = mov_melodico_cp_data if d.voz == "cp" else mov_melodico_cf_data
+            datos_voz.append((rango_corto(d), describir_movimiento(d)))
+        elif d.codigo == "movimiento_entre_voces":
+            mov_entre_voces_data.append((rango_corto(d), describir_movimiento(d), d.movimiento))
+        elif d.codigo in ("llegada_perfecta_por_salto", "sin_patrones"):
+            patrones_especificos_data.append(("", d))
 
     # --- TÍTULO CONDICIONAL PARA MOVIMIENTO ENTRE VOCES ---
     especie_actual = ejercicio_data.get("especie", "Primera") 
@@ -146,14 +126,11 @@ def generar_pdf_analisis_estable(ejercicio_data):
 
     story.append(Paragraph(titulo_seccion_mov_entre_voces, styles['MySectionHeadingEstable']))
     if mov_entre_voces_data:
-        for measure_info, mov_text_original in mov_entre_voces_data:
+        estilos_movimiento = {'contrary': 'ContraryMovementStyleEstable', 'parallel': 'ParallelMovementStyleEstable',
+                              'similar': 'SimilarMovementStyleEstable', 'oblique': 'ObliqueMovementStyleEstable'}
+        for measure_info, mov_text_original, movimiento in mov_entre_voces_data:
             item_content = []
-            mov_text_for_comparison = mov_text_original.replace("<b>","").replace("</b>","") # Para comparación sin formato
-            style_key = 'OtherMovementStyleEstable' # Estilo por defecto
-            if "Movimiento Contrary" in mov_text_for_comparison: style_key = 'ContraryMovementStyleEstable'
-            elif "Movimiento Parallel" in mov_text_for_comparison: style_key = 'ParallelMovementStyleEstable'
-            elif "Movimiento Similar" in mov_text_for_comparison: style_key = 'SimilarMovementStyleEstable'
-            elif "Movimiento Oblique" in mov_text_for_comparison: style_key = 'ObliqueMovementStyleEstable'
+            style_key = estilos_movimiento.get(movimiento, 'OtherMovementStyleEstable') # Estilo por defecto: Other
             item_content.append(Paragraph(mov_text_original, styles[style_key]))
             if measure_info:
                 item_content.append(Paragraph(f"<i>({measure_info})</i>", styles['MeasureInfoSubtleEstable']))
@@ -187,9 +164,10 @@ def generar_pdf_analisis_estable(ejercicio_data):
 
     if patrones_especificos_data: # Esta sección se omitirá si no hay datos, lo cual es bueno para 2da especie por ahora
         story.append(Paragraph("Observaciones Adicionales y Patrones", styles['MySectionHeadingEstable']))
-        for measure_info, pat_text in patrones_especificos_data:
+        for measure_info, d in patrones_especificos_data:
             item_content = []
-            if "No se identificaron patrones especiales" in pat_text: item_content.append(Paragraph(pat_text, styles['MyBodyTextEstable']))
+            pat_text = texto(d, especie_texto)
+            if d.codigo == "sin_patrones": item_content.append(Paragraph(pat_text, styles['MyBodyTextEstable']))
             else: item_content.append(Paragraph(pat_text, styles[base_info_list_style_name]))
             if measure_info: item_content.append(Paragraph(f"<i>({measure_info})</i>", styles['MeasureInfoSubtleEstable']))
             if item_content: story.append(KeepTogether(item_content))
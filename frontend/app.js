@@ -1,10 +1,26 @@
 /* =========================================================================
    Asistente de Contrapunto — frontend logic (vanilla JS, no framework)
    Intercepts the form, POSTs multipart/form-data to the FastAPI backend,
-   and renders the returned PDF paths as download links.
+   follows the queued job's progress events (Server-Sent Events, polling as
+   a fallback) until it finishes, and renders the returned PDF paths as
+   download links.
    ========================================================================= */
 
 const API_URL = "http://localhost:8000/analyze/";
+const POLL_INTERVAL_MS = 1000;
+
+// Pipeline stages as reported by GET /jobs/{id}/events (metricas.ETAPAS).
+const STAGE_LABELS = {
+  cola:      "En cola, a la espera de un copista…",
+  parseo:    "Leyendo la partitura…",
+  ids:       "Identificando las voces…",
+  musicxml:  "Preparando el grabado…",
+  reglas:    "Aplicando las reglas del contrapunto…",
+  svg:       "Grabando la partitura…",
+  anotacion: "Anotando intervalos y movimientos…",
+  pdf:       "Componiendo el PDF…",
+  informe:   "Redactando el informe…",
+};
 
 const form        = document.getElementById("analyze-form");
 const fileInput   = document.getElementById("file");
@@ -90,18 +106,12 @@ form.addEventListener("submit", async (event) => {
   const data = new FormData();
   data.append("file", file);
   data.append("especie", document.getElementById("especie").value);
+  data.append("modo_pdf", document.getElementById("modo-pdf").value);
 
   try {
-    const response = await fetch(API_URL, { method: "POST", body: data });
-
-    let payload = null;
-    try { payload = await response.json(); } catch { /* non-JSON error body */ }
-
-    if (!response.ok) {
-      const detail = payload?.detail || `El servidor respondió ${response.status}.`;
-      throw new Error(detail);
-    }
-
+    const job = await fetchJson(API_URL, { method: "POST", body: data });
+    // A cached result comes back already finished; otherwise follow the job.
+    const payload = job.status === "ok" ? job : await followJob(job.job_url);
     renderResults(payload);
   } catch (err) {
     const isNetwork = err instanceof TypeError;
@@ -115,6 +125,58 @@ form.addEventListener("submit", async (event) => {
   }
 });
 
+/* -------------------------------------------------------------------------
+   Job queue: /analyze/ answers at once with a job_url. Its /events stream
+   pushes each stage as it starts and a final "fin" event with the same body
+   as the job_url (download URLs or the error). Without EventSource, or if the
+   stream drops before "fin", fall back to polling the job_url.
+   ------------------------------------------------------------------------- */
+async function fetchJson(url, options) {
+  const response = await fetch(url, options);
+
+  let payload = null;
+  try { payload = await response.json(); } catch { /* non-JSON error body */ }
+
+  if (!response.ok) {
+    const detail = payload?.detail || `El servidor respondió ${response.status}.`;
+    throw new Error(detail);
+  }
+  return payload;
+}
+
+function finishedJob(job) {
+  if (job.status === "error") throw new Error(job.detail || "Error en el pipeline.");
+  return job;
+}
+
+function followJob(jobUrl) {
+  if (typeof EventSource === "undefined") return waitForJob(jobUrl);
+
+  return new Promise((resolve, reject) => {
+    const source = new EventSource(`${jobUrl}/events`);
+
+    source.addEventListener("progreso", (e) => renderProgress(JSON.parse(e.data)));
+    source.addEventListener("fin", (e) => {
+      source.close();
+      try { resolve(finishedJob(JSON.parse(e.data))); } catch (err) { reject(err); }
+    });
+    // Connection lost (or never opened): the job keeps running on the server.
+    source.onerror = () => {
+      source.close();
+      waitForJob(jobUrl).then(resolve, reject);
+    };
+  });
+}
+
+async function waitForJob(jobUrl) {
+  for (;;) {
+    const job = await fetchJson(jobUrl);
+    if (job.status === "ok" || job.status === "error") return finishedJob(job);
+    if (job.progreso) renderProgress(job.progreso);
+    await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL_MS));
+  }
+}
+
 /* -------------------------------------------------------------------------
    UI state rendering
    ------------------------------------------------------------------------- */
@@ -129,11 +191,24 @@ function renderLoading() {
     <div class="panel" role="status">
       <p class="loading">
         <span class="loading__quill" aria-hidden="true"></span>
-        Examinando el contrapunto&hellip;
+        <span class="loading__label">Examinando el contrapunto&hellip;</span>
       </p>
+      <div class="progress" role="progressbar" aria-label="Progreso del análisis"
+           aria-valuemin="0" aria-valuemax="100" aria-valuenow="0">
+        <span class="progress__bar"></span>
+      </div>
     </div>`;
 }
 
+function renderProgress({ etapa, porcentaje }) {
+  const label = results.querySelector(".loading__label");
+  const bar = results.querySelector(".progress");
+  if (!label || !bar) return;
+  label.textContent = STAGE_LABELS[etapa] || "Examinando el contrapunto…";
+  bar.setAttribute("aria-valuenow", String(porcentaje));
+  bar.style.setProperty("--progress", `${porcentaje}%`);
+}
+
 function renderError(message) {
   results.innerHTML = `
     <div class="panel panel--error" role="alert">
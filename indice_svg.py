@@ -0,0 +1,78 @@
+# indice_svg.py - Indice de las notas del SVG de Verovio en una sola pasada.
+#
+# indexar_notas(svg_root) recorre el arbol una vez y devuelve
+#   id de nota -> {"x", "y", "pentagrama", "compas"}
+# (x, y: cabeza de la nota en unidades SVG; pentagrama: 1 = superior dentro del
+# compas; compas: orden del compas en el SVG, desde 1). Los ids son los xml:id
+# que cli_runner asigna a las notas de music21 y Verovio conserva en data-id.
+# Lo comparten los anotadores de ambas especies: buscar cada id con XPath sobre
+# todo el arbol costaba O(notas^2) en ejercicios largos.
+
+import re
+
+SVG_NS = "http://www.w3.org/2000/svg"
+_G = f"{{{SVG_NS}}}g"
+_USE = f"{{{SVG_NS}}}use"
+_TRANSLATE = re.compile(r"translate\(\s*([-\d.]+)[,\s]+([-\d.]+)")
+
+
+def _clase(elem):
+    """data-class de un <g> de Verovio (o la primera palabra de class)."""
+    clase = elem.get("data-class")
+    if clase is None:
+        clase = (elem.get("class") or "").split(" ", 1)[0]
+    return clase
+
+
+def _translate(elem):
+    m = _TRANSLATE.search(elem.get("transform") or "")
+    return {'x': float(m.group(1)), 'y': float(m.group(2))} if m else None
+
+
+def coordenadas_nota(nota_g):
+    """Posicion de la cabeza de una <g class="note"> de Verovio, o None."""
+    for hijo in nota_g:
+        if hijo.tag == _G and _clase(hijo) == "notehead":
+            use = hijo.find(_USE)
+            if use is not None:
+                x, y = use.get('x'), use.get('y')
+                if x and y:
+                    return {'x': float(x), 'y': float(y)}
+                # Verovio 4/5+: posicion en transform="translate(x,y) ..." del <use>.
+                coords = _translate(use)
+                if coords:
+                    return coords
+            break
+    return _translate(nota_g)
+
+
+def indexar_notas(svg_root):
+    """Mapa id -> {"x", "y", "pentagrama", "compas"} de todas las notas del SVG."""
+    indice = {}
+    compases = [0]
+
+    def recorrer(elem, compas, pentagrama):
+        n_pentagrama = 0
+        for hijo in elem:
+            if hijo.tag != _G:
+                if len(hijo):  # <svg> anidado (definition-scale, page-margin...)
+                    recorrer(hijo, compas, pentagrama)
+                continue
+            clase = _clase(hijo)
+            if clase == "measure":
+                compases[0] += 1
+                recorrer(hijo, compases[0], None)
+            elif clase == "staff":
+                n_pentagrama += 1
+                recorrer(hijo, compas, n_pentagrama)
+            elif clase == "note":
+                id_nota = hijo.get("data-id") or hijo.get("id")
+                coords = coordenadas_nota(hijo)
+                if id_nota and coords:
+                    coords.update(pentagrama=pentagrama, compas=compas)
+                    indice.setdefault(id_nota, coords)
+            else:
+                recorrer(hijo, compas, pentagrama)
+
+    recorrer(svg_root, None, None)
+    return indice
@@ -0,0 +1,266 @@
+# lector_musicxml.py - Lector rapido de MusicXML para ejercicios de especie.
+#
+# Un ejercicio de especie son dos partes monofonicas de redondas y blancas:
+# converter.parse de music21 construye para ellas el grafo completo de objetos y
+# el pipeline lo vuelve a serializar a MusicXML para Verovio. leer_musicxml recorre
+# el documento una vez con iterparse y, por parte, saca id, nombre, alturas,
+# duraciones, silencios, compases e indicacion de compas directamente al modelo
+# del analisis (analisis_musical_comun.voces); los ids de nota se escriben en el
+# mismo arbol, que se serializa tal cual para Verovio (Partitura.musicxml).
+#
+# Solo admite lo que aparece en un ejercicio de especie: score-partwise, una voz
+# por parte en un pentagrama, notas con altura o silencios, compases completos
+# con la indicacion de compas al principio. Ante cualquier otra cosa (acordes,
+# notas de adorno, tresillos, varias voces, anacrusa, .mxl comprimido...) lanza
+# LecturaNoSoportada y el llamador vuelve a converter.parse.
+#
+# Usa xml.etree (libreria estandar): no anade dependencias.
+
+import io
+import re
+import xml.etree.ElementTree as ET
+from fractions import Fraction
+
+from analisis_musical_comun.voces import Figura, Nota, Voz
+
+_SEMITONOS = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+_GRADOS = {"C": 0, "D": 1, "E": 2, "F": 3, "G": 4, "A": 5, "B": 6}
+_ALTERACIONES = {-2: "--", -1: "-", 0: "", 1: "#", 2: "##"}  # como pitch.name de music21
+
+# Hijos de <measure> y de <note> que cambian el tiempo o las voces: no soportados.
+_MEDIDA_NO_SOPORTADA = {"backup", "forward", "harmony", "figured-bass"}
+_NOTA_NO_SOPORTADA = {"chord", "grace", "cue", "unpitched", "time-modification"}
+
+_COMPASES = {}  # "4/4" -> meter.TimeSignature (solo para el pulso)
+_PULSOS = {}    # ("4/4", offset en el compas) -> beat
+
+
+class LecturaNoSoportada(Exception):
+    """El documento necesita el parser completo de music21 (el mensaje dice por que)."""
+
+
+class Partitura:
+    """Voces leidas (en el orden del documento) y arbol MusicXML con los ids de nota."""
+
+    def __init__(self, raiz, voces):
+        self.raiz = raiz
+        self.voces = voces
+
+    def musicxml(self, orden=None):
+        """MusicXML para Verovio; orden: indices de las voces de arriba abajo (None: el del documento)."""
+        if orden is not None and list(orden) != list(range(len(self.voces))):
+            lista = self.raiz.find("part-list")
+            for padre, hijos in ((lista, lista.findall("score-part")), (self.raiz, self.raiz.findall("part"))):
+                posiciones = [list(padre).index(h) for h in hijos]
+                for posicion, i in zip(posiciones, orden):
+                    padre[posicion] = hijos[i]
+        return '<?xml version="1.0" encoding="utf-8"?>\n' + ET.tostring(self.raiz, encoding="unicode")
+
+
+def prefijo_ids(part_id):
+    """Prefijo de los ids de nota de una parte: un xml:id valido (ver cli_runner._asignar_ids_notas)."""
+    prefijo = re.sub(r"[^A-Za-z0-9_-]", "_", str(part_id))
+    if not prefijo or not (prefijo[0].isalpha() or prefijo[0] == "_"):
+        prefijo = f"p_{prefijo}"
+    return prefijo
+
+
+def _texto(elem, ruta):
+    hijo = elem.find(ruta)
+    return hijo.text.strip() if hijo is not None and hijo.text else None
+
+
+def _entero(texto, que):
+    try:
+        return int(texto)
+    except (TypeError, ValueError):
+        raise LecturaNoSoportada(f"{que} no valido: {texto!r}")
+
+
+def _fraccion(valor):
+    """Como common.opFrac de music21: float si es exacto en binario, si no Fraction."""
+    if valor.denominator & (valor.denominator - 1) == 0:
+        return float(valor)
+    return valor
+
+
+def _compas(beats, tipo):
+    clave = f"{beats}/{tipo}"
+    if clave not in _COMPASES:
+        from music21 import meter
+        _COMPASES[clave] = meter.TimeSignature(clave)
+    return clave
+
+
+def _pulso(compas, offset):
+    """Beat de music21 (TimeSignature.getBeatProportion) para un offset dentro del compas."""
+    clave = (compas, offset)
+    if clave not in _PULSOS:
+        _PULSOS[clave] = _COMPASES[compas].getBeatProportion(offset)
+    return _PULSOS[clave]
+
+
+def _altura(nota):
+    pitch = nota.find("pitch")
+    paso, octava = _texto(pitch, "step"), _texto(pitch, "octave")
+    if paso not in _SEMITONOS:
+        raise LecturaNoSoportada(f"altura no valida: {paso!r}")
+    octava = _entero(octava, "octava")
+    alter = _texto(pitch, "alter")
+    if alter is None:
+        alter = 0
+    else:
+        try:
+            alter = float(alter)
+        except ValueError:
+            raise LecturaNoSoportada(f"alteracion no valida: {alter!r}")
+        if alter != int(alter) or int(alter) not in _ALTERACIONES:
+            raise LecturaNoSoportada(f"alteracion no soportada: {alter}")
+        alter = int(alter)
+    ps = float((octava + 1) * 12 + _SEMITONOS[paso] + alter)
+    diatonico = octava * 7 + _GRADOS[paso] + 1
+    return ps, diatonico, f"{paso}{_ALTERACIONES[alter]}{octava}"
+
+
+class _LectorParte:
+    """Estado de la lectura de una <part>: divisiones, compas vigente y notas."""
+
+    def __init__(self, part_id, nombre):
+        self.id = part_id
+        self.nombre = nombre
+        self.prefijo = prefijo_ids(part_id)
+        self.notas, self.inicio = [], []
+        self.divisiones = None
+        self.ts = None         # indicacion de compas vigente ("4/4")
+        self.offset = 0.0      # offset absoluto del compas en curso
+        self.voz = None
+
+    def atributos(self, attrs, local):
+        for hijo in attrs:
+            if hijo.tag == "divisions":
+                self.divisiones = _entero(hijo.text, "divisions")
+                if self.divisiones <= 0:
+                    raise LecturaNoSoportada("divisions no valido")
+            elif hijo.tag == "time":
+                if local != 0:
+                    raise LecturaNoSoportada("cambio de compas a mitad de compas")
+                beats, tipos = hijo.findall("beats"), hijo.findall("beat-type")
+                if hijo.find("senza-misura") is not None or len(beats) != 1 or len(tipos) != 1:
+                    raise LecturaNoSoportada("indicacion de compas no soportada")
+                self.ts = _compas(_entero(beats[0].text, "beats"), _entero(tipos[0].text, "beat-type"))
+            elif hijo.tag == "staves" and _entero(hijo.text, "staves") != 1:
+                raise LecturaNoSoportada("parte en varios pentagramas")
+            elif hijo.tag in ("transpose", "measure-style"):
+                raise LecturaNoSoportada(f"<{hijo.tag}> no soportado")
+
+    def medida(self, medida):
+        numero = medida.get("number", "")
+        if not numero.isdigit() or medida.get("implicit") == "yes":
+            raise LecturaNoSoportada(f"compas {numero!r}: numeracion no soportada")
+        numero = int(numero)
+        local = Fraction(0)
+        for hijo in medida:
+            if hijo.tag == "attributes":
+                self.atributos(hijo, local)
+            elif hijo.tag == "note":
+                local += self.nota(hijo, numero, local)
+            elif hijo.tag in _MEDIDA_NO_SOPORTADA:
+                raise LecturaNoSoportada(f"compas {numero}: <{hijo.tag}> no soportado")
+        if self.ts is None:
+            raise LecturaNoSoportada("sin indicacion de compas")
+        # Solo compases completos: music21 trata los incompletos como anacrusa o con relleno.
+        if _fraccion(local) != _COMPASES[self.ts].barDuration.quarterLength:
+            raise LecturaNoSoportada(f"compas {numero} incompleto o desbordado")
+        self.offset = _fraccion(Fraction(self.offset) + local)
+
+    def nota(self, nota, numero, local):
+        for hijo in nota:
+            if hijo.tag in _NOTA_NO_SOPORTADA:
+                raise LecturaNoSoportada(f"compas {numero}: <{hijo.tag}> no soportado")
+        staff, voz = _texto(nota, "staff"), _texto(nota, "voice") or "1"
+        if staff not in (None, "1"):
+            raise LecturaNoSoportada(f"compas {numero}: nota en el pentagrama {staff}")
+        if self.voz is None:
+            self.voz = voz
+        elif voz != self.voz:
+            raise LecturaNoSoportada(f"compas {numero}: varias voces en una parte")
+        if self.divisiones is None or self.ts is None:
+            raise LecturaNoSoportada("nota antes de <divisions> o de la indicacion de compas")
+        duracion = Fraction(_entero(_texto(nota, "duration"), "duration"), self.divisiones)
+        if duracion <= 0:
+            raise LecturaNoSoportada(f"compas {numero}: duracion no valida")
+        silencio = nota.find("rest") is not None
+        if not silencio and nota.find("pitch") is None:
+            raise LecturaNoSoportada(f"compas {numero}: nota sin altura")
+        quarter_length = _fraccion(duracion)
+        if len(self.inicio) < 2:
+            self.inicio.append(Figura("silencio" if silencio else "nota", quarter_length))
+        if silencio:
+            return duracion
+        tipo = _texto(nota, "type")
+        if tipo is None:
+            raise LecturaNoSoportada(f"compas {numero}: nota sin <type>")
+        ps, diatonico, nombre = _altura(nota)
+        nota_id = f"{self.prefijo}_n{len(self.notas)}"
+        nota.set("id", nota_id)
+        offset_local = _fraccion(local)
+        self.notas.append(Nota(nota_id, ps, diatonico, nombre,
+                               _fraccion(Fraction(self.offset) + local), quarter_length,
+                               tipo, _pulso(self.ts, offset_local), numero))
+        return duracion
+
+    def voz_compacta(self):
+        return Voz(self.id, self.nombre, self.notas, tuple(self.inicio))
+
+
+def leer_musicxml(origen):
+    """Partitura de una ruta o de los bytes de un MusicXML sin comprimir.
+
+    LecturaNoSoportada si el documento tiene algo que el lector no cubre (o no es
+    MusicXML bien formado): el llamador debe usar converter.parse.
+    """
+    if isinstance(origen, (bytes, bytearray)):
+        datos = bytes(origen)
+    else:
+        with open(origen, "rb") as f:
+            datos = f.read()
+    if datos[:2] == b"PK":
+        raise LecturaNoSoportada("MusicXML comprimido (.mxl)")
+
+    nombres, lectores, voces = {}, {}, []
+    raiz = lector = None
+    try:
+        for evento, elem in ET.iterparse(io.BytesIO(datos), events=("start", "end")):
+            if evento == "start":
+                if raiz is None:
+                    raiz = elem
+                    if elem.tag != "score-partwise":
+                        raise LecturaNoSoportada(f"raiz <{elem.tag}> no soportada")
+                elif elem.tag == "part":
+                    part_id = elem.get("id")
+                    if part_id not in nombres:
+                        raise LecturaNoSoportada(f"parte {part_id!r} sin <score-part>")
+                    nombre = nombres[part_id]
+                    # music21 usa el nombre como id de la parte; sin nombre, cli_runner
+                    # (_normalizar_part_ids) le pone part_<indice>.
+                    lector = _LectorParte(nombre or f"part_{len(voces)}", nombre)
+                continue
+            if elem.tag == "score-part":
+                nombre = _texto(elem, "part-name")
+                if not nombre and (elem.find("part-abbreviation") is not None
+                                   or elem.find("score-instrument") is not None):
+                    # Sin nombre, el id de music21 saldria del instrumento (Instrument.bestName).
+                    raise LecturaNoSoportada("parte sin <part-name> con instrumento")
+                nombres[elem.get("id")] = nombre.replace("\n", " ") if nombre else None
+            elif elem.tag == "measure" and lector is not None:
+                lector.medida(elem)
+            elif elem.tag == "part" and lector is not None:
+                voces.append(lector.voz_compacta())
+                lector = None
+    except ET.ParseError as e:
+        raise LecturaNoSoportada(f"XML no valido: {e}")
+    if not voces:
+        raise LecturaNoSoportada("sin partes")
+    if len(voces) != len(nombres):
+        raise LecturaNoSoportada("<part-list> y las partes no coinciden")
+    return Partitura(raiz, voces)
@@ -0,0 +1,126 @@
+# lote_zip.py - Lectura del ZIP de un lote y escritura en streaming del ZIP de resultados.
+#
+# POST /analyze/batch recibe un ZIP con los MusicXML de una clase y devuelve otro
+# ZIP con el PDF anotado y el informe de cada ejercicio y un resumen.json. Para
+# que la memoria no dependa del tamano del lote:
+#   - del ZIP subido (ya en disco) se extrae cada ejercicio solo cuando le toca
+#     entrar en el pool (extraer);
+#   - el ZIP de salida se escribe sobre un buffer que no admite seek (SalidaZip):
+#     zipfile usa entonces descriptores de datos tras cada entrada y no necesita
+#     volver atras. Cada entrada anadida devuelve sus bytes ya comprimidos, que la
+#     API envia y olvida; el buffer nunca guarda mas que la ultima entrada.
+# Los nombres dentro del ZIP de salida conservan las carpetas del ZIP subido.
+# Limites (los fija la API): la subida se copia con un tope de bytes y cada
+# ejercicio se rechaza si su tamano declarado (file_size) o lo que realmente
+# descomprime supera el maximo; asi un ZIP pequeno no puede llenar el disco.
+
+import posixpath
+import re
+import shutil
+import zipfile
+
+from cli_runner import EXTENSIONES_MUSICXML
+
+RESUMEN = "resumen.json"
+_BLOQUE = 1024 * 1024
+
+
+class LimiteExcedido(ValueError):
+    """Un archivo supera el maximo de bytes permitido."""
+
+
+def copiar_limitado(origen, destino, max_bytes):
+    """Copia por bloques; LimiteExcedido en cuanto se pasaria de max_bytes. Devuelve los bytes copiados."""
+    copiados = 0
+    while True:
+        bloque = origen.read(min(_BLOQUE, max_bytes - copiados + 1))
+        if not bloque:
+            return copiados
+        copiados += len(bloque)
+        if copiados > max_bytes:
+            raise LimiteExcedido(f"supera {max_bytes} bytes")
+        destino.write(bloque)
+
+
+class SalidaZip:
+    """Destino de zipfile sin seek: acumula lo escrito hasta que se recoge."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def write(self, datos):
+        self._buffer += datos
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def recoger(self):
+        datos = bytes(self._buffer)
+        self._buffer.clear()
+        return datos
+
+
+class EscritorZip:
+    """ZIP de resultados escrito entrada a entrada; cada metodo devuelve los bytes a enviar."""
+
+    def __init__(self):
+        self._salida = SalidaZip()
+        self._zip = zipfile.ZipFile(self._salida, "w", compression=zipfile.ZIP_DEFLATED)
+
+    def anadir_archivo(self, nombre, ruta):
+        with open(ruta, "rb") as origen, self._zip.open(nombre, "w", force_zip64=True) as destino:
+            shutil.copyfileobj(origen, destino, _BLOQUE)
+        return self._salida.recoger()
+
+    def anadir_bytes(self, nombre, datos):
+        self._zip.writestr(nombre, datos)
+        return self._salida.recoger()
+
+    def cerrar(self):
+        """Directorio central: lo ultimo del ZIP."""
+        self._zip.close()
+        return self._salida.recoger()
+
+
+def _nombre_seguro(nombre):
+    """Ruta relativa y limpia de un miembro del ZIP ('' si no queda nada util)."""
+    partes = [re.sub(r"[^\w .-]", "_", p).strip() for p in nombre.replace("\\", "/").split("/")]
+    partes = [p for p in partes if p not in ("", ".", "..")]
+    return posixpath.join(*partes) if partes else ""
+
+
+def ejercicios(zf):
+    """(ZipInfo, base de los nombres de salida) de cada MusicXML del ZIP, en su orden.
+
+    Se ignoran carpetas, archivos ocultos y los metadatos de macOS (__MACOSX). La
+    base es la ruta sin extension ('grupo_a/ana'); si dos ejercicios darian la misma
+    (ana.xml y ana.musicxml), el segundo lleva un sufijo _2, _3...
+    """
+    vistos, resultado = set(), []
+    for info in zf.infolist():
+        if info.is_dir() or not info.filename.lower().endswith(EXTENSIONES_MUSICXML):
+            continue
+        partes = info.filename.replace("\\", "/").split("/")
+        if "__MACOSX" in partes or partes[-1].startswith("."):
+            continue
+        base = posixpath.splitext(_nombre_seguro(info.filename))[0] or "ejercicio"
+        candidata, n = base, 1
+        while candidata.lower() in vistos:
+            n += 1
+            candidata = f"{base}_{n}"
+        vistos.add(candidata.lower())
+        resultado.append((info, candidata))
+    return resultado
+
+
+def extraer(zf, info, destino, max_bytes):
+    """Copia un miembro del ZIP a la ruta destino por bloques, sin pasar de max_bytes.
+
+    LimiteExcedido si el tamano declarado ya lo supera (no se descomprime nada) o si
+    al descomprimir sale mas de lo declarado y del maximo.
+    """
+    if info.file_size > max_bytes:
+        raise LimiteExcedido(f"{info.file_size} bytes declarados, maximo {max_bytes}")
+    with zf.open(info) as origen, open(destino, "wb") as salida:
+        return copiar_limitado(origen, salida, max_bytes)
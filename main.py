@@ -3,21 +3,168 @@
 # Envuelve el core engine desacoplado (cli_runner.py) en una API HTTP.
 # Arranque:  uvicorn main:app --reload
 
+import asyncio
+import collections
+import concurrent.futures
+import json
+import logging
+import mimetypes
+import multiprocessing
 import os
+import posixpath
+import re
 import secrets
 import shutil
-import tempfile
+import zipfile
+import zlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request
+from fastapi import Body, FastAPI, File, UploadFile, Form, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 
 import cli_runner
+import lote_zip
+import sesiones
+import verovio_pdf
+from almacen_artefactos import AlmacenArtefactos
+from cache_resultados import CacheResultados, clave_contenido
+from metricas import PROGRESO_ETAPAS, RegistroMetricas
+
+# Cola de trabajos: el pipeline (music21 + Verovio + PDF) es bloqueante y se
+# ejecuta en un pool de procesos, nunca en el event loop. El numero de workers
+# se configura con CONTRAPUNTO_WORKERS (por defecto: numero de CPUs) y los
+# trabajos sin terminar se limitan con CONTRAPUNTO_MAX_PENDIENTES.
+WORKERS = int(os.environ.get("CONTRAPUNTO_WORKERS") or os.cpu_count() or 1)
+MAX_PENDIENTES = int(os.environ.get("CONTRAPUNTO_MAX_PENDIENTES") or WORKERS * 8)
+# Cache de resultados por contenido: limite de entradas.
+CACHE_ENTRADAS = int(os.environ.get("CONTRAPUNTO_CACHE_ENTRADAS") or 256)
+# Artefactos en disco (directorios de trabajo y PDFs descargables): caducidad en
+# horas sin uso, presupuesto total en MB e intervalo del barrido en segundos.
+ARTEFACTOS_DIR = os.environ.get("CONTRAPUNTO_ARTEFACTOS_DIR") or None
+TTL_H = float(os.environ.get("CONTRAPUNTO_TTL_H") or 24)
+DISCO_MB = int(os.environ.get("CONTRAPUNTO_DISCO_MB") or 1024)
+BARRIDO_S = float(os.environ.get("CONTRAPUNTO_BARRIDO_S") or 60)
+# Lotes (POST /analyze/batch): MB del ZIP subido y del total descomprimido de sus
+# ejercicios, numero maximo de ejercicios y MB maximos de cada uno.
+LOTE_MAX_MB = float(os.environ.get("CONTRAPUNTO_LOTE_MAX_MB") or 256)
+LOTE_MAX_ARCHIVOS = int(os.environ.get("CONTRAPUNTO_LOTE_MAX_ARCHIVOS") or 500)
+LOTE_EJERCICIO_MB = float(os.environ.get("CONTRAPUNTO_LOTE_EJERCICIO_MB") or 8)
+# Trabajos cuyo pipeline supera este umbral (s) se registran con su traza completa.
+LENTO_S = float(os.environ.get("CONTRAPUNTO_LENTO_S") or 10)
+# Sesiones de re-analisis incremental (sesiones.py) abiertas a la vez (LRU).
+SESIONES_MAX = int(os.environ.get("CONTRAPUNTO_SESIONES_MAX") or 64)
+# Eventos de progreso (GET /jobs/{id}/events): comentario keep-alive si no hay
+# cambios en este intervalo (s), para que proxies y navegadores no corten.
+KEEPALIVE_S = 15
+
+_log = logging.getLogger("contrapunto")
+
+_EJECUTOR: concurrent.futures.ProcessPoolExecutor | None = None
+# Las sesiones guardan estado (score, memo de reglas) entre peticiones: viven en
+# un proceso propio, fuera del event loop y del pool de trabajos.
+_EJECUTOR_SESIONES: concurrent.futures.ProcessPoolExecutor | None = None
+# Progreso de los trabajos: los workers dejan (job_id, etapa) en esta cola sin
+# esperar (cli_runner.iniciar_worker); una tarea del lifespan la vacia en el event
+# loop y despierta a los clientes de /jobs/{id}/events.
+_BUCLE: asyncio.AbstractEventLoop | None = None
+
+
+def _crear_ejecutor_sesiones() -> concurrent.futures.ProcessPoolExecutor:
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=1, initializer=sesiones.iniciar_proceso, initargs=(SESIONES_MAX,))
+
+
+async def _recibir_progreso(cola) -> None:
+    """Tarea de fondo: pasa a cada trabajo las etapas que avisan los workers."""
+    while True:
+        evento = await asyncio.to_thread(cola.get)
+        if evento is None:
+            return
+        job_id, etapa = evento
+        trabajo = _TRABAJOS.get(job_id)
+        if trabajo is None:
+            continue
+        porcentaje = PROGRESO_ETAPAS.get(etapa, 0)
+        if porcentaje < trabajo["progreso"]["porcentaje"]:
+            continue  # etapa que se repite (p. ej. parseo tras el lector rapido): no retrocede
+        trabajo["progreso"] = {"etapa": etapa, "porcentaje": porcentaje}
+        _despertar(trabajo)
+
+
+def _despertar(trabajo: dict) -> None:
+    """Avisa a los clientes de /jobs/{id}/events del trabajo (solo desde el event loop)."""
+    for oyente in trabajo["oyentes"]:
+        oyente.set()
+
+
+def _en_bucle(funcion, *args) -> None:
+    """Ejecuta funcion(*args) en el event loop: ya, si se llama desde el; si no, la encola.
+
+    El estado de la API (_TRABAJOS, _CACHE, metricas) solo se toca desde el event
+    loop; los callbacks de los futures del pool y el barrido en un hilo pasan por aqui.
+    """
+    bucle = _BUCLE
+    try:
+        en_el_bucle = asyncio.get_running_loop() is bucle
+    except RuntimeError:
+        en_el_bucle = False
+    if bucle is None or en_el_bucle:
+        funcion(*args)
+    else:
+        bucle.call_soon_threadsafe(funcion, *args)
+
+
+def _en_hilo(funcion, *args) -> None:
+    """Lanza funcion(*args) en un hilo sin esperarla: borrados de disco pedidos desde el event loop."""
+    try:
+        asyncio.get_running_loop().run_in_executor(None, funcion, *args)
+    except RuntimeError:
+        funcion(*args)
+
+
+async def _barrer_periodicamente():
+    """Tarea de fondo: expulsa artefactos caducados o por encima de la cuota.
+
+    El borrado de directorios va en un hilo; los avisos de expulsion
+    (_olvidar_trabajo) vuelven al event loop por _en_bucle.
+    """
+    while True:
+        await asyncio.sleep(BARRIDO_S)
+        await asyncio.to_thread(_ALMACEN.barrer)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _EJECUTOR, _EJECUTOR_SESIONES, _BUCLE
+    # Directorios de un arranque anterior: sus trabajos ya no existen.
+    _ALMACEN.limpiar_huerfanos()
+    # Cada worker precalienta sus toolkits de Verovio al arrancar y recibe la
+    # cola en la que avisa del progreso de sus trabajos.
+    cola_progreso = multiprocessing.Queue()
+    _BUCLE = asyncio.get_running_loop()
+    _EJECUTOR = concurrent.futures.ProcessPoolExecutor(
+        max_workers=WORKERS, initializer=cli_runner.iniciar_worker, initargs=(cola_progreso,))
+    _EJECUTOR_SESIONES = _crear_ejecutor_sesiones()
+    barrido = asyncio.create_task(_barrer_periodicamente())
+    progreso = asyncio.create_task(_recibir_progreso(cola_progreso))
+    try:
+        yield
+    finally:
+        barrido.cancel()
+        cola_progreso.put(None)  # termina _recibir_progreso (y su hilo bloqueado en get)
+        progreso.cancel()
+        _EJECUTOR.shutdown(wait=False, cancel_futures=True)
+        _EJECUTOR_SESIONES.shutdown(wait=False, cancel_futures=True)
+        _EJECUTOR = _EJECUTOR_SESIONES = _BUCLE = None
+
 
 app = FastAPI(
     title="Asistente de Contrapunto API",
     description="Analiza ejercicios de contrapunto (MusicXML) y devuelve PDFs anotados.",
     version="2.0.0",
+    lifespan=lifespan,
 )
 
 # CORS abierto: permite que el futuro frontend local consuma la API sin fricciones.
@@ -29,87 +176,723 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Procesadores disponibles por especie.
-PROCESADORES = {
-    "primera": cli_runner.procesar_primera,
-    "segunda": cli_runner.procesar_segunda,
-}
+ESPECIES = ["primera", "segunda"]
 
-# Registro efimero token -> ruta de PDF (en memoria; se pierde al reiniciar el
-# proceso). Suficiente para el uso local monomaquina: convierte rutas de servidor
-# en URLs descargables sin exponer el filesystem.
-_PDF_REGISTRY: dict[str, str] = {}
+# Salidas de la partitura anotada: raster (resvg -> PNG) o vectorial.
+MODOS_PDF = list(verovio_pdf.MODOS_PDF)
 
+# Registro efimero job_id -> trabajo (future del pool + datos de la peticion).
+# El job_id es tambien el id de su directorio en el almacen de artefactos.
+_TRABAJOS: dict[str, dict] = {}
 
-def _registrar_descarga(path: str) -> str:
-    token = secrets.token_urlsafe(16)
-    _PDF_REGISTRY[token] = path
-    return token
 
+def _olvidar_trabajo(job_id: str) -> None:
+    """El almacen expulso el directorio del trabajo: deja de existir para la API (en el event loop)."""
+    trabajo = _TRABAJOS.pop(job_id, None)
+    if trabajo is not None:
+        _CACHE.descartar(trabajo["clave"], trabajo)
 
-@app.get("/")
-def health():
-    return {"status": "ok", "service": "asistente-contrapunto", "especies": list(PROCESADORES)}
 
+def _expulsar_de_cache(trabajo: dict) -> None:
+    """La cache ya no guarda este resultado: se borran sus artefactos (en un hilo)."""
+    _en_hilo(_ALMACEN.eliminar, trabajo["job_id"], "cache")
 
-@app.get("/download/{token}")
-def download(token: str):
-    path = _PDF_REGISTRY.get(token)
-    if not path or not os.path.exists(path):
-        raise HTTPException(status_code=404, detail="Documento no encontrado o expirado.")
-    return FileResponse(path, media_type="application/pdf", filename=os.path.basename(path))
 
+# Los tokens de descarga (token -> PDF) viven en el almacen y caducan con su
+# directorio: convierten rutas de servidor en URLs sin exponer el filesystem.
+_ALMACEN = AlmacenArtefactos(ARTEFACTOS_DIR, ttl_s=TTL_H * 3600, max_bytes=DISCO_MB * 1024 * 1024,
+                             al_expulsar=lambda job_id: _en_bucle(_olvidar_trabajo, job_id))
+_CACHE = CacheResultados(CACHE_ENTRADAS, al_expulsar=_expulsar_de_cache)
+
+
+# Analisis en memoria (POST /analyze/pdf) y ejercicios de lotes (POST /analyze/batch)
+# en curso: no tienen job_id pero ocupan el pool y cuentan para MAX_PENDIENTES. Solo se modifica desde el event loop.
+_DIRECTOS = 0
+
+
+def _pendientes() -> int:
+    return _DIRECTOS + sum(1 for t in _TRABAJOS.values() if not t["future"].done())
+
+
+# Metricas de la API (GET /metrics). Las de trabajos se registran al terminar cada
+# uno; las de cola, cache y almacen se leen en el momento del scrape.
+_METRICAS = RegistroMetricas()
+_METRICAS.declarar("contrapunto_etapa_segundos", "histogram",
+                   "Duracion de cada etapa del pipeline por especie.")
+_METRICAS.declarar("contrapunto_capa_segundos", "histogram",
+                   "Duracion de cada capa de anotacion (subetapa de anotacion) por especie.")
+_METRICAS.declarar("contrapunto_regla_segundos", "histogram",
+                   "Tiempo de cada regla del registro (subetapa de reglas) por especie.")
+_METRICAS.declarar("contrapunto_trabajo_segundos", "histogram",
+                   "Duracion total del pipeline por especie y modo de PDF.")
+_METRICAS.declarar("contrapunto_trabajos_total", "counter",
+                   "Trabajos terminados por especie, ruta (cola/memoria) y estado (ok/error/caido).")
+_METRICAS.declarar("contrapunto_trabajos_lentos_total", "counter",
+                   "Trabajos por encima de CONTRAPUNTO_LENTO_S.")
+_METRICAS.declarar("contrapunto_cola_pendientes", "gauge", "Trabajos en cola o en ejecucion.")
+_METRICAS.declarar("contrapunto_workers", "gauge", "Procesos del pool de analisis.")
+_METRICAS.declarar("contrapunto_cache_consultas_total", "counter",
+                   "Consultas a la cache de resultados por resultado (acierto/fallo).")
+_METRICAS.declarar("contrapunto_cache_tasa_aciertos", "gauge",
+                   "Aciertos / consultas de la cache de resultados.")
+_METRICAS.declarar("contrapunto_cache_partituras_consultas_total", "counter",
+                   "Consultas de los workers a la cache de partituras de music21 (acierto/fallo).")
+_METRICAS.declarar("contrapunto_cache_partituras_bytes", "gauge",
+                   "Bytes en disco de la cache de partituras de music21.")
+_METRICAS.declarar("contrapunto_artefactos_bytes", "gauge", "Bytes en disco del almacen de artefactos.")
+_METRICAS.declarar("contrapunto_artefactos_entradas", "gauge", "Directorios de trabajo en el almacen.")
+_METRICAS.declarar("contrapunto_artefactos_expulsiones_total", "counter",
+                   "Directorios expulsados del almacen por motivo.")
+
+# Aciertos y fallos de la cache de partituras (cache_partituras.py) en los workers:
+# cada trabajo dice en su fila si la consulto ("cache_partitura").
+_CONSULTAS_PARTITURAS = {"acierto": 0, "fallo": 0}
+
+# Ultimos trabajos lentos con su arbol de spans (tambien van al log).
+_LENTOS: collections.deque = collections.deque(maxlen=20)
 
-@app.post("/analyze/")
-async def analyze(request: Request, file: UploadFile = File(...), especie: str = Form(...)):
+
+def _registrar_metricas(fila: dict, especie: str, modo_pdf: str, ruta: str) -> None:
+    """Cuenta un trabajo terminado y observa sus etapas; avisa si fue lento (solo desde el event loop)."""
+    _METRICAS.contar("contrapunto_trabajos_total", especie=especie, ruta=ruta, estado=fila["estado"])
+    consulta = fila.get("cache_partitura")
+    if consulta in _CONSULTAS_PARTITURAS:
+        _CONSULTAS_PARTITURAS[consulta] += 1
+        _METRICAS.contar("contrapunto_cache_partituras_consultas_total", resultado=consulta)
+    traza = fila.get("traza")
+    if not traza:
+        return
+    por_etapa: dict[str, float] = {}
+    for span in traza["hijos"]:
+        por_etapa[span["nombre"]] = por_etapa.get(span["nombre"], 0.0) + span["ms"] / 1000
+    for nombre, segundos in por_etapa.items():
+        _METRICAS.observar("contrapunto_etapa_segundos", segundos, etapa=nombre, especie=especie)
+    for span in traza["hijos"]:
+        for sub in span.get("hijos", []):
+            etapa_padre, parte = sub["nombre"].split(".", 1)
+            if etapa_padre == "anotacion":
+                _METRICAS.observar("contrapunto_capa_segundos", sub["ms"] / 1000, capa=parte, especie=especie)
+            elif etapa_padre == "reglas":
+                _METRICAS.observar("contrapunto_regla_segundos", sub["ms"] / 1000, regla=parte, especie=especie)
+    total = traza["ms"] / 1000
+    _METRICAS.observar("contrapunto_trabajo_segundos", total, especie=especie, modo_pdf=modo_pdf)
+    if total >= LENTO_S:
+        _METRICAS.contar("contrapunto_trabajos_lentos_total", especie=especie)
+        _LENTOS.append({"especie": especie, "modo_pdf": modo_pdf, "ruta": ruta, "traza": traza})
+        _log.warning("Trabajo lento (%.1f s, %s, %s): %s", total, especie, ruta, json.dumps(traza))
+
+
+def _al_terminar(trabajo: dict, fut: concurrent.futures.Future) -> None:
+    """Callback del future (hilo del pool): libera el directorio y pasa el resto al event loop."""
+    _ALMACEN.liberar(trabajo["job_id"])  # disco en este hilo; las expulsiones avisan por _en_bucle
+    _en_bucle(_terminar_en_bucle, trabajo, fut)
+
+
+def _terminar_en_bucle(trabajo: dict, fut: concurrent.futures.Future) -> None:
+    """Despierta a los oyentes del trabajo y registra sus metricas (en el event loop)."""
+    _despertar(trabajo)
+    if fut.cancelled():
+        return
+    fila = fut.result() if fut.exception() is None else {"estado": "caido"}
+    _registrar_metricas(fila, trabajo["especie"], trabajo["modo_pdf"], "cola")
+
+
+def _validar_parametros(especie: str, cf_index: int, modo_pdf: str) -> tuple[str, str]:
+    """Normaliza especie y modo_pdf; 422 si algun parametro no es valido."""
     especie = (especie or "").strip().lower()
-    if especie not in PROCESADORES:
+    if especie not in ESPECIES:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Especie no soportada: '{especie}'. Use {ESPECIES}.",
+        )
+    if cf_index not in (0, 1):
+        raise HTTPException(status_code=422, detail="cf_index debe ser 0 o 1.")
+    modo_pdf = (modo_pdf or "raster").strip().lower()
+    if modo_pdf not in MODOS_PDF:
         raise HTTPException(
             status_code=422,
-            detail=f"Especie no soportada: '{especie}'. Use {list(PROCESADORES)}.",
+            detail=f"Modo de PDF no soportado: '{modo_pdf}'. Use {MODOS_PDF}.",
         )
+    return especie, modo_pdf
+
 
-    # Directorio temporal aislado por peticion (no se borra: contiene los PDFs servibles).
-    work_dir = tempfile.mkdtemp(prefix="contrapunto_")
-    stem, ext = os.path.splitext(os.path.basename(file.filename or "ejercicio.musicxml"))
-    if ext.lower() not in (".xml", ".musicxml"):
-        ext = ".musicxml"
+def _validar_capas(capas: str, especie: str) -> list[str] | None:
+    """'intervalos,flechas' -> lista de capas (None: todas); 422 si alguna no existe."""
+    try:
+        return cli_runner.parsear_capas(capas, especie)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
 
-    input_path = os.path.join(work_dir, f"{stem}{ext}")
-    output_pdf = os.path.join(work_dir, f"{stem}_anotada.pdf")
-    report_pdf = f"{os.path.splitext(output_pdf)[0]}_informe.pdf"
 
-    # Guardar el archivo subido de forma segura.
+def _validar_reglas(sin_reglas: str, especie: str) -> list[str] | None:
+    """'cruce,nota_repetida' -> reglas desactivadas (None: ninguna); 422 si alguna no existe."""
     try:
+        return cli_runner.parsear_reglas(sin_reglas, especie)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+def _tokens_depuracion(job_id: str, directorio) -> dict:
+    """Un token de descarga por artefacto de depuracion del trabajo (vacio si no se pidio)."""
+    if not directorio or not os.path.isdir(directorio):
+        return {}
+    return {nombre: _ALMACEN.registrar_descarga(job_id, os.path.join(directorio, nombre))
+            for nombre in sorted(os.listdir(directorio))}
+
+
+def _estado_trabajo(trabajo: dict, base: str, traza: bool = False) -> dict:
+    """Traduce el future del pool al JSON de GET /jobs/{id} (con su traza si se pide)."""
+    fut = trabajo["future"]
+    respuesta = {"job_id": trabajo["job_id"], "especie": trabajo["especie"],
+                 "cf_index": trabajo["cf_index"], "modo_pdf": trabajo["modo_pdf"],
+                 "depuracion": trabajo["depuracion"], "capas": trabajo["capas"],
+                 "sin_reglas": trabajo["sin_reglas"]}
+    if not fut.done():
+        respuesta["status"] = "running" if fut.running() else "queued"
+        respuesta["progreso"] = dict(trabajo["progreso"])
+        return respuesta
+    if "resultado" not in trabajo:
+        try:
+            fila = fut.result()
+        except Exception as e:
+            fila = {"estado": "error", "salida": None,
+                    "mensaje": f"Worker caido: {type(e).__name__}: {e}"}
+        resultado = {"status": "error", "detail": fila["mensaje"] or "No se genero el PDF anotado.",
+                     "traza": fila.get("traza")}
+        if fila["estado"] == "ok":
+            ruta_pdf = fila["salida"]
+            report_pdf = f"{os.path.splitext(ruta_pdf)[0]}_informe.pdf"
+            report_exists = os.path.exists(report_pdf)
+            resultado = {
+                "status": "ok",
+                "annotated_token": _ALMACEN.registrar_descarga(trabajo["job_id"], ruta_pdf),
+                "report_token": (_ALMACEN.registrar_descarga(trabajo["job_id"], report_pdf)
+                                 if report_exists else None),
+                "errores": fila["errores"],
+                "diagnosticos": fila.get("diagnosticos"),
+                "tiempo_s": fila["tiempo_s"],
+                "traza": fila["traza"],
+                "debug_tokens": _tokens_depuracion(trabajo["job_id"], fila.get("depuracion")),
+                # Rutas de servidor conservadas solo para depuracion local.
+                "input_file": trabajo["input_file"],
+                "annotated_pdf": ruta_pdf,
+                "report_pdf": report_pdf if report_exists else None,
+            }
+        trabajo["resultado"] = resultado
+    resultado = dict(trabajo["resultado"])
+    if not traza:
+        resultado.pop("traza")
+    if resultado["status"] == "ok":
+        annotated_token = resultado.pop("annotated_token")
+        report_token = resultado.pop("report_token")
+        resultado["annotated_url"] = f"{base}/download/{annotated_token}"
+        resultado["report_url"] = f"{base}/download/{report_token}" if report_token else None
+        debug_tokens = resultado.pop("debug_tokens")
+        if debug_tokens:
+            resultado["debug_urls"] = {nombre: f"{base}/download/{token}"
+                                       for nombre, token in debug_tokens.items()}
+    respuesta.update(resultado)
+    return respuesta
+
+
+@app.get("/")
+def health():
+    return {"status": "ok", "service": "asistente-contrapunto", "especies": ESPECIES,
+            "modos_pdf": MODOS_PDF, "workers": WORKERS, "pendientes": _pendientes()}
+
+
+def _estadisticas_partituras() -> dict | None:
+    """Entradas y bytes en disco de la cache de partituras y consultas de los workers."""
+    cache = cli_runner.cache_partituras()
+    if cache is None:
+        return None
+    disco = cache.estadisticas()
+    return {"entradas": disco["entradas"], "bytes": disco["bytes"],
+            "aciertos": _CONSULTAS_PARTITURAS["acierto"], "fallos": _CONSULTAS_PARTITURAS["fallo"]}
+
+
+@app.get("/stats")
+def stats():
+    return {"trabajos": len(_TRABAJOS), "pendientes": _pendientes(),
+            "cache": _CACHE.estadisticas(), "artefactos": _ALMACEN.estadisticas(),
+            "cache_partituras": _estadisticas_partituras(), "lentos": list(_LENTOS)}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    cache, artefactos = _CACHE.estadisticas(), _ALMACEN.estadisticas()
+    consultas = cache["aciertos"] + cache["fallos"]
+    _METRICAS.fijar("contrapunto_cola_pendientes", _pendientes())
+    _METRICAS.fijar("contrapunto_workers", WORKERS)
+    _METRICAS.fijar("contrapunto_cache_consultas_total", cache["aciertos"], resultado="acierto")
+    _METRICAS.fijar("contrapunto_cache_consultas_total", cache["fallos"], resultado="fallo")
+    _METRICAS.fijar("contrapunto_cache_tasa_aciertos", cache["aciertos"] / consultas if consultas else 0)
+    _METRICAS.fijar("contrapunto_artefactos_bytes", artefactos["bytes"])
+    _METRICAS.fijar("contrapunto_artefactos_entradas", artefactos["entradas"])
+    for motivo, n in artefactos["expulsiones"].items():
+        _METRICAS.fijar("contrapunto_artefactos_expulsiones_total", n, motivo=motivo)
+    partituras = _estadisticas_partituras()
+    if partituras is not None:
+        _METRICAS.fijar("contrapunto_cache_partituras_bytes", partituras["bytes"])
+    return PlainTextResponse(_METRICAS.texto(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/download/{token}")
+def download(token: str):
+    path = _ALMACEN.resolver_descarga(token)
+    if not path:
+        raise HTTPException(status_code=404, detail="Documento no encontrado o expirado.")
+    media_type = "application/pdf" if path.endswith(".pdf") else (
+        mimetypes.guess_type(path)[0] or "application/octet-stream")
+    return FileResponse(path, media_type=media_type, filename=os.path.basename(path))
+
+
+@app.post("/analyze/", status_code=202)
+async def analyze(request: Request, response: Response, file: UploadFile = File(...),
+                  especie: str = Form(...), cf_index: int = Form(1),
+                  modo_pdf: str = Form("raster"), depuracion: bool = Form(False),
+                  capas: str = Form(""), sin_reglas: str = Form(""), traza: bool = False):
+    especie, modo_pdf = _validar_parametros(especie, cf_index, modo_pdf)
+    capas = _validar_capas(capas, especie)
+    sin_reglas = _validar_reglas(sin_reglas, especie)
+    try:
+        datos = await file.read()
+    finally:
+        await file.close()
+
+    # Mismo contenido y parametros -> mismo resultado (o el mismo trabajo en curso).
+    # En segunda especie el CF se detecta solo: cf_index no cambia la salida.
+    clave = clave_contenido(
+        datos, especie=especie, modo_pdf=modo_pdf,
+        cf_index=cf_index if especie == "primera" else None,
+        verovio=cli_runner.OPCIONES_VEROVIO[especie], depuracion=depuracion, capas=capas,
+        sin_reglas=sin_reglas,
+    )
+    trabajo = _CACHE.obtener(clave)
+    cache = "hit" if trabajo is not None else "miss"
+    if trabajo is not None:
+        _ALMACEN.tocar(trabajo["job_id"])
+    else:
+        if _pendientes() >= MAX_PENDIENTES:
+            raise HTTPException(status_code=503, detail="Cola de analisis llena. Reintente en unos segundos.")
+
+        # Directorio aislado por trabajo, gestionado por el almacen (TTL y cuota).
+        job_id, work_dir = _ALMACEN.crear()
+        stem, ext = os.path.splitext(os.path.basename(file.filename or "ejercicio.musicxml"))
+        if ext.lower() not in (".xml", ".musicxml"):
+            ext = ".musicxml"
+        input_path = os.path.join(work_dir, f"{stem}{ext}")
         with open(input_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+            buffer.write(datos)
+
+        # Encolar el pipeline del core engine; la respuesta sale de inmediato.
+        trabajo = {
+            "job_id": job_id,
+            "clave": clave,
+            "especie": especie,
+            "cf_index": cf_index,
+            "modo_pdf": modo_pdf,
+            "depuracion": depuracion,
+            "capas": capas,
+            "sin_reglas": sin_reglas,
+            "input_file": input_path,
+            "work_dir": work_dir,
+            "progreso": {"etapa": "cola", "porcentaje": 0},
+            "oyentes": set(),  # asyncio.Event de cada cliente de /jobs/{id}/events
+            "future": _EJECUTOR.submit(cli_runner.procesar_trabajo, input_path, work_dir,
+                                       especie, cf_index, modo_pdf=modo_pdf,
+                                       depurar=depuracion, capas=capas, sin_reglas=sin_reglas,
+                                       id_progreso=job_id),
+        }
+        _TRABAJOS[job_id] = trabajo
+        # Al terminar, el directorio deja de estar en uso (cuenta para la cuota) y
+        # el trabajo entra en las metricas.
+        trabajo["future"].add_done_callback(lambda f, t=trabajo: _al_terminar(t, f))
+        _CACHE.guardar(clave, trabajo)
+
+    base = str(request.base_url).rstrip("/")
+    estado = _estado_trabajo(trabajo, base, traza)
+    if estado["status"] == "ok":
+        response.status_code = 200
+    estado["job_url"] = f"{base}/jobs/{trabajo['job_id']}"
+    estado["cache"] = cache
+    return estado
+
+
+@app.get("/jobs/{job_id}")
+def job_status(request: Request, job_id: str, traza: bool = False):
+    trabajo = _TRABAJOS.get(job_id)
+    if trabajo is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado o expirado.")
+    return _estado_trabajo(trabajo, str(request.base_url).rstrip("/"), traza)
+
+
+def _evento_sse(nombre: str, datos: dict) -> str:
+    return f"event: {nombre}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(request: Request, job_id: str):
+    """Progreso del trabajo como Server-Sent Events.
+
+    Un evento `progreso` ({"etapa", "porcentaje"}) por cada etapa que empieza y, al
+    terminar, un evento `fin` con el mismo cuerpo que GET /jobs/{id} (URLs de
+    descarga o el error); despues se cierra el stream.
+    """
+    trabajo = _TRABAJOS.get(job_id)
+    if trabajo is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado o expirado.")
+    base = str(request.base_url).rstrip("/")
+
+    async def eventos():
+        oyente = asyncio.Event()
+        trabajo["oyentes"].add(oyente)
+        try:
+            enviado = None
+            while True:
+                oyente.clear()
+                if trabajo["future"].done():
+                    yield _evento_sse("fin", _estado_trabajo(trabajo, base))
+                    return
+                if trabajo["progreso"] != enviado:
+                    enviado = dict(trabajo["progreso"])
+                    yield _evento_sse("progreso", enviado)
+                try:
+                    await asyncio.wait_for(oyente.wait(), KEEPALIVE_S)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            trabajo["oyentes"].discard(oyente)
+
+    return StreamingResponse(eventos(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+DOCUMENTOS = ["anotada", "informe"]
+
+
+@app.post("/analyze/pdf")
+async def analyze_pdf(file: UploadFile = File(...), especie: str = Form(...),
+                      cf_index: int = Form(1), modo_pdf: str = Form("raster"),
+                      documento: str = Form("anotada"), capas: str = Form(""),
+                      sin_reglas: str = Form("")):
+    """Analiza la subida en memoria y devuelve el PDF en el cuerpo de la respuesta.
+
+    Sin cola ni archivos: los bytes subidos van al worker y el PDF vuelve como
+    bytes. No pasa por la cache ni deja nada descargable en el almacen.
+    """
+    global _DIRECTOS
+    especie, modo_pdf = _validar_parametros(especie, cf_index, modo_pdf)
+    capas = _validar_capas(capas, especie)
+    sin_reglas = _validar_reglas(sin_reglas, especie)
+    documento = (documento or "anotada").strip().lower()
+    if documento not in DOCUMENTOS:
+        raise HTTPException(status_code=422, detail=f"Documento no soportado: '{documento}'. Use {DOCUMENTOS}.")
+    try:
+        datos = await file.read()
     finally:
         await file.close()
 
-    # Ejecutar el pipeline del core engine.
+    if _pendientes() >= MAX_PENDIENTES:
+        raise HTTPException(status_code=503, detail="Cola de analisis llena. Reintente en unos segundos.")
+    _DIRECTOS += 1
     try:
-        procesar = PROCESADORES[especie]
-        ruta_pdf = procesar(input_path, output_pdf)
-    except ValueError as e:
+        resultado = await asyncio.wrap_future(_EJECUTOR.submit(
+            cli_runner.procesar_en_memoria, datos, especie, cf_index,
+            generar_reporte=documento == "informe", modo_pdf=modo_pdf, capas=capas,
+            sin_reglas=sin_reglas))
+    except Exception as e:
+        _registrar_metricas({"estado": "caido"}, especie, modo_pdf, "memoria")
+        raise HTTPException(status_code=500, detail=f"Worker caido: {type(e).__name__}: {e}")
+    finally:
+        _DIRECTOS -= 1
+    _registrar_metricas(resultado, especie, modo_pdf, "memoria")
+    if resultado["estado"] != "ok":
+        raise HTTPException(status_code=422, detail=resultado["mensaje"] or "No se genero el PDF anotado.")
+
+    stem = re.sub(r"[^A-Za-z0-9_.-]", "_", os.path.splitext(os.path.basename(file.filename or "ejercicio"))[0])
+    contenido = resultado["pdf"] if documento == "anotada" else resultado["informe"]
+    sufijo = "_anotada.pdf" if documento == "anotada" else "_anotada_informe.pdf"
+    return Response(contenido, media_type="application/pdf", headers={
+        "Content-Disposition": f'inline; filename="{stem}{sufijo}"',
+        "X-Contrapunto-Errores": str(resultado["errores"]),
+        "X-Contrapunto-Tiempo": str(resultado["tiempo_s"]),
+        "Server-Timing": ", ".join(f'{s["nombre"]};dur={s["ms"]}' for s in resultado["traza"]["hijos"]),
+    })
+
+
+def _descontar_directo() -> None:
+    global _DIRECTOS
+    _DIRECTOS -= 1
+
+
+def _fila_lote(nombre: str, fila: dict) -> dict:
+    """Fila de resumen.json: la del worker sin rutas de servidor ni traza."""
+    return {"archivo": nombre, "estado": fila["estado"], "errores": fila.get("errores"),
+            "diagnosticos": fila.get("diagnosticos"), "tiempo_s": fila.get("tiempo_s"), "mensaje": fila.get("mensaje", ""),
+            "anotada": None, "informe": None}
+
+
+@app.post("/analyze/batch")
+async def analyze_batch(file: UploadFile = File(...), especie: str = Form(...),
+                        cf_index: int = Form(1), modo_pdf: str = Form("raster"),
+                        capas: str = Form(""), sin_reglas: str = Form("")):
+    """Analiza todos los MusicXML de un ZIP y devuelve en streaming un ZIP de resultados.
+
+    Los ejercicios van al pool de a lo sumo WORKERS a la vez y cada uno entra en la
+    respuesta (PDF anotado e informe) en cuanto termina; al final, resumen.json con
+    una fila por ejercicio en el orden del ZIP subido. Ni la cache ni las descargas
+    intervienen: el directorio del lote se borra al cerrar la respuesta, y mientras
+    dura lo que ocupa en disco cuenta para la cuota del almacen.
+    """
+    especie, modo_pdf = _validar_parametros(especie, cf_index, modo_pdf)
+    capas = _validar_capas(capas, especie)
+    sin_reglas = _validar_reglas(sin_reglas, especie)
+    if _pendientes() >= MAX_PENDIENTES:
+        await file.close()
+        raise HTTPException(status_code=503, detail="Cola de analisis llena. Reintente en unos segundos.")
+
+    # El ZIP subido pasa a disco por bloques; de ahi se extrae cada ejercicio al
+    # entrar en el pool, asi la memoria no crece con el numero de archivos.
+    max_lote = int(LOTE_MAX_MB * 1024 * 1024)
+    max_ejercicio = int(LOTE_EJERCICIO_MB * 1024 * 1024)
+    lote_id, lote_dir = _ALMACEN.crear()
+    ruta_zip = os.path.join(lote_dir, "entrada.zip")
+    try:
+        with open(ruta_zip, "wb") as destino:
+            await asyncio.to_thread(lote_zip.copiar_limitado, file.file, destino, max_lote)
+        zf = zipfile.ZipFile(ruta_zip)
+        lista = lote_zip.ejercicios(zf)
+    except lote_zip.LimiteExcedido:
+        await asyncio.to_thread(_ALMACEN.eliminar, lote_id, "lote")
+        raise HTTPException(status_code=413, detail=f"El ZIP supera el maximo de {LOTE_MAX_MB:g} MB.")
+    except zipfile.BadZipFile:
+        await asyncio.to_thread(_ALMACEN.eliminar, lote_id, "lote")
+        raise HTTPException(status_code=422, detail="El archivo subido no es un ZIP valido.")
+    finally:
+        await file.close()
+    error = None
+    if not lista:
+        error = 422, "El ZIP no contiene archivos MusicXML (.xml / .musicxml)."
+    elif len(lista) > LOTE_MAX_ARCHIVOS:
+        error = 413, f"El ZIP tiene {len(lista)} ejercicios; el maximo es {LOTE_MAX_ARCHIVOS}."
+    elif sum(info.file_size for info, _ in lista) > max_lote:
+        error = 413, f"Los ejercicios descomprimidos superan el maximo de {LOTE_MAX_MB:g} MB."
+    if error:
+        zf.close()
+        await asyncio.to_thread(_ALMACEN.eliminar, lote_id, "lote")
+        raise HTTPException(status_code=error[0], detail=error[1])
+    await asyncio.to_thread(_ALMACEN.medir, lote_id)
+
+    async def contenido():
+        bucle = asyncio.get_running_loop()
+        escritor = lote_zip.EscritorZip()
+        pendientes = iter(enumerate(lista))
+        en_curso: dict[asyncio.Future, tuple[int, str, str]] = {}
+        filas: list[dict | None] = [None] * len(lista)
+
+        async def enviar_siguiente() -> None:
+            """Extrae el siguiente ejercicio y lo manda al pool (ilegibles o demasiado grandes van al resumen)."""
+            global _DIRECTOS
+            for i, (info, base) in pendientes:
+                directorio = os.path.join(lote_dir, f"{i:05d}")
+                os.mkdir(directorio)
+                entrada = os.path.join(directorio, posixpath.basename(base) + posixpath.splitext(info.filename)[1])
+                try:
+                    await asyncio.to_thread(lote_zip.extraer, zf, info, entrada, max_ejercicio)
+                    break
+                except lote_zip.LimiteExcedido as e:
+                    mensaje = f"Ejercicio demasiado grande (maximo {LOTE_EJERCICIO_MB:g} MB): {e}"
+                except (zipfile.BadZipFile, zlib.error, NotImplementedError, RuntimeError) as e:
+                    mensaje = f"ZIP ilegible: {type(e).__name__}: {e}"
+                filas[i] = _fila_lote(info.filename, {"estado": "error", "mensaje": mensaje})
+                await asyncio.to_thread(shutil.rmtree, directorio, True)
+            else:
+                return
+            await asyncio.to_thread(_ALMACEN.medir, lote_id)
+            fut = _EJECUTOR.submit(cli_runner.procesar_trabajo, entrada, directorio, especie, cf_index,
+                                   modo_pdf=modo_pdf, capas=capas, sin_reglas=sin_reglas)
+            _DIRECTOS += 1
+            # Cuenta como pendiente hasta que el worker acaba de verdad (tambien si
+            # el cliente se desconecta y el lote se abandona).
+            fut.add_done_callback(lambda f: bucle.call_soon_threadsafe(_descontar_directo))
+            en_curso[asyncio.wrap_future(fut)] = (i, base, directorio)
+
+        try:
+            for _ in range(min(WORKERS, len(lista))):
+                await enviar_siguiente()
+            while en_curso:
+                hechos, _ = await asyncio.wait(en_curso, return_when=asyncio.FIRST_COMPLETED)
+                for hecho in hechos:
+                    i, base, directorio = en_curso.pop(hecho)
+                    try:
+                        fila = hecho.result()
+                    except Exception as e:
+                        fila = {"estado": "error", "mensaje": f"Worker caido: {type(e).__name__}: {e}"}
+                    _registrar_metricas(fila, especie, modo_pdf, "lote")
+                    await asyncio.to_thread(_ALMACEN.medir, lote_id)  # PDFs del ejercicio
+                    filas[i] = _fila_lote(lista[i][0].filename, fila)
+                    if fila["estado"] == "ok":
+                        informe = f"{os.path.splitext(fila['salida'])[0]}_informe.pdf"
+                        for clave, ruta, sufijo in (("anotada", fila["salida"], "_anotada.pdf"),
+                                                    ("informe", informe, "_anotada_informe.pdf")):
+                            if os.path.exists(ruta):
+                                yield await asyncio.to_thread(escritor.anadir_archivo, base + sufijo, ruta)
+                                filas[i][clave] = base + sufijo
+                    await asyncio.to_thread(shutil.rmtree, directorio, True)
+                    await asyncio.to_thread(_ALMACEN.medir, lote_id)
+                    await enviar_siguiente()
+            resumen = json.dumps(filas, ensure_ascii=False, indent=2).encode("utf-8")
+            yield escritor.anadir_bytes(lote_zip.RESUMEN, resumen)
+            yield escritor.cerrar()
+        finally:
+            for pendiente in en_curso:
+                pendiente.cancel()  # los que aun no empezaron no llegan a ejecutarse
+            zf.close()
+            # Sin await: con el cliente desconectado la tarea ya esta cancelada.
+            _en_hilo(_ALMACEN.eliminar, lote_id, "lote")
+
+    stem = re.sub(r"[^A-Za-z0-9_.-]", "_", os.path.splitext(os.path.basename(file.filename or "lote"))[0])
+    return StreamingResponse(contenido(), media_type="application/zip", headers={
+        "Content-Disposition": f'attachment; filename="{stem}_resultados.zip"',
+        "X-Contrapunto-Archivos": str(len(lista)),
+    })
+
+
+# --- Sesiones de re-analisis incremental ---
+# session_id -> parametros, ultimo resultado y PDFs de la ultima version. El estado
+# del analisis (score, memo de reglas) vive en el proceso de sesiones.
+_SESIONES: "OrderedDict[str, dict]" = OrderedDict()
+
+
+async def _en_sesiones(session_id: str, funcion, *args):
+    """Ejecuta una operacion de sesiones.py en su proceso y traduce sus errores a HTTP."""
+    global _EJECUTOR_SESIONES
+    try:
+        return await asyncio.wrap_future(_EJECUTOR_SESIONES.submit(funcion, session_id, *args))
+    except sesiones.SesionNoEncontrada:
+        _SESIONES.pop(session_id, None)
+        raise HTTPException(status_code=404, detail="Sesion no encontrada o expirada.")
+    except sesiones.ParcheNoValido as e:
         raise HTTPException(status_code=422, detail=str(e))
+    except concurrent.futures.process.BrokenProcessPool as e:
+        # Las sesiones se pierden con su proceso: se empieza de cero.
+        _SESIONES.clear()
+        _EJECUTOR_SESIONES = _crear_ejecutor_sesiones()
+        raise HTTPException(status_code=500, detail=f"Proceso de sesiones caido: {e}")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error en el pipeline: {e}")
+        raise HTTPException(status_code=422, detail=f"{type(e).__name__}: {e}")
 
-    if not (ruta_pdf and os.path.exists(ruta_pdf)):
-        raise HTTPException(status_code=500, detail="No se genero el PDF anotado.")
 
-    annotated_token = _registrar_descarga(ruta_pdf)
-    report_exists = os.path.exists(report_pdf)
-    report_token = _registrar_descarga(report_pdf) if report_exists else None
+def _obtener_sesion(session_id: str) -> dict:
+    sesion = _SESIONES.get(session_id)
+    if sesion is None:
+        raise HTTPException(status_code=404, detail="Sesion no encontrada o expirada.")
+    return sesion
 
-    base = str(request.base_url).rstrip("/")
-    return {
-        "status": "ok",
-        "especie": especie,
-        "annotated_url": f"{base}/download/{annotated_token}",
-        "report_url": f"{base}/download/{report_token}" if report_token else None,
-        # Rutas de servidor conservadas solo para depuracion local.
-        "input_file": input_path,
-        "annotated_pdf": ruta_pdf,
-        "report_pdf": report_pdf if report_exists else None,
-    }
+
+def _guardar_version(sesion: dict, resultado: dict) -> dict:
+    """Guarda el resultado de una version (y sus PDFs si se regeneraron); devuelve los cambios."""
+    if sesion["session_id"] not in _SESIONES:
+        # Cerrada (DELETE) o expulsada por el LRU mientras se analizaba.
+        raise HTTPException(status_code=404, detail="Sesion no encontrada o expirada.")
+    if resultado["renderizado"]:
+        sesion["pdf"], sesion["informe"] = resultado["pdf"], resultado["informe"]
+        _registrar_metricas({"estado": "ok", "traza": resultado["traza"]},
+                            sesion["especie"], sesion["modo_pdf"], "sesion")
+    sesion["resultado"] = {k: resultado[k] for k in
+                           ("version", "errores", "mensajes", "diagnosticos", "evaluacion", "tiempo_s", "traza")}
+    _SESIONES.move_to_end(sesion["session_id"])
+    return {"compases": resultado["compases_cambiados"], "renderizado": resultado["renderizado"],
+            "reglas_evaluadas": resultado["reglas_evaluadas"],
+            "reglas_reutilizadas": resultado["reglas_reutilizadas"]}
+
+
+def _estado_sesion(sesion: dict, base: str, cambios: dict | None = None, traza: bool = False) -> dict:
+    respuesta = {k: sesion[k] for k in ("session_id", "especie", "cf_index", "modo_pdf", "capas",
+                                        "sin_reglas")}
+    respuesta.update(sesion["resultado"])
+    if not traza:
+        respuesta.pop("traza")
+    url = f"{base}/sessions/{sesion['session_id']}"
+    respuesta["session_url"] = url
+    respuesta["annotated_url"] = f"{url}/pdf"
+    respuesta["report_url"] = f"{url}/pdf?documento=informe"
+    if cambios is not None:
+        respuesta["cambios"] = cambios
+    return respuesta
+
+
+@app.post("/sessions/", status_code=201)
+async def session_create(request: Request, file: UploadFile = File(...), especie: str = Form(...),
+                         cf_index: int = Form(1), modo_pdf: str = Form("raster"),
+                         capas: str = Form(""), sin_reglas: str = Form(""), traza: bool = False):
+    """Abre una sesion con la primera version del ejercicio (analisis completo)."""
+    especie, modo_pdf = _validar_parametros(especie, cf_index, modo_pdf)
+    capas = _validar_capas(capas, especie)
+    sin_reglas = _validar_reglas(sin_reglas, especie)
+    try:
+        datos = await file.read()
+    finally:
+        await file.close()
+    session_id = secrets.token_hex(8)
+    resultado = await _en_sesiones(session_id, sesiones.crear_sesion, datos, especie, cf_index,
+                                   modo_pdf, capas, sin_reglas)
+    sesion = {"session_id": session_id, "especie": especie, "cf_index": cf_index,
+              "modo_pdf": modo_pdf, "capas": capas, "sin_reglas": sin_reglas}
+    _SESIONES[session_id] = sesion
+    cambios = _guardar_version(sesion, resultado)
+    while len(_SESIONES) > SESIONES_MAX:
+        _SESIONES.popitem(last=False)
+    return _estado_sesion(sesion, str(request.base_url).rstrip("/"), cambios, traza)
+
+
+@app.put("/sessions/{session_id}")
+async def session_update(request: Request, session_id: str, file: UploadFile = File(...),
+                         traza: bool = False):
+    """Nueva version completa: solo se re-evaluan las reglas de los compases cambiados."""
+    sesion = _obtener_sesion(session_id)
+    try:
+        datos = await file.read()
+    finally:
+        await file.close()
+    resultado = await _en_sesiones(session_id, sesiones.actualizar_sesion, datos)
+    cambios = _guardar_version(sesion, resultado)
+    return _estado_sesion(sesion, str(request.base_url).rstrip("/"), cambios, traza)
+
+
+@app.patch("/sessions/{session_id}")
+async def session_patch(request: Request, session_id: str, parche: dict = Body(...),
+                        traza: bool = False):
+    """Parche por compases ({"compases": {"3": {"cp": ["E4", "F4"]}}}) sobre la ultima version."""
+    sesion = _obtener_sesion(session_id)
+    resultado = await _en_sesiones(session_id, sesiones.parchear_sesion, parche)
+    cambios = _guardar_version(sesion, resultado)
+    return _estado_sesion(sesion, str(request.base_url).rstrip("/"), cambios, traza)
+
+
+@app.get("/sessions/{session_id}")
+def session_status(request: Request, session_id: str, traza: bool = False):
+    return _estado_sesion(_obtener_sesion(session_id), str(request.base_url).rstrip("/"), traza=traza)
+
+
+@app.get("/sessions/{session_id}/pdf")
+def session_pdf(session_id: str, documento: str = "anotada"):
+    """PDF de la ultima version de la sesion (partitura anotada o informe)."""
+    sesion = _obtener_sesion(session_id)
+    documento = (documento or "anotada").strip().lower()
+    if documento not in DOCUMENTOS:
+        raise HTTPException(status_code=422, detail=f"Documento no soportado: '{documento}'. Use {DOCUMENTOS}.")
+    contenido = sesion["pdf"] if documento == "anotada" else sesion["informe"]
+    sufijo = "_anotada.pdf" if documento == "anotada" else "_anotada_informe.pdf"
+    return Response(contenido, media_type="application/pdf", headers={
+        "Content-Disposition": f'inline; filename="sesion_{session_id}_v{sesion["resultado"]["version"]}{sufijo}"',
+    })
+
+
+@app.delete("/sessions/{session_id}", status_code=204)
+async def session_close(session_id: str):
+    _obtener_sesion(session_id)
+    _SESIONES.pop(session_id, None)
+    await _en_sesiones(session_id, sesiones.cerrar_sesion)
+    return Response(status_code=204)
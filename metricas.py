@@ -0,0 +1,170 @@
+# metricas.py - Tiempos por etapa del pipeline y metricas de la API.
+#
+# Etapas: el llamador pasa un dict `tiempos` (o None para no medir) y cada etapa
+# suma sus segundos bajo su nombre: parseo, ids, musicxml, reglas, svg, anotacion,
+# pdf, informe. cli_runner lo expone en detalle["tiempos"]; lo usan los benchmarks.
+# Si el dict es una Traza, ademas guarda cada span (inicio y duracion) en orden.
+# Las subetapas se nombran "<etapa>.<parte>" (p. ej. anotacion.intervalos, una por
+# capa de anotacion, o reglas.cruce, una por regla): suman bajo su propia clave y en
+# la traza cuelgan de su etapa.
+# Una Traza con al_empezar recibe el nombre de cada etapa (no de las subetapas) al
+# empezar: es el progreso que la API reenvia a los clientes (GET /jobs/{id}/events).
+#
+# RegistroMetricas: contadores e histogramas con etiquetas, en memoria, que la API
+# sirve en GET /metrics con el formato de texto de Prometheus.
+
+import contextlib
+import threading
+import time
+
+ETAPAS = ["parseo", "ids", "musicxml", "reglas", "svg", "anotacion", "pdf", "informe"]
+
+# Porcentaje aproximado del trabajo hecho al empezar cada etapa (segun la mediana
+# de benchmarks/bench_etapas.py: el PDF y el informe son lo mas largo).
+PROGRESO_ETAPAS = {"parseo": 0, "ids": 5, "musicxml": 8, "reglas": 12, "svg": 18,
+                   "anotacion": 30, "pdf": 40, "informe": 85}
+
+
+class Traza(dict):
+    """Dict de segundos por etapa que ademas conserva los spans en orden de ejecucion."""
+
+    def __init__(self, nombre="trabajo", al_empezar=None):
+        super().__init__()
+        self.nombre = nombre
+        self.inicio = time.perf_counter()
+        self.spans = []  # (etapa, inicio relativo s, duracion s)
+        self.al_empezar = al_empezar  # callable(etapa) o None
+
+    def arbol(self):
+        """Span raiz (todo el trabajo) con un hijo por etapa, en milisegundos.
+
+        Las subetapas ("etapa.parte") van en "hijos" del span de su etapa que las contiene.
+        """
+        hijos, subetapas = [], []
+        for nombre, inicio, duracion in self.spans:
+            span = {"nombre": nombre, "inicio_ms": round(inicio * 1000, 2),
+                    "ms": round(duracion * 1000, 2)}
+            (subetapas if "." in nombre else hijos).append((span, inicio, duracion))
+        for span, inicio, _ in subetapas:
+            padre = span["nombre"].split(".", 1)[0]
+            for contenedor, inicio_padre, duracion_padre in hijos:
+                if contenedor["nombre"] == padre and inicio_padre <= inicio <= inicio_padre + duracion_padre:
+                    contenedor.setdefault("hijos", []).append(span)
+                    break
+        return {
+            "nombre": self.nombre,
+            "ms": round((time.perf_counter() - self.inicio) * 1000, 2),
+            "hijos": [span for span, _, _ in hijos],
+        }
+
+
+def avisar(tiempos, nombre):
+    """Avisa a al_empezar de una Traza que empieza la etapa (no las subetapas).
+
+    etapa() lo hace sola; las etapas que se intercalan (p. ej. pagina a pagina) y
+    se suman al final con sumar() lo llaman al empezar la primera vez.
+    """
+    if isinstance(tiempos, Traza) and tiempos.al_empezar is not None and "." not in nombre:
+        tiempos.al_empezar(nombre)
+
+
+@contextlib.contextmanager
+def etapa(tiempos, nombre):
+    """Suma a tiempos[nombre] los segundos del bloque (no hace nada si tiempos es None)."""
+    if tiempos is None:
+        yield
+        return
+    avisar(tiempos, nombre)
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracion = time.perf_counter() - inicio
+        tiempos[nombre] = tiempos.get(nombre, 0.0) + duracion
+        if isinstance(tiempos, Traza):
+            tiempos.spans.append((nombre, inicio - tiempos.inicio, duracion))
+
+
+def sumar(tiempos, nombre, segundos, inicio):
+    """Como etapa, con segundos ya medidos (p. ej. una regla repartida en muchas ventanas).
+
+    En una Traza el span empieza en `inicio` (perf_counter) y dura el total sumado.
+    """
+    if tiempos is None:
+        return
+    tiempos[nombre] = tiempos.get(nombre, 0.0) + segundos
+    if isinstance(tiempos, Traza):
+        tiempos.spans.append((nombre, inicio - tiempos.inicio, segundos))
+
+
+# --- Registro de metricas (formato Prometheus) ---
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _etiquetas(etiquetas, extra=None):
+    pares = sorted(etiquetas.items()) + (list(extra.items()) if extra else [])
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in pares) + "}"
+
+
+def _numero(valor):
+    return repr(float(valor)) if valor != int(valor) else str(int(valor))
+
+
+class RegistroMetricas:
+    """Contadores, histogramas y gauges con etiquetas, seguros entre hilos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._definiciones = {}  # nombre -> (tipo, ayuda, buckets)
+        self._series = {}        # nombre -> {etiquetas ordenadas: valor | [cuentas, suma, n]}
+
+    def declarar(self, nombre, tipo, ayuda, buckets=BUCKETS_SEGUNDOS):
+        self._definiciones[nombre] = (tipo, ayuda, tuple(buckets) if tipo == "histogram" else None)
+        self._series.setdefault(nombre, {})
+
+    def contar(self, nombre, valor=1, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        with self._lock:
+            series = self._series[nombre]
+            series[clave] = series.get(clave, 0) + valor
+
+    def fijar(self, nombre, valor, **etiquetas):
+        with self._lock:
+            self._series[nombre][tuple(sorted(etiquetas.items()))] = valor
+
+    def observar(self, nombre, valor, **etiquetas):
+        buckets = self._definiciones[nombre][2]
+        clave = tuple(sorted(etiquetas.items()))
+        with self._lock:
+            serie = self._series[nombre].setdefault(clave, [[0] * len(buckets), 0.0, 0])
+            for i, limite in enumerate(buckets):
+                if valor <= limite:
+                    serie[0][i] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def texto(self):
+        """Exposicion en formato de texto de Prometheus (version 0.0.4)."""
+        lineas = []
+        with self._lock:
+            for nombre, (tipo, ayuda, buckets) in self._definiciones.items():
+                lineas.append(f"# HELP {nombre} {ayuda}")
+                lineas.append(f"# TYPE {nombre} {tipo}")
+                for clave, valor in sorted(self._series[nombre].items()):
+                    etiquetas = dict(clave)
+                    if tipo != "histogram":
+                        lineas.append(f"{nombre}{_etiquetas(etiquetas)} {_numero(valor)}")
+                        continue
+                    cuentas, suma, n = valor
+                    for limite, cuenta in zip(buckets, cuentas):
+                        lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas, {'le': _numero(limite)})} {cuenta}")
+                    lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas, {'le': '+Inf'})} {n}")
+                    lineas.append(f"{nombre}_sum{_etiquetas(etiquetas)} {_numero(round(suma, 6))}")
+                    lineas.append(f"{nombre}_count{_etiquetas(etiquetas)} {n}")
+        return "\n".join(lineas) + "\n"
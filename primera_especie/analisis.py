@@ -1,7 +1,8 @@
 # primera_especie/analisis.py (Actualizado v2 - Con soporte para SVG y Flechas)
 
 from primera_especie.reglas import analizar_reglas_contrapunto
-from music21 import note as m21note, interval
+from analisis_musical_comun.diagnosticos import error
+from analisis_musical_comun.intervalos import clasificar
 import traceback 
 
 class ResultadoAnalisis:
@@ -9,6 +10,7 @@ class ResultadoAnalisis:
                  datos_intervalos_svg=None, movimientos_cf=None, movimientos_cp=None): 
         """
         Objeto para transportar todos los resultados del análisis.
+        errores y observaciones: diagnosticos (analisis_musical_comun.diagnosticos).
         """
         self.errores = errores
         self.evaluacion = evaluacion
@@ -35,9 +37,9 @@ def _calcular_movimientos_melodicos(notes_list):
         if not hasattr(n1, 'id') or not hasattr(n2, 'id'):
             continue
             
-        # Comparar alturas (pitch)
-        p1 = n1.pitch.ps
-        p2 = n2.pitch.ps
+        # Comparar alturas (pitch space)
+        p1 = n1.ps
+        p2 = n2.ps
         
         tipo_mov = "lateral" # Igual altura
         if p2 > p1:
@@ -49,10 +51,13 @@ def _calcular_movimientos_melodicos(notes_list):
         
     return movimientos
 
-def seccion_analizar_ejercicio(score_m21_completo, cf_part_identificada, cp_part_identificada):
+def seccion_analizar_ejercicio(cf_voz, cp_voz, memo=None, tiempos=None, sin_reglas=None):
     """
     Analiza la partitura de 1ra Especie.
     Calcula reglas, intervalos y movimientos melódicos.
+    cf_voz, cp_voz: voces compactas (analisis_musical_comun.voces.extraer_voz).
+    memo: estado de la pasada anterior para re-evaluar solo lo que cambio (sesiones).
+    tiempos recibe el tiempo de cada regla; sin_reglas desactiva reglas por nombre.
     """
     errores_analisis = []
     observaciones_analisis = []
@@ -64,20 +69,21 @@ def seccion_analizar_ejercicio(score_m21_completo, cf_part_identificada, cp_part
     movimientos_cp = []
 
     try:
-        if not cf_part_identificada or not cp_part_identificada:
-            errores_analisis.append("Partes CF/CP no proporcionadas para el análisis de reglas.")
+        if cf_voz is None or cp_voz is None:
+            errores_analisis.append(error("sin_voces"))
             return ResultadoAnalisis(errores_analisis, "Error en Configuración de Análisis")
 
         # 1. Análisis de Reglas (Lógica teórica)
-        errores_reglas, observaciones_de_reglas = analizar_reglas_contrapunto(cf_part_identificada, cp_part_identificada)
+        errores_reglas, observaciones_de_reglas = analizar_reglas_contrapunto(
+            cf_voz, cp_voz, memo, tiempos, sin_reglas)
         errores_analisis.extend(errores_reglas)
         observaciones_analisis.extend(observaciones_de_reglas)
 
         # 2. Preparación de Datos para Visualización (PDF/SVG)
         
-        # Extraer listas de notas limpias
-        cf_notes = [n for n in cf_part_identificada.recurse().getElementsByClass(m21note.Note)]
-        cp_notes = [n for n in cp_part_identificada.recurse().getElementsByClass(m21note.Note)]
+        # Listas de notas de cada voz
+        cf_notes = cf_voz.notas
+        cp_notes = cp_voz.notas
         
         # A. Calcular Intervalos Armónicos (para los números debajo de la partitura)
         min_len = min(len(cf_notes), len(cp_notes))
@@ -85,9 +91,9 @@ def seccion_analizar_ejercicio(score_m21_completo, cf_part_identificada, cp_part
             n_cf = cf_notes[i]
             n_cp = cp_notes[i]
             try:
-                # Creamos el objeto intervalo
-                inter = interval.Interval(noteStart=n_cf, noteEnd=n_cp)
-                # Guardamos la tupla (NotaCP, NotaCF, ObjetoIntervalo)
+                # Clasificamos el intervalo (tabla compartida, sin music21.Interval)
+                inter = clasificar(n_cf, n_cp)
+                # Guardamos la tupla (NotaCP, NotaCF, Intervalo)
                 datos_intervalos_svg.append((n_cp, n_cf, inter))
             except Exception:
                 continue
@@ -116,5 +122,5 @@ def seccion_analizar_ejercicio(score_m21_completo, cf_part_identificada, cp_part
     except Exception as e:
         print(f"ERROR en seccion_analizar_ejercicio (primera_especie/analisis.py): {e}")
         traceback.print_exc() 
-        errores_analisis.append(f"Error técnico en análisis de reglas: {str(e)}")
+        errores_analisis.append(error("error_interno", datos={"mensaje": str(e)}))
         return ResultadoAnalisis(errores_analisis, evaluacion_predeterminada)
\ No newline at end of file
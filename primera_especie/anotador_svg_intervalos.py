@@ -1,7 +1,6 @@
 # primera_especie/anotador_svg_intervalos.py
 import xml.etree.ElementTree as ET
-from music21 import interval, note as m21note 
-import re
+from analisis_musical_comun.intervalos import clasificar
 import os
 import traceback 
 import math 
@@ -71,166 +70,64 @@ def _draw_connecting_line(target_group, coords1, coords2, ns,
     # print(f"DEBUG (Anotador Dibujo): Línea dibujada de ({x1:.0f},{y1:.0f}) a ({x2:.0f},{y2:.0f}) color: {line_color}, stroke-width: {stroke_width}, arrowhead: {use_arrowhead}")
 
 
-def _get_note_svg_coords(svg_root, note_id_m21_value, search_attr="data-id"):
-    if not note_id_m21_value: 
-        return None
-    target_element_note_group = None
-    ns = {'svg': 'http://www.w3.org/2000/svg'}
-    try:
-        xpath_query_note_group = f".//svg:g[@{search_attr}='{note_id_m21_value}']"
-        target_element_note_group = svg_root.find(xpath_query_note_group, ns)
-        if target_element_note_group is None and search_attr == "data-id": 
-            xpath_query_note_group_fallback = f".//svg:g[@id='{note_id_m21_value}']"
-            target_element_note_group = svg_root.find(xpath_query_note_group_fallback, ns)
-
-        if target_element_note_group is not None:
-            notehead_group = target_element_note_group.find("./svg:g[@class='notehead']", ns)
-            if notehead_group is None: 
-                notehead_group = target_element_note_group.find("./svg:g[@data-class='notehead']", ns) 
-            
-            if notehead_group is not None:
-                use_element = notehead_group.find("./svg:use", ns)
-                if use_element is not None:
-                    x_attr = use_element.get('x')
-                    y_attr = use_element.get('y')
-                    if x_attr is not None and y_attr is not None:
-                        try:
-                            return {'x': float(x_attr), 'y': float(y_attr)}
-                        except ValueError: pass
-                    # Verovio 4/5+: la posicion del notehead esta en el transform del <use>.
-                    use_transform = use_element.get('transform')
-                    if use_transform:
-                        m = re.search(r"translate\(\s*([-\d.]+)[,\s]+([-\d.]+)", use_transform)
-                        if m:
-                            return {'x': float(m.group(1)), 'y': float(m.group(2))}
-
-            transform_attr = target_element_note_group.get('transform')
-            if transform_attr and "translate" in transform_attr:
-                try:
-                    match = re.search(r"translate\(\s*([-\d\.]+)\s*[, ]?\s*([-\d\.]+)\s*\)", transform_attr)
-                    if match:
-                        return {'x': float(match.group(1)), 'y': float(match.group(2))}
-                except Exception: pass 
-    except Exception as e: pass 
-    return None 
-
-def anotar_svg_con_intervalos_primera_especie(
-    svg_string, 
-    score_m21, cf_part_m21, cp_part_m21, 
-    datos_movimiento_melodico_cf=None, 
-    datos_movimiento_melodico_cp=None,
-    species="primera"
-):
-    print("DEBUG (Anotador): Iniciando anotación de SVG...")
-    namespaces_map = {'svg': 'http://www.w3.org/2000/svg'}
-    try:
-        ET.register_namespace('', namespaces_map['svg']) 
-        if isinstance(svg_string, str) and svg_string.strip().startswith('<?xml'):
-            svg_string_cleaned = svg_string.split('?>', 1)[-1].strip()
-        else:
-            svg_string_cleaned = svg_string
-        svg_root = ET.fromstring(svg_string_cleaned)
-    except ET.ParseError as e:
-        print(f"ERROR CRÍTICO (Anotador): Error parseando SVG string: {e}")
-        return svg_string 
-
+# --- Capas de anotacion (verovio_pdf.CAPAS_ANOTACION["primera"]) ---
+# Cada capa recibe el contexto de anotacion (dict) que arma verovio_pdf: "raiz" y
+# "grupo" (arbol SVG ya parseado y grupo donde dibujar), "coords" (indice_svg),
+# "datos" (datos_anotacion_especie) y las voces compactas "cf" y "cp" (voces.Voz).
+NS_SVG = {'svg': 'http://www.w3.org/2000/svg'}
+
+
+def capa_intervalos(ctx):
+    """Numero de intervalo armonico entre cada par CP/CF."""
+    coords, grupo = ctx["coords"], ctx["grupo"]
+    # Se reutilizan los intervalos ya clasificados en el analisis (NotaCP, NotaCF, Intervalo);
+    # solo se recalculan si el llamador no los aporta.
+    datos_intervalos = ctx["datos"].get("intervalos")
+    cp_voz, cf_voz = ctx["cp"], ctx["cf"]
+    if datos_intervalos is None and cp_voz is not None and cf_voz is not None:
+        cp_notes_interval_ordered = [n for n in cp_voz.notas if n.id]
+        cf_notes_interval_ordered = [n for n in cf_voz.notas if n.id]
+        datos_intervalos = [(n_cp, n_cf, clasificar(n_cf, n_cp))
+                            for n_cp, n_cf in zip(cp_notes_interval_ordered, cf_notes_interval_ordered)]
+    for n_cp, n_cf, inter in datos_intervalos or []:
+        cp_id, cf_id = getattr(n_cp, 'id', None), getattr(n_cf, 'id', None)
+        if not cp_id or not cf_id: continue
+        interval_text = inter.nombre_simple
+        if inter.especificador in ['P', 'M', 'm']:
+            interval_text = str(inter.generico)
+
+        coord_cp_svg, coord_cf_svg = coords.get(cp_id), coords.get(cf_id)
+        if coord_cp_svg and coord_cf_svg:
+            font_size_svg_units = 270
+            text_x = coord_cf_svg['x'] + (font_size_svg_units * 0.7)
+            text_y = (min(coord_cp_svg['y'], coord_cf_svg['y']) + max(coord_cp_svg['y'], coord_cf_svg['y'])) / 2
+            text_element = ET.Element(f"{{{NS_SVG['svg']}}}text", {
+                "x": str(text_x), "y": str(text_y),
+                "font-family": "Arial, Helvetica, sans-serif", "font-size": str(font_size_svg_units) + "px",
+                "fill": "blue", "text-anchor": "middle", "dominant-baseline": "middle"
+            })
+            text_element.text = interval_text
+            grupo.append(text_element)
+
+
+def capa_flechas(ctx):
+    """Lineas de movimiento melodico coloreadas (CF y CP), con punta de flecha."""
+    coords, grupo = ctx["coords"], ctx["grupo"]
     arrowhead_id_for_lines = "melodicMovementArrowhead"
-    _add_arrowhead_marker_definition(svg_root, namespaces_map, arrowhead_id=arrowhead_id_for_lines, color="#333333", size="15") # Definición de marcador, opcional
+    _add_arrowhead_marker_definition(ctx["raiz"], NS_SVG, arrowhead_id=arrowhead_id_for_lines, color="#333333", size="15")
 
-    page_margin_group = svg_root.find(".//svg:g[@class='page-margin']", namespaces=namespaces_map)
-    target_group_for_annotations = page_margin_group if page_margin_group is not None else svg_root
-    
-    all_note_coords = {}
-    notes_cp_for_coords = []
-    if cp_part_m21:
-        notes_cp_for_coords = [n for n in cp_part_m21.recurse().getElementsByClass(m21note.Note) if n.isNote and getattr(n, 'id', None)]
-    
-    notes_cf_for_coords = []
-    if cf_part_m21:
-        notes_cf_for_coords = [n for n in cf_part_m21.recurse().getElementsByClass(m21note.Note) if n.isNote and getattr(n, 'id', None)]
-    
-    for note_obj in notes_cp_for_coords + notes_cf_for_coords:
-        note_id = getattr(note_obj, 'id')
-        if note_id and note_id not in all_note_coords: 
-            coords = _get_note_svg_coords(svg_root, note_id)
-            if coords:
-                all_note_coords[note_id] = coords
-            else:
-                print(f"DEBUG (Anotador Coords): No se pudieron obtener coords para nota ID {note_id}")
-
-    # --- Sección de Anotación de Intervalos ---
-    if cp_part_m21 and cf_part_m21:
-        cp_notes_interval_ordered = [n for n in cp_part_m21.recurse().getElementsByClass(m21note.Note) if n.isNote and getattr(n, 'id', None)]
-        cf_notes_interval_ordered = [n for n in cf_part_m21.recurse().getElementsByClass(m21note.Note) if n.isNote and getattr(n, 'id', None)]
-        min_len = min(len(cp_notes_interval_ordered), len(cf_notes_interval_ordered))
-        for i in range(min_len):
-            n_cp, n_cf = cp_notes_interval_ordered[i], cf_notes_interval_ordered[i]
-            cp_id, cf_id = getattr(n_cp, 'id', None), getattr(n_cf, 'id', None)
-            if not cp_id or not cf_id: continue
-            inter = interval.Interval(noteStart=n_cf, noteEnd=n_cp)
-            interval_text = str(inter.simpleName) if inter.simpleName else (str(inter.generic.value) if inter.generic else "?")
-            if inter.specifier and inter.generic and str(inter.specifier) in ['P', 'M', 'm']:
-                interval_text = str(inter.generic.value)
-            
-            coord_cp_svg, coord_cf_svg = all_note_coords.get(cp_id), all_note_coords.get(cf_id)
-            if coord_cp_svg and coord_cf_svg:
-                font_size_svg_units = 270 
-                text_x = coord_cf_svg['x'] + (font_size_svg_units * 0.7) 
-                text_y = (min(coord_cp_svg['y'], coord_cf_svg['y']) + max(coord_cp_svg['y'], coord_cf_svg['y'])) / 2
-                text_element = ET.Element(f"{{{namespaces_map['svg']}}}text", {
-                    "x": str(text_x), "y": str(text_y),
-                    "font-family": "Arial, Helvetica, sans-serif", "font-size": str(font_size_svg_units) + "px",
-                    "fill": "blue", "text-anchor": "middle", "dominant-baseline": "middle"
-                })
-                text_element.text = interval_text
-                target_group_for_annotations.append(text_element)
-
-    # --- Sección de Anotación de Líneas de Movimiento Coloreadas ---
-    print(f"DEBUG (Anotador): Iniciando anotación de líneas de movimiento.")
-    
-    USAR_CABEZAS_DE_FLECHA = True # Mantenemos esto en False por ahora
-    
-    # CAMBIO: Aumentar el grosor de la línea
+    USAR_CABEZAS_DE_FLECHA = True
     line_stroke_width = "7.5" # 2.5 * 3 = 7.5
 
-    if datos_movimiento_melodico_cf:
-        print(f"DEBUG (Anotador): Procesando {len(datos_movimiento_melodico_cf)} movimientos para CF.")
-        for nota_anterior_id, nota_actual_id, movimiento_tipo_str in datos_movimiento_melodico_cf:
-            coord_nota1 = all_note_coords.get(nota_anterior_id)
-            coord_nota2 = all_note_coords.get(nota_actual_id)
-            if coord_nota1 and coord_nota2:
-                color = "black" 
-                if movimiento_tipo_str == "ascendente": color = "green"
-                elif movimiento_tipo_str == "descendente": color = "red"
-                _draw_connecting_line(target_group_for_annotations, coord_nota1, coord_nota2, namespaces_map,
-                                      line_color=color, stroke_width=line_stroke_width,
-                                      use_arrowhead=USAR_CABEZAS_DE_FLECHA, arrowhead_id=arrowhead_id_for_lines)
-            else:
-                print(f"DEBUG (Anotador CF): Coords faltantes para línea entre {nota_anterior_id} y {nota_actual_id}.")
-
-    if datos_movimiento_melodico_cp:
-        print(f"DEBUG (Anotador): Procesando {len(datos_movimiento_melodico_cp)} movimientos para CP.")
-        for nota_anterior_id, nota_actual_id, movimiento_tipo_str in datos_movimiento_melodico_cp:
-            coord_nota1 = all_note_coords.get(nota_anterior_id)
-            coord_nota2 = all_note_coords.get(nota_actual_id)
+    for clave in ("movimientos_cf", "movimientos_cp"):
+        for nota_anterior_id, nota_actual_id, movimiento_tipo_str in ctx["datos"].get(clave) or []:
+            coord_nota1 = coords.get(nota_anterior_id)
+            coord_nota2 = coords.get(nota_actual_id)
             if coord_nota1 and coord_nota2:
-                color = "black" 
+                color = "black"
                 if movimiento_tipo_str == "ascendente": color = "green"
                 elif movimiento_tipo_str == "descendente": color = "red"
-                _draw_connecting_line(target_group_for_annotations, coord_nota1, coord_nota2, namespaces_map,
+                _draw_connecting_line(grupo, coord_nota1, coord_nota2, NS_SVG,
                                       line_color=color, stroke_width=line_stroke_width,
                                       use_arrowhead=USAR_CABEZAS_DE_FLECHA, arrowhead_id=arrowhead_id_for_lines)
-            else:
-                print(f"DEBUG (Anotador CP): Coords faltantes para línea entre {nota_anterior_id} y {nota_actual_id}.")
-    
-    final_svg_string = ET.tostring(svg_root, encoding="unicode", xml_declaration=False)
-    
-    debug_svg_path = "debug_annotated_output_final.svg" 
-    try:
-        with open(debug_svg_path, "w", encoding="utf-8") as f_svg_debug_annotated:
-            f_svg_debug_annotated.write(final_svg_string)
-        print(f"DEBUG (Anotador): SVG ANOTADO final guardado en {os.path.abspath(debug_svg_path)}")
-    except Exception as e_save_annot_svg:
-        print(f"DEBUG (Anotador): Error al guardar SVG ANOTADO de depuración: {e_save_annot_svg}")
-        
-    return final_svg_string
+
@@ -1,177 +1,217 @@
 # primera_especie/reglas.py
-from music21 import interval, note as m21note, pitch
+from analisis_musical_comun.intervalos import clasificar
 # NO DEBE HABER importación directa de music21.motion o music21.analysis.discrete o music21.analysis.motion aquí
 
 # --- IMPORTACIONES DE MÓDULOS DE ANÁLISIS ---
 # Esto asume que 'analisis_musical_comun' está en el directorio raíz del proyecto
 # y que 'primera_especie' es un subdirectorio.
-try:
-    from analisis_musical_comun.analisis_movimientos import describir_movimiento_melodico_voz, identificar_movimiento_entre_voces
-    print("DEBUG (reglas.py): Funciones de analisis_movimientos importadas correctamente.")
-except ImportError as e_mov:
-    print(f"ADVERTENCIA (reglas.py): No se pudo importar desde analisis_musical_comun.analisis_movimientos: {e_mov}. Usando placeholders.")
-    # Definir placeholders para que el resto del archivo no falle si la importación falla
-    def describir_movimiento_melodico_voz(lista_notas, nombre_voz="Voz"): return [f"Placeholder: Análisis melódico para {nombre_voz} no disponible (error import analisis_movimientos)."]
-    def identificar_movimiento_entre_voces(cp_notas, cf_notas): return ["Placeholder: Análisis de movimiento entre voces no disponible (error import analisis_movimientos)."]
-
-try:
-    from .figuras_contrapuntisticas import identificar_patrones_primera_especie 
-    print("DEBUG (reglas.py): Función de figuras_contrapuntisticas importada correctamente.")
-except ImportError as e_fig:
-    print(f"ADVERTENCIA (reglas.py): No se pudo importar desde .figuras_contrapuntisticas: {e_fig}. Usando placeholder.")
-    def identificar_patrones_primera_especie(cp_part, cf_part): return ["Placeholder: Análisis de patrones no disponible (error import figuras_contrapuntisticas)."]
+from analisis_musical_comun.analisis_movimientos import describir_movimiento_melodico_voz, identificar_movimiento_entre_voces
+from analisis_musical_comun.alineacion import EventoVertical
+from analisis_musical_comun.diagnosticos import error, observacion
+from analisis_musical_comun.voces import misma_altura
+from analisis_musical_comun.ventanas import (
+    EXTREMOS, PAR, VERTICAL, Hallazgos, Regla, evaluar_reglas, firma_nota, melodica, seleccionar_reglas,
+)
+from .figuras_contrapuntisticas import patron_llegada_perfecta_por_salto
 
 
 # --- FUNCIONES DE VALIDACIÓN DE REGLAS ---
 
-def verificar_cruce_de_voces(cp_notes_list, cf_notes_list, cp_nombre="Contrapunto", cf_nombre="Cantus Firmus"):
-    errores_cruce = []
-    min_len_cruce = min(len(cp_notes_list), len(cf_notes_list))
-    for i in range(min_len_cruce):
-        nota_cp = cp_notes_list[i]
-        nota_cf = cf_notes_list[i]
-        if hasattr(nota_cp, 'pitch') and hasattr(nota_cf, 'pitch'): 
-            if nota_cp.pitch.ps < nota_cf.pitch.ps:
-                errores_cruce.append(
-                    f"Cruce de voces en tiempo {i + 1}: "
-                    f"{cp_nombre} ({nota_cp.nameWithOctave}) está por debajo del "
-                    f"{cf_nombre} ({nota_cf.nameWithOctave})."
-                )
-    return errores_cruce
+def _es_consonancia(intervalo):
+    if intervalo is None or intervalo.nombre == 'P4':
+        return False
+    return intervalo.es_consonante
 
-def verificar_consonancia_entre_notas(nota_cp, nota_cf):
+def _clasificar_seguro(nota_inicio, nota_fin):
     try:
-        current_interval = interval.Interval(noteStart=nota_cf, noteEnd=nota_cp)
-        if current_interval.name == 'P4': 
-            return False
-        return current_interval.isConsonant()
-    except Exception as e:
-        # print(f"Error en verificar_consonancia_entre_notas: {e}") 
-        return False
+        return clasificar(nota_inicio, nota_fin)
+    except Exception:
+        return None
+
+def verificar_consonancia_entre_notas(nota_cp, nota_cf):
+    return _es_consonancia(_clasificar_seguro(nota_cf, nota_cp))
 
 def buscar_quintas_octavas_paralelas(intervalo_anterior, intervalo_actual):
     if not intervalo_anterior or not intervalo_actual: return False
-    if intervalo_anterior.name == "P5" and intervalo_actual.name == "P5": return True
-    if intervalo_anterior.name in ["P1", "P8"] and intervalo_actual.name in ["P1", "P8"]: return True
+    if intervalo_anterior.nombre == "P5" and intervalo_actual.nombre == "P5": return True
+    if intervalo_anterior.nombre in ["P1", "P8"] and intervalo_actual.nombre in ["P1", "P8"]: return True
     return False
 
-def movimiento_directo_prohibido(cp_ant, cp_curr, cf_ant, cf_curr):
-    if not all(hasattr(n, 'pitch') for n in [cp_ant, cp_curr, cf_ant, cf_curr]): 
+def movimiento_directo_prohibido(cp_ant, cp_curr, cf_ant, cf_curr, intervalo_destino=None):
+    if any(n is None for n in [cp_ant, cp_curr, cf_ant, cf_curr]):
         return False
-    intervalo_destino = interval.Interval(noteStart=cf_curr, noteEnd=cp_curr)
-    if intervalo_destino.simpleName not in ["P1", "P5", "P8"]: return False
+    if intervalo_destino is None:
+        intervalo_destino = clasificar(cf_curr, cp_curr)
+    if intervalo_destino.nombre_simple not in ["P1", "P5", "P8"]: return False
     try:
-        mov_cp = interval.Interval(noteStart=cp_ant, noteEnd=cp_curr)
-        mov_cf = interval.Interval(noteStart=cf_ant, noteEnd=cf_curr)
+        mov_cp = clasificar(cp_ant, cp_curr)
+        mov_cf = clasificar(cf_ant, cf_curr)
     except Exception: return False
-    if mov_cp.direction.value != 0 and mov_cf.direction.value != 0 and (mov_cp.direction == mov_cf.direction):
-        if not mov_cp.isStep: 
+    if mov_cp.direccion != 0 and mov_cf.direccion != 0 and (mov_cp.direccion == mov_cf.direccion):
+        if not mov_cp.es_grado_conjunto: 
             return True
     return False
 
 def verificar_inicio_final_primera_especie(cp_notes_list, cf_notes_list):
     errores = []
     if not cp_notes_list or not cf_notes_list:
-        errores.append("Voces vacías, no se puede verificar inicio/final.")
+        errores.append(error("voces_vacias"))
         return errores
+    cp_inicio, cf_inicio = cp_notes_list[0], cf_notes_list[0]
     try:
-        intervalo_inicio = interval.Interval(noteStart=cf_notes_list[0], noteEnd=cp_notes_list[0])
-        if intervalo_inicio.simpleName not in ["P1", "P5", "P8", "m3", "M3"]:
-            errores.append(f"Intervalo de inicio no convencional: {intervalo_inicio.niceName}. Se espera P1, P5, P8 (o M/m3 si CP arriba).")
+        intervalo_inicio = clasificar(cf_inicio, cp_inicio)
+        if intervalo_inicio.nombre_simple not in ["P1", "P5", "P8", "m3", "M3"]:
+            errores.append(error("inicio_no_valido", compas=cp_inicio.compas, tiempo=cp_inicio.tiempo, evento=1,
+                                 notas=(cp_inicio.id, cf_inicio.id), intervalo=intervalo_inicio.nombre_simple,
+                                 datos={"intervalo_largo": intervalo_inicio.nombre_largo}))
     except Exception as e: 
-        errores.append(f"Error calculando intervalo de inicio: {e}")
+        errores.append(error("error_inicio", datos={"mensaje": str(e)}))
+    cp_final, cf_final = cp_notes_list[-1], cf_notes_list[-1]
     try:
-        intervalo_final = interval.Interval(noteStart=cf_notes_list[-1], noteEnd=cp_notes_list[-1])
-        if intervalo_final.simpleName not in ["P1", "P8"]:
-            errores.append(f"Intervalo final no válido: {intervalo_final.niceName}. Se espera P1 o P8.")
+        intervalo_final = clasificar(cf_final, cp_final)
+        if intervalo_final.nombre_simple not in ["P1", "P8"]:
+            errores.append(error("final_no_valido", compas=cp_final.compas, tiempo=cp_final.tiempo,
+                                 evento=len(cp_notes_list), notas=(cp_final.id, cf_final.id),
+                                 intervalo=intervalo_final.nombre_simple,
+                                 datos={"intervalo_largo": intervalo_final.nombre_largo}))
         if len(cp_notes_list) > 1 and len(cf_notes_list) > 1: 
-            mov_cp_a_final = interval.Interval(noteStart=cp_notes_list[-2], noteEnd=cp_notes_list[-1])
-            if not mov_cp_a_final.isStep:
-                errores.append(f"El Contrapunto no llega a la última nota por grado conjunto (movimiento de {mov_cp_a_final.simpleName}).")
+            mov_cp_a_final = clasificar(cp_notes_list[-2], cp_final)
+            if not mov_cp_a_final.es_grado_conjunto:
+                errores.append(error("final_por_salto", compas=cp_final.compas, tiempo=cp_final.tiempo,
+                                     evento=len(cp_notes_list), notas=(cp_notes_list[-2].id, cp_final.id),
+                                     intervalo=mov_cp_a_final.nombre_simple, movimiento="salto", voz="cp"))
     except Exception as e: 
-        errores.append(f"Error calculando intervalo final o movimiento a la final: {e}")
+        errores.append(error("error_final", datos={"mensaje": str(e)}))
     return errores
 
-def detectar_notas_repetidas_en_voz(lista_notas_voz, nombre_voz="Voz"):
-    errores_repeticion = []
-    if len(lista_notas_voz) < 2: 
-        return errores_repeticion
-    for i in range(len(lista_notas_voz) - 1):
-        if hasattr(lista_notas_voz[i], 'pitch') and hasattr(lista_notas_voz[i+1], 'pitch'):
-            if lista_notas_voz[i].pitch == lista_notas_voz[i+1].pitch:
-                errores_repeticion.append(f"Nota repetida en {nombre_voz} (eventos {i+1} y {i+2}: {lista_notas_voz[i].nameWithOctave}).")
-    return errores_repeticion
+# --- REGISTRO DE REGLAS ---
+# Cada regla declara la forma de sus ventanas (ver analisis_musical_comun.ventanas):
+# el evento i es la i-esima nota de cada voz. ctx lleva las listas de notas, los
+# nombres de las voces y los intervalos armonicos ya clasificados (se clasifican
+# al pedirlos). Los hallazgos son diagnosticos (analisis_musical_comun.diagnosticos);
+# evento es el numero de evento desde 1, el "tiempo N" de los mensajes.
+
+def _armonico(ctx, i):
+    armonicos = ctx["armonicos"]
+    if i not in armonicos:
+        armonicos[i] = _clasificar_seguro(ctx["cf"][i], ctx["cp"][i])
+    return armonicos[i]
+
+def _vertical(ctx, i):
+    """Campos comunes de un diagnostico sobre el evento i (las dos voces)."""
+    nota_cp, nota_cf = ctx["cp"][i], ctx["cf"][i]
+    return dict(compas=nota_cp.compas, tiempo=nota_cp.tiempo, evento=i + 1, notas=(nota_cp.id, nota_cf.id))
+
+def _consonancia(ctx, i):
+    armonico = _armonico(ctx, i)
+    if not _es_consonancia(armonico):
+        return Hallazgos([error(
+            "disonancia", intervalo=armonico.nombre_simple if armonico else None, **_vertical(ctx, i),
+            datos={"intervalo_largo": armonico.nombre_largo if armonico else "?",
+                   "nota_cp": ctx["cp"][i].nombre, "nota_cf": ctx["cf"][i].nombre})])
+
+def _paralelas(ctx, i):
+    actual = _armonico(ctx, i)
+    if buscar_quintas_octavas_paralelas(_armonico(ctx, i - 1), actual):
+        campos = _vertical(ctx, i)
+        campos["notas"] = (ctx["cp"][i - 1].id, ctx["cf"][i - 1].id) + campos["notas"]
+        return Hallazgos([error("paralelas", intervalo=actual.nombre_simple, movimiento="parallel",
+                                datos={"evento_anterior": i}, **campos)])
+
+def _movimiento_directo(ctx, i):
+    armonico = _armonico(ctx, i)
+    if armonico is None:
+        return None
+    cp, cf = ctx["cp"], ctx["cf"]
+    if movimiento_directo_prohibido(cp[i-1], cp[i], cf[i-1], cf[i], armonico):
+        campos = _vertical(ctx, i)
+        campos["notas"] = (cp[i - 1].id, cf[i - 1].id) + campos["notas"]
+        return Hallazgos([error("movimiento_directo", intervalo=armonico.nombre_simple, movimiento="similar",
+                                **campos)])
+
+def _inicio_final(ctx, i):
+    return Hallazgos(verificar_inicio_final_primera_especie(ctx["cp"], ctx["cf"]))
+
+def _nota_repetida(ctx, i):
+    voz = ctx["cp"]
+    if misma_altura(voz[i-1], voz[i]):
+        return Hallazgos([error(
+            "nota_repetida", compas=voz[i].compas, tiempo=voz[i].tiempo, evento=i + 1,
+            notas=(voz[i-1].id, voz[i].id), movimiento="repeticion", voz="cp",
+            datos={"voz_nombre": ctx["cp_nombre"], "evento_anterior": i, "nota": voz[i-1].nombre})])
+
+def _cruce(ctx, i):
+    nota_cp, nota_cf = ctx["cp"][i], ctx["cf"][i]
+    if nota_cp.ps < nota_cf.ps:
+        return Hallazgos([error(
+            "cruce", **_vertical(ctx, i),
+            datos={"cp_nombre": ctx["cp_nombre"], "cf_nombre": ctx["cf_nombre"],
+                   "nota_cp": nota_cp.nombre, "nota_cf": nota_cf.nombre})])
+
+def _melodico(voz):
+    def evaluar(ctx, i):
+        return Hallazgos((), describir_movimiento_melodico_voz(ctx[voz][i - 1:i + 1], ctx[f"{voz}_nombre"], voz))
+    return evaluar
+
+def _entre_voces(ctx, i):
+    return Hallazgos((), identificar_movimiento_entre_voces(ctx["cp"][i - 1:i + 1], ctx["cf"][i - 1:i + 1]))
+
+def _patron(ctx, i):
+    patron = patron_llegada_perfecta_por_salto(ctx["cp"][i-1], ctx["cp"][i], ctx["cf"][i], i)
+    if patron:
+        return Hallazgos((), [patron])
+
+# En el orden en que aparecen en errores y observaciones.
+REGLAS_PRIMERA = [
+    Regla("consonancia", (VERTICAL,), _consonancia),
+    Regla("paralelas", (PAR,), _paralelas),
+    Regla("movimiento_directo", (PAR,), _movimiento_directo),
+    Regla("inicio_final", (EXTREMOS,), _inicio_final),
+    Regla("nota_repetida", (melodica("cp"),), _nota_repetida),
+    Regla("cruce", (VERTICAL,), _cruce),
+    Regla("melodico_cp", (melodica("cp"),), _melodico("cp")),
+    Regla("melodico_cf", (melodica("cf"),), _melodico("cf")),
+    Regla("entre_voces", (PAR,), _entre_voces),
+    Regla("patrones", (PAR,), _patron, sin_hallazgos=observacion("sin_patrones")),
+]
 
 # --- FUNCIÓN PRINCIPAL DE ANÁLISIS DE REGLAS ---
-def analizar_reglas_contrapunto(cf_part, cp_part):
+def analizar_reglas_contrapunto(cf_voz, cp_voz, memo=None, tiempos=None, sin_reglas=None):
+    """Errores y observaciones de primera especie (diagnosticos), en una pasada por los eventos.
+
+    cf_voz, cp_voz: voces compactas (analisis_musical_comun.voces.Voz).
+
+    memo: dict opcional de una pasada anterior (sesiones de re-analisis); solo se
+    re-evaluan las ventanas que leen notas cambiadas (ver ventanas.evaluar_reglas).
+    tiempos recibe el tiempo de cada regla; sin_reglas, nombres de REGLAS_PRIMERA
+    que no se aplican.
+    """
     errores = [] 
     observaciones_analiticas = [] 
     
-    cp_notes_list = [n for n in cp_part.recurse().getElementsByClass(m21note.Note) if n.isNote]
-    cf_notes_list = [n for n in cf_part.recurse().getElementsByClass(m21note.Note) if n.isNote]
+    cp_notes_list = cp_voz.notas
+    cf_notes_list = cf_voz.notas
 
     if not cp_notes_list or not cf_notes_list:
-        errores.append("Una o ambas voces designadas no contienen notas musicales para analizar.")
-        return errores, observaciones_analiticas
-
-    min_len = min(len(cp_notes_list), len(cf_notes_list))
-    if min_len == 0:
-        errores.append("No hay suficientes notas coincidentes para el análisis de primera especie.")
+        errores.append(error("sin_notas"))
         return errores, observaciones_analiticas
 
-    # (Aquí va el resto de tu lógica de análisis de reglas, llamando a las funciones de arriba)
-    # ... (Consonancias, Paralelas, Movimiento Directo, Inicio/Final, Repetidas, Cruce) ...
-    for i in range(min_len):
-        if not verificar_consonancia_entre_notas(cp_notes_list[i], cf_notes_list[i]):
-            intervalo_error = interval.Interval(noteStart=cf_notes_list[i], noteEnd=cp_notes_list[i])
-            errores.append(f"Error de consonancia en tiempo {i + 1}. Intervalo: {intervalo_error.niceName} ({cp_notes_list[i].nameWithOctave} vs {cf_notes_list[i].nameWithOctave}).")
-    if min_len > 1:
-        for i in range(1, min_len):
-            if not (hasattr(cf_notes_list[i-1], 'pitch') and hasattr(cp_notes_list[i-1], 'pitch') and \
-                    hasattr(cf_notes_list[i], 'pitch') and hasattr(cp_notes_list[i], 'pitch')):
-                continue
-            try:
-                intervalo_anterior = interval.Interval(noteStart=cf_notes_list[i-1], noteEnd=cp_notes_list[i-1])
-                intervalo_actual = interval.Interval(noteStart=cf_notes_list[i], noteEnd=cp_notes_list[i])
-                if buscar_quintas_octavas_paralelas(intervalo_anterior, intervalo_actual):
-                    errores.append(f"Quintas u octavas paralelas entre tiempo {i} y {i+1}.")
-            except Exception as e_paralelas:
-                print(f"Error al verificar paralelas en tiempo {i}-{i+1}: {e_paralelas}")
-    if min_len > 1:
-        for i in range(1, min_len):
-            if movimiento_directo_prohibido(cp_notes_list[i-1], cp_notes_list[i], cf_notes_list[i-1], cf_notes_list[i]):
-                try:
-                    intervalo_destino = interval.Interval(noteStart=cf_notes_list[i], noteEnd=cp_notes_list[i])
-                    errores.append(f"Movimiento directo a consonancia perfecta ({intervalo_destino.simpleName}) hacia tiempo {i+1}.")
-                except Exception as e_directo:
-                     print(f"Error al obtener intervalo destino en mov. directo tiempo {i+1}: {e_directo}")
-    
-    errores.extend(verificar_inicio_final_primera_especie(cp_notes_list, cf_notes_list))
-    
-    cp_part_name = cp_part.partName if cp_part.partName else "Contrapunto"
-    cf_part_name = cf_part.partName if cf_part.partName else "Cantus Firmus"
-
-    errores_cp_rep = detectar_notas_repetidas_en_voz(cp_notes_list, cp_part_name)
-    if errores_cp_rep: errores.extend(errores_cp_rep)
-    
-    errores_cruce = verificar_cruce_de_voces(cp_notes_list, cf_notes_list, cp_part_name, cf_part_name)
-    if errores_cruce: errores.extend(errores_cruce)
-
-    # --- ANÁLISIS DESCRIPTIVO ---
-    try:
-        observaciones_analiticas.append(f"--- Movimiento Melódico del {cp_part_name} ---")
-        observaciones_analiticas.extend(describir_movimiento_melodico_voz(cp_notes_list, cp_part_name))
-        
-        observaciones_analiticas.append(f"--- Movimiento Melódico del {cf_part_name} ---")
-        observaciones_analiticas.extend(describir_movimiento_melodico_voz(cf_notes_list, cf_part_name))
-        
-        observaciones_analiticas.append("--- Movimiento Entre Voces (Armónico/Contrapuntístico) ---")
-        observaciones_analiticas.extend(identificar_movimiento_entre_voces(cp_notes_list, cf_notes_list))
-
-        observaciones_analiticas.append("--- Patrones Específicos (Primera Especie) ---")
-        observaciones_analiticas.extend(identificar_patrones_primera_especie(cp_part, cf_part))
-    except Exception as e_desc:
-        print(f"Error durante el análisis descriptivo: {e_desc}")
-        observaciones_analiticas.append("Error generando análisis descriptivo.")
-
+    # Evento i: i-esima nota de cada voz (una de las dos puede haberse acabado).
+    total = max(len(cp_notes_list), len(cf_notes_list))
+    eventos = []
+    for i in range(total):
+        nota_cp = cp_notes_list[i] if i < len(cp_notes_list) else None
+        nota_cf = cf_notes_list[i] if i < len(cf_notes_list) else None
+        eventos.append(EventoVertical(nota_cp, nota_cf, 1.0, (nota_cp if nota_cp is not None else nota_cf).compas))
+    ctx = {
+        "eventos": eventos, "cp": cp_notes_list, "cf": cf_notes_list, "armonicos": {},
+        "cp_nombre": cp_voz.nombre if cp_voz.nombre else "Contrapunto",
+        "cf_nombre": cf_voz.nombre if cf_voz.nombre else "Cantus Firmus",
+    }
+    firmas = [(firma_nota(ev.cp), firma_nota(ev.cf)) for ev in eventos]
+    clave = (len(cp_notes_list), len(cf_notes_list), ctx["cp_nombre"], ctx["cf_nombre"])
+    hallazgos = evaluar_reglas(seleccionar_reglas(REGLAS_PRIMERA, sin_reglas), ctx, firmas, clave,
+                               memo, tiempos)
+    errores.extend(hallazgos.errores)
+    observaciones_analiticas.extend(hallazgos.observaciones)
     return errores, observaciones_analiticas
@@ -1,16 +1,19 @@
 # segunda_especie/analisis.py (v11 - Detección de Paralelas ACTIVADA)
 
-from music21 import stream, interval, note as m21note, tempo, meter, clef, key
+from analisis_musical_comun.alineacion import alinear_voces
+from analisis_musical_comun.diagnosticos import error
+from analisis_musical_comun.ventanas import evaluar_reglas, seleccionar_reglas
 from segunda_especie.reglas import (
-    analizar_figuras_disonantes_2da_especie,
-    verificar_inicio_final_segunda_especie_modificado,
-    quintas_octavas_consecutivas, # ¡Importante!
-    es_consonancia
+    REGLAS_SEGUNDA,
+    armonico,
+    contexto_segunda,
+    firmas_segunda,
 )
 import traceback
 
 class ResultadoAnalisisSegundaEspecie:
     def __init__(self, errores, evaluacion, datos_intervalos_svg, observaciones, ids_notas_rojas=None, movimientos_cp=None):
+        # errores y observaciones: diagnosticos (analisis_musical_comun.diagnosticos).
         self.errores = errores
         self.evaluacion = evaluacion
         self.datos_intervalos_svg = datos_intervalos_svg
@@ -25,7 +28,7 @@ def _calcular_movimientos_melodicos(notes_list):
     for i in range(len(notes_list) - 1):
         n1 = notes_list[i]; n2 = notes_list[i+1]
         if not hasattr(n1, 'id') or not hasattr(n2, 'id'): continue
-        p1 = n1.pitch.ps; p2 = n2.pitch.ps
+        p1 = n1.ps; p2 = n2.ps
         tipo = "lateral"
         if p2 > p1: tipo = "ascendente"
         elif p2 < p1: tipo = "descendente"
@@ -43,72 +46,53 @@ def identificar_cantus_firmus_y_contrapunto(score):
     if avg0 > avg1: return parts[0], parts[1], "Auto: Voz 1 es CF, Voz 2 es CP."
     else: return parts[1], parts[0], "Auto: Voz 2 es CF, Voz 1 es CP."
 
-def analizar_segunda_especie(score_original, cf_part, cp_part):
+def identificar_cf_cp_voces(voz_1, voz_2):
+    """Como identificar_cantus_firmus_y_contrapunto, con las voces compactas del lector rapido."""
+    if not voz_1.notas or not voz_2.notas: return voz_1, voz_2, "Advertencia: Partes vacías."
+    avg0 = sum([n.duracion for n in voz_1.notas]) / len(voz_1.notas)
+    avg1 = sum([n.duracion for n in voz_2.notas]) / len(voz_2.notas)
+    if avg0 > avg1: return voz_1, voz_2, "Auto: Voz 1 es CF, Voz 2 es CP."
+    else: return voz_2, voz_1, "Auto: Voz 2 es CF, Voz 1 es CP."
+
+def analizar_segunda_especie(cf_voz, cp_voz, memo=None, tiempos=None, sin_reglas=None):
+    """Reglas, intervalos y movimientos de 2da especie.
+
+    cf_voz, cp_voz: voces compactas (analisis_musical_comun.voces.extraer_voz).
+
+    memo: estado de la pasada anterior para re-evaluar solo las ventanas de reglas
+    que leen notas cambiadas (sesiones de re-analisis; ver ventanas.evaluar_reglas).
+    tiempos recibe el tiempo de cada regla; sin_reglas desactiva reglas por nombre.
+    """
     errores = []
     observaciones = []
     datos_intervalos_svg = [] 
     ids_notas_rojas = []      
     
     try:
-        # 1. Reglas Inicio/Final y Figuras (Lo que ya tenías)
-        errores.extend(verificar_inicio_final_segunda_especie_modificado(cf_part, cp_part))
-        err_fig, obs_fig, ids_fig = analizar_figuras_disonantes_2da_especie(cp_part, cf_part)
-        errores.extend(err_fig)
-        observaciones.extend(obs_fig)
-        ids_notas_rojas.extend(ids_fig)
-        
-        # 2. Preparar datos
-        cp_flat = list(cp_part.flatten().notes)
-        cf_flat_stream = cf_part.flatten()
-        
-        # Variables para rastrear el "Tiempo Fuerte Anterior" (Para detectar paralelas de compás a compás)
-        last_downbeat_cp = None
-        last_downbeat_cf = None
-        
-        # Variables para rastrear la nota INMEDIATAMENTE anterior (Para paralelas consecutivas directas)
-        prev_note_cp = None
-        prev_note_cf = None
+        # Alineacion vertical CP/CF: un solo barrido por ejercicio, compartido.
+        eventos = alinear_voces(cp_voz, cf_voz)
+        ctx = contexto_segunda(cp_voz, cf_voz, eventos)
 
-        for n_cp in cp_flat:
-            # Buscar nota CF simultánea
-            notes_cf_sim = cf_flat_stream.getElementsByOffset(n_cp.offset, mustBeginInSpan=False, classList=[m21note.Note])
-            if not notes_cf_sim: continue
-            n_cf = notes_cf_sim[0]
-
-            # Calcular intervalo para SVG
-            try:
-                inter = interval.Interval(noteStart=n_cf, noteEnd=n_cp)
-                datos_intervalos_svg.append((n_cp, n_cf, inter))
-                
-                # --- ANÁLISIS DE PARALELAS (LA PARTE NUEVA) ---
-                
-                # A. Paralelas Inmediatas (Nota a Nota)
-                if prev_note_cp and prev_note_cf:
-                    if quintas_octavas_consecutivas(prev_note_cf, prev_note_cp, n_cf, n_cp):
-                        errores.append(f"Error: {inter.simpleName} paralelas consecutivas en compás {n_cp.measureNumber}.")
-                        ids_notas_rojas.extend([n_cp.id, prev_note_cp.id])
-
-                # B. Paralelas de Tiempo Fuerte a Tiempo Fuerte (Regla Clave de 2da Especie)
-                # Si estamos en tiempo fuerte (beat 1)
-                if n_cp.beat == 1.0:
-                    if last_downbeat_cp and last_downbeat_cf:
-                        if quintas_octavas_consecutivas(last_downbeat_cf, last_downbeat_cp, n_cf, n_cp):
-                             errores.append(f"Error Crítico: {inter.simpleName} paralelas entre tiempos fuertes (Compases {last_downbeat_cp.measureNumber}-{n_cp.measureNumber}).")
-                             ids_notas_rojas.extend([n_cp.id, last_downbeat_cp.id])
-                    
-                    # Actualizar "último tiempo fuerte visto"
-                    last_downbeat_cp = n_cp
-                    last_downbeat_cf = n_cf
-
-            except Exception as e: 
-                print(f"Error calculando intervalo/reglas en nota {n_cp.id}: {e}")
-
-            # Actualizar nota inmediata anterior
-            prev_note_cp = n_cp
-            prev_note_cf = n_cf
+        # 1. Reglas, en una pasada: inicio/final, figuras (disonancias, unisonos,
+        # repeticiones, cruces) y paralelas nota a nota y entre tiempos fuertes.
+        firmas, clave = firmas_segunda(ctx)
+        hallazgos = evaluar_reglas(seleccionar_reglas(REGLAS_SEGUNDA, sin_reglas), ctx, firmas, clave,
+                                   memo, tiempos)
+        errores.extend(hallazgos.errores)
+        observaciones.extend(hallazgos.observaciones)
+        ids_notas_rojas.extend(hallazgos.ids_rojos)
+        
+        # 2. Intervalos para el SVG (los mismos que ya clasificaron las reglas)
+        for i, ev in enumerate(eventos):
+            if ev.cf is None: continue
+            inter = armonico(ctx, i)
+            if inter is None:
+                print(f"Error calculando intervalo en nota {ev.cp.id}")
+                continue
+            datos_intervalos_svg.append((ev.cp, ev.cf, inter))
 
         # 3. Movimientos Melódicos
-        movimientos_cp = _calcular_movimientos_melodicos(cp_flat)
+        movimientos_cp = _calcular_movimientos_melodicos(ctx["cp"])
 
         # 4. Evaluación
         if not errores:
@@ -120,4 +104,4 @@ def analizar_segunda_especie(score_original, cf_part, cp_part):
 
     except Exception as e:
         traceback.print_exc()
-        return ResultadoAnalisisSegundaEspecie([f"Error interno: {str(e)}"], "Error crítico", [], [], [], [])
\ No newline at end of file
+        return ResultadoAnalisisSegundaEspecie([error("error_interno", datos={"mensaje": str(e)})], "Error crítico", [], [], [], [])
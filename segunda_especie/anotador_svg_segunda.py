@@ -1,7 +1,6 @@
 # segunda_especie/anotador_svg_segunda.py (v29 - Alineación Perfecta / Pivote Fijo)
 
 import xml.etree.ElementTree as ET
-from music21 import interval as m21interval 
 import os 
 import re 
 
@@ -32,16 +31,16 @@ def _draw_line(group, c1, c2, ns, color="black", width="2.5", arrow_id=None):
 
 def _get_interval_text(interval_obj):
     if not interval_obj: return "?"
-    simple = str(interval_obj.simpleName)
+    simple = str(interval_obj.nombre_simple)
     num = "".join(filter(str.isdigit, simple)) or "?"
-    if interval_obj.generic.value > 8:
-        return f"{num}({interval_obj.generic.value})"
+    if interval_obj.generico > 8:
+        return f"{num}({interval_obj.generico})"
     return num
 
-def _calc_motion(n_cp_curr, n_cf_curr, n_cp_prev, n_cf_prev):
+def _calc_motion(n_cp_curr, n_cf_curr, n_cp_prev, n_cf_prev, inter_curr=None, inter_prev=None):
     try:
-        cp1, cp2 = n_cp_prev.pitch.ps, n_cp_curr.pitch.ps
-        cf1, cf2 = n_cf_prev.pitch.ps, n_cf_curr.pitch.ps
+        cp1, cp2 = n_cp_prev.ps, n_cp_curr.ps
+        cf1, cf2 = n_cf_prev.ps, n_cf_curr.ps
     except: return None, None
     
     d_cp = 1 if cp2 > cp1 else (-1 if cp2 < cp1 else 0)
@@ -49,79 +48,84 @@ def _calc_motion(n_cp_curr, n_cf_curr, n_cp_prev, n_cf_prev):
 
     if d_cp == 0 or d_cf == 0: return "O", "#6C757D" 
     if d_cp == d_cf:
-        try:
-            i1 = m21interval.Interval(n_cf_prev, n_cp_prev).simpleName
-            i2 = m21interval.Interval(n_cf_curr, n_cp_curr).simpleName
-            if i1 == i2: return "P", "#D93025" 
-        except: pass
+        # Intervalos armonicos ya clasificados por el analisis (datos_int).
+        if inter_prev and inter_curr and inter_prev.nombre_simple == inter_curr.nombre_simple:
+            return "P", "#D93025" 
         return "D", "#E69138" 
     return "C", "#28A745" 
 
-def anotar_svg_intervalos_2da_especie(svg_str, datos_int, coords, ids_notas_rojas=None, datos_movimiento_melodico_cp=None):
-    print("\n--- DEBUG (Anotador 2da): Iniciando v29 (Alineación Fija) ---")
-    if not datos_int or not coords: return svg_str
-    ids_red = set(ids_notas_rojas or [])
+# --- Capas de anotacion (verovio_pdf.CAPAS_ANOTACION["segunda"]) ---
+# Cada capa recibe el contexto de anotacion (dict) que arma verovio_pdf: "raiz" y
+# "grupo" (arbol SVG ya parseado y grupo donde dibujar), "coords" (indice_svg) y
+# "datos" (intervalos, ids_rojos, movimientos_cp del analisis).
 
-    try:
-        root = ET.fromstring(svg_str.split('?>', 1)[-1].strip() if '<?xml' in svg_str else svg_str)
-    except: return svg_str
-
-    _add_arrow(root, NAMESPACES_MAP, "arrow", "black")
-    group = root.find(".//svg:g[@class='page-margin']", NAMESPACES_MAP) or root
+# --- CONFIGURACIÓN VISUAL ---
+FONT_SIZE = 180
+Y_OFFSET_NUM = -(FONT_SIZE * 0.4)
+Y_OFFSET_LETRA = -(FONT_SIZE * 0.85)
+X_OFFSET = FONT_SIZE * 0.4
+COLOR_INTERVALO = "#0055AA"
+COLOR_ROJO = "#D93025"
 
-    # --- CONFIGURACIÓN VISUAL ---
-    FONT_SIZE = 180  
-    Y_OFFSET_NUM = -(FONT_SIZE * 0.4)
-    Y_OFFSET_LETRA = -(FONT_SIZE * 0.85)
-    X_OFFSET = FONT_SIZE * 0.4
+def _posiciones(ctx):
+    """(cp, cf, intervalo, x, y) de cada par con coordenadas; se calcula una vez por SVG."""
+    if "posiciones_2da" not in ctx:
+        coords, posiciones = ctx["coords"], []
+        # LÓGICA DE PIVOTE: la altura se fija con el primer par y se usa siempre.
+        fixed_y_base = None
+        for cp, cf, inter in ctx["datos"].get('intervalos') or []:
+            c_cp, c_cf = coords.get(getattr(cp,'id',None)), coords.get(getattr(cf,'id',None))
+            if not c_cp or not c_cf: continue
+            if fixed_y_base is None:
+                fixed_y_base = (c_cp['y'] + c_cf['y']) / 2 + Y_OFFSET_NUM
+            posiciones.append((cp, cf, inter, c_cp['x'] + X_OFFSET, fixed_y_base))
+        ctx["posiciones_2da"] = posiciones
+    return ctx["posiciones_2da"]
 
-    prev_cp, prev_cf = None, None
-    
-    # VARIABLE DE CONTROL PARA ALINEACIÓN
-    fixed_y_base = None 
-
-    # 1. DIBUJAR NÚMEROS Y LETRAS
-    for cp, cf, inter in datos_int:
-        c_cp, c_cf = coords.get(getattr(cp,'id',None)), coords.get(getattr(cf,'id',None))
-        if not c_cp or not c_cf: continue
-        
-        # LÓGICA DE PIVOTE:
-        # Si es la primera vez (fixed_y_base es None), calculamos la altura.
-        # Si no, usamos la que ya calculamos.
-        if fixed_y_base is None:
-            fixed_y_base = (c_cp['y'] + c_cf['y']) / 2 + Y_OFFSET_NUM
-        
-        # Usamos siempre la altura fija
-        y_final = fixed_y_base
-        x = c_cp['x'] + X_OFFSET
-        
-        col = "#D93025" if getattr(cp,'id',None) in ids_red else "#0055AA"
-        
-        # Número Intervalo
-        txt = ET.SubElement(group, f"{{{SVG_NS}}}text", {
-            "x": str(x), "y": str(y_final), "font-family": "Arial", 
-            "font-size": str(FONT_SIZE), "fill": col, "text-anchor": "middle"
+def capa_intervalos(ctx):
+    """Número de intervalo sobre cada nota del CP."""
+    textos = ctx.setdefault("textos_intervalo_2da", {})
+    for cp, cf, inter, x, y in _posiciones(ctx):
+        txt = ET.SubElement(ctx["grupo"], f"{{{SVG_NS}}}text", {
+            "x": str(x), "y": str(y), "font-family": "Arial",
+            "font-size": str(FONT_SIZE), "fill": COLOR_INTERVALO, "text-anchor": "middle"
         })
         txt.text = _get_interval_text(inter)
-        
-        # Letra Movimiento (C, P, D, O)
-        if prev_cp and prev_cf:
-            letra, col_mov = _calc_motion(cp, cf, prev_cp, prev_cf)
+        textos[getattr(cp,'id',None)] = txt
+
+def capa_movimiento(ctx):
+    """Letra de movimiento entre voces (C, P, D, O) respecto al par anterior."""
+    # El par anterior se toma de todo el ejercicio: el primer par de una pagina
+    # tambien lleva letra.
+    posiciones = {id(cp): (x, y) for cp, cf, inter, x, y in _posiciones(ctx)}
+    prev = None
+    for cp, cf, inter in ctx["datos"].get('intervalos') or []:
+        x, y = posiciones.get(id(cp), (None, None))
+        if prev and x is not None:
+            letra, col_mov = _calc_motion(cp, cf, prev[0], prev[1], inter, prev[2])
             if letra:
-                l_txt = ET.SubElement(group, f"{{{SVG_NS}}}text", {
-                    "x": str(x), "y": str(y_final + Y_OFFSET_LETRA), # Usamos también y_final
+                l_txt = ET.SubElement(ctx["grupo"], f"{{{SVG_NS}}}text", {
+                    "x": str(x), "y": str(y + Y_OFFSET_LETRA),
                     "font-family": "Arial",
                     "font-size": str(FONT_SIZE * 0.8), "fill": col_mov, "font-weight": "bold", "text-anchor": "middle"
                 })
                 l_txt.text = letra
-        prev_cp, prev_cf = cp, cf
+        prev = (cp, cf, inter)
 
-    # 2. FLECHAS
-    if datos_movimiento_melodico_cp:
-        for id1, id2, dir_str in datos_movimiento_melodico_cp:
-            c1, c2 = coords.get(id1), coords.get(id2)
-            if c1 and c2:
-                col = "green" if dir_str == "ascendente" else "red"
-                _draw_line(group, c1, c2, NAMESPACES_MAP, col, "4.0", "arrow")
+def capa_flechas(ctx):
+    """Flechas de movimiento melódico del CP (verde sube, rojo baja)."""
+    _add_arrow(ctx["raiz"], NAMESPACES_MAP, "arrow", "black")
+    coords = ctx["coords"]
+    for id1, id2, dir_str in ctx["datos"].get('movimientos_cp') or []:
+        c1, c2 = coords.get(id1), coords.get(id2)
+        if c1 and c2:
+            col = "green" if dir_str == "ascendente" else "red"
+            _draw_line(ctx["grupo"], c1, c2, NAMESPACES_MAP, col, "4.0", "arrow")
 
-    return ET.tostring(root, encoding="unicode")
\ No newline at end of file
+def capa_notas_rojas(ctx):
+    """Resalta en rojo el intervalo de las notas con error (requiere la capa de intervalos)."""
+    textos = ctx.get("textos_intervalo_2da", {})
+    for id_nota in ctx["datos"].get('ids_rojos') or []:
+        txt = textos.get(id_nota)
+        if txt is not None:
+            txt.set("fill", COLOR_ROJO)
@@ -1,186 +1,274 @@
 # segunda_especie/reglas.py (v12 - Set de Reglas COMPLETO: Unísonos, Repeticiones y Cruces)
 
-from music21 import interval, note, stream, meter
+from analisis_musical_comun.intervalos import clasificar
+from analisis_musical_comun.alineacion import alinear_voces
+from analisis_musical_comun.diagnosticos import error, observacion
+from analisis_musical_comun.voces import Nota, misma_altura
+from analisis_musical_comun.ventanas import EXTREMOS, PAR, PAR_FUERTE, TERNA, Hallazgos, Regla, firma_nota
 
 # --- FUNCIONES AUXILIARES ---
 
+def _intervalo_consonante(intervalo_obj):
+    if intervalo_obj is None or intervalo_obj.nombre_simple == 'P4': return False
+    return intervalo_obj.es_consonante
+
+def _clasificar_seguro(nota_cf, nota_cp):
+    try: return clasificar(nota_cf, nota_cp)
+    except Exception: return None
+
 def es_consonancia(nota_cf, nota_cp):
-    if not isinstance(nota_cf, note.Note) or not isinstance(nota_cp, note.Note): return False
-    try:
-        intervalo_obj = interval.Interval(nota_cf, nota_cp)
-        if intervalo_obj.simpleName == 'P4': return False 
-        return intervalo_obj.isConsonant()
-    except: return False
+    if not isinstance(nota_cf, Nota) or not isinstance(nota_cp, Nota): return False
+    return _intervalo_consonante(_clasificar_seguro(nota_cf, nota_cp))
 
 def es_disonancia(nota_cf, nota_cp):
-    if not isinstance(nota_cf, note.Note) or not isinstance(nota_cp, note.Note): return False 
+    if not isinstance(nota_cf, Nota) or not isinstance(nota_cp, Nota): return False
     return not es_consonancia(nota_cf, nota_cp)
 
+def perfectas_consecutivas(int_ant, int_actual):
+    """Igual que quintas_octavas_consecutivas, sobre intervalos ya clasificados."""
+    if int_ant is None or int_actual is None: return False
+    if int_actual.nombre_simple not in ['P1', 'P5', 'P8']: return False
+    return int_ant.nombre_simple == int_actual.nombre_simple
+
 def quintas_octavas_consecutivas(cf_ant, cp_ant, cf_actual, cp_actual):
     notes_list = [cf_ant, cp_ant, cf_actual, cp_actual]
-    if not all(isinstance(n, note.Note) for n in notes_list): return False
+    if not all(isinstance(n, Nota) for n in notes_list): return False
     try:
-        int_ant = interval.Interval(cf_ant, cp_ant)
-        int_actual = interval.Interval(cf_actual, cp_actual)
-        if int_actual.simpleName not in ['P1', 'P5', 'P8']: return False
-        if int_ant.simpleName == int_actual.simpleName: return True
+        return perfectas_consecutivas(clasificar(cf_ant, cp_ant), clasificar(cf_actual, cp_actual))
     except Exception: return False
-    return False
 
 # --- REGLAS DE INICIO Y FINAL ---
 
-def verificar_inicio_final_segunda_especie_modificado(cf_part, cp_part):
+def verificar_inicio_final_segunda_especie_modificado(cf_voz, cp_voz):
+    """Inicio y final de 2da especie sobre las voces compactas (voces.Voz)."""
     errores = []
-    cf_flat_notes = [n for n in cf_part.flatten().notes if isinstance(n, note.Note)]
-    cp_flat_elements = [n for n in cp_part.flatten().notesAndRests if isinstance(n, (note.Note, note.Rest))]
+    cf_flat_notes = cf_voz.notas
+    # Primeras figuras del CP (notas y silencios; los acordes no cuentan).
+    cp_inicio = [f for f in cp_voz.inicio if f.clase != "otro"]
     
-    if not cf_flat_notes or not cp_flat_elements: return ["Error: Partes vacías o inválidas."]
+    if not cf_flat_notes or not cp_inicio: return [error("voces_vacias")]
     
     cf_primera = cf_flat_notes[0]
     cp_primera_armonica = None
     
     # 1. Inicio
-    elem0 = cp_flat_elements[0]
-    if elem0.isRest:
-        if elem0.duration.quarterLength == 2.0:
-            if len(cp_flat_elements) > 1 and isinstance(cp_flat_elements[1], note.Note):
-                cp_primera_armonica = cp_flat_elements[1]
-            else: errores.append("Regla Inicio: Silencio inicial no seguido de nota.")
-        elif elem0.duration.quarterLength == 4.0: pass 
-        else: errores.append("Regla Inicio: El silencio inicial debe ser de blanca.")
-    elif isinstance(elem0, note.Note):
-        cp_primera_armonica = elem0
-    else: errores.append("Regla Inicio: Elemento inicial desconocido.")
+    elem0 = cp_inicio[0]
+    if elem0.clase == "silencio":
+        if elem0.duracion == 2.0:
+            if len(cp_inicio) > 1 and cp_inicio[1].clase == "nota":
+                cp_primera_armonica = cp_voz.notas[0]
+            else: errores.append(error("silencio_inicial_sin_nota", compas=cf_primera.compas))
+        elif elem0.duracion == 4.0: pass 
+        else: errores.append(error("silencio_inicial_no_blanca", compas=cf_primera.compas))
+    elif elem0.clase == "nota":
+        cp_primera_armonica = cp_voz.notas[0]
+    else: errores.append(error("inicio_desconocido", compas=cf_primera.compas))
         
     if cp_primera_armonica:
         try:
-            int_ini = interval.Interval(cf_primera, cp_primera_armonica)
-            if int_ini.simpleName not in ['P1', 'P5', 'P8']:
-                errores.append(f"Regla Inicio: Debe comenzar con consonancia perfecta (1, 5, 8). Encontrado: {int_ini.simpleName}.")
+            int_ini = clasificar(cf_primera, cp_primera_armonica)
+            if int_ini.nombre_simple not in ['P1', 'P5', 'P8']:
+                errores.append(error("inicio_no_valido", compas=cp_primera_armonica.compas,
+                                     tiempo=cp_primera_armonica.tiempo, intervalo=int_ini.nombre_simple,
+                                     notas=(cp_primera_armonica.id, cf_primera.id)))
         except: pass
 
     # 2. Final
     cf_ultima = cf_flat_notes[-1]
-    cp_notas_reales = [n for n in cp_flat_elements if isinstance(n, note.Note)]
+    cp_notas_reales = cp_voz.notas
     if not cp_notas_reales: return errores
     cp_ultima = cp_notas_reales[-1]
     
-    if cp_ultima.duration.quarterLength < 4.0:
-         errores.append(f"Regla Final: La última nota del CP debe ser una redonda. Es {cp_ultima.duration.type}.")
+    if cp_ultima.duracion < 4.0:
+         errores.append(error("final_no_redonda", compas=cp_ultima.compas, tiempo=cp_ultima.tiempo,
+                              notas=(cp_ultima.id,), voz="cp", datos={"tipo_nota": cp_ultima.tipo}))
     
     try:
-        int_fin = interval.Interval(cf_ultima, cp_ultima)
-        if int_fin.simpleName not in ['P1', 'P8']:
-             errores.append(f"Regla Final: Debe terminar en Octava o Unísono. Encontrado: {int_fin.simpleName}.")
+        int_fin = clasificar(cf_ultima, cp_ultima)
+        if int_fin.nombre_simple not in ['P1', 'P8']:
+             errores.append(error("final_no_valido", compas=cp_ultima.compas, tiempo=cp_ultima.tiempo,
+                                  intervalo=int_fin.nombre_simple, notas=(cp_ultima.id, cf_ultima.id)))
     except: pass
     
     if len(cp_notas_reales) > 1:
         cp_penultima = cp_notas_reales[-2]
         try:
-            mov_final = interval.Interval(cp_penultima, cp_ultima)
-            if not mov_final.isStep:
-                errores.append(f"Regla Final: Se debe llegar a la nota final por grado conjunto. Salto: {mov_final.simpleName}.")
+            mov_final = clasificar(cp_penultima, cp_ultima)
+            if not mov_final.es_grado_conjunto:
+                errores.append(error("final_por_salto", compas=cp_ultima.compas, tiempo=cp_ultima.tiempo,
+                                     intervalo=mov_final.nombre_simple, movimiento="salto", voz="cp",
+                                     notas=(cp_penultima.id, cp_ultima.id)))
         except: pass
 
     return errores
 
-# --- ANÁLISIS CUERPO (DISONANCIAS, UNÍSONOS, REPETICIONES) ---
+# --- REGISTRO DE REGLAS ---
+# Cada regla declara la forma de sus ventanas (ver analisis_musical_comun.ventanas)
+# sobre los eventos verticales de alinear_voces: el evento i es la i-esima nota del
+# CP con la nota del CF que suena en su ataque. ctx: ver contexto_segunda. Los
+# hallazgos son diagnosticos (analisis_musical_comun.diagnosticos).
 
-def analizar_figuras_disonantes_2da_especie(cp_part_obj, cf_part_obj):
-    errores = []
-    observaciones = []
-    ids_rojos = []
-    
-    cp_notes = [n for n in cp_part_obj.flatten().notes if isinstance(n, note.Note)]
-    cf_flat = cf_part_obj.flatten()
-    # Solo notas reales del CF: descarta SystemLayout, Clef, TimeSignature, etc.
-    cf_notes = [n for n in cf_flat.notes if isinstance(n, note.Note)]
+def contexto_segunda(cp_voz, cf_voz, eventos=None):
+    """Contexto de las reglas: eventos, notas del CP y direccion de referencia CF->CP."""
+    if eventos is None:
+        eventos = alinear_voces(cp_voz, cf_voz)
+    cp_notes = [ev.cp for ev in eventos]
+    # Solo notas reales del CF (la Voz ya descarta SystemLayout, Clef, TimeSignature, etc.).
+    cf_primera = cf_voz.notas[0] if cf_voz.notas else None
 
     # Dirección de referencia (inicio) calculada UNA sola vez y de forma segura.
     # Antes se usaba cf_flat[0], que podía ser un SystemLayout -> AttributeError 'pitch'.
     direccion_referencia = None
-    if cf_notes and cp_notes:
+    if cf_primera is not None and cp_notes:
         try:
-            direccion_referencia = interval.Interval(cf_notes[0], cp_notes[0]).direction
+            direccion_referencia = clasificar(cf_primera, cp_notes[0]).direccion
         except Exception:
             direccion_referencia = None
+    return {"eventos": eventos, "cp": cp_notes, "cf_voz": cf_voz, "cp_voz": cp_voz,
+            "cf_primera": cf_primera, "direccion_referencia": direccion_referencia, "armonicos": {}}
+
+def armonico(ctx, i):
+    """Intervalo CF->CP del evento i (None sin CF o si no se puede clasificar), una vez por evento."""
+    armonicos = ctx["armonicos"]
+    if i not in armonicos:
+        ev = ctx["eventos"][i]
+        armonicos[i] = _clasificar_seguro(ev.cf, ev.cp) if ev.cf is not None else None
+    return armonicos[i]
+
+def _inicio_final(ctx, i):
+    return Hallazgos(verificar_inicio_final_segunda_especie_modificado(ctx["cf_voz"], ctx["cp_voz"]))
+
+def _figuras(ctx, i):
+    """Disonancias, unisonos, repeticiones y cruces del evento i."""
+    errores = []
+    observaciones = []
+    ids_rojos = []
+    eventos, cp_notes = ctx["eventos"], ctx["cp"]
+    ev = eventos[i]
+    cp_curr, cf_curr = ev.cp, ev.cf
+    if cf_curr is None: return None
 
-    for i in range(len(cp_notes)):
-        cp_curr = cp_notes[i]
-        cf_simultaneas = cf_flat.getElementsByOffset(cp_curr.offset, mustBeginInSpan=False, classList=[note.Note])
-        if not cf_simultaneas: continue
-        cf_curr = cf_simultaneas[0]
+    # Intervalo armonico CF->CP: una sola clasificacion para disonancia,
+    # cruce y unisono.
+    int_armonico = armonico(ctx, i)
+    disonante = not _intervalo_consonante(int_armonico)
+    nombre_armonico = int_armonico.nombre_simple if int_armonico else None
+    direccion_referencia = ctx["direccion_referencia"]
+    # Campos comunes de los diagnosticos del evento.
+    campos = dict(compas=ev.compas, tiempo=ev.tiempo, evento=i + 1, notas=(cp_curr.id, cf_curr.id),
+                  intervalo=nombre_armonico)
         
-        # --- NUEVA REGLA: NOTAS REPETIDAS ---
-        if i > 0:
-            cp_prev = cp_notes[i-1]
-            if cp_curr.pitch == cp_prev.pitch:
-                errores.append(f"Compás {cp_curr.measureNumber}: Nota repetida. En 2da especie debe haber movimiento constante.")
-                ids_rojos.append(cp_curr.id)
+    # --- NUEVA REGLA: NOTAS REPETIDAS ---
+    if i > 0:
+        cp_prev = cp_notes[i-1]
+        if misma_altura(cp_curr, cp_prev):
+            errores.append(error("nota_repetida", **dict(campos, notas=(cp_prev.id, cp_curr.id)),
+                                 movimiento="repeticion", voz="cp"))
+            ids_rojos.append(cp_curr.id)
 
-        # --- NUEVA REGLA: CRUCE DE VOCES ---
-        try:
-            # Si es intervalo negativo (ej. -P5), hubo cruce
-            int_cruce = interval.Interval(cf_curr, cp_curr)
-            if direccion_referencia is not None and int_cruce.direction != direccion_referencia:
-                # Comparación simple: si la dirección del intervalo cambia respecto al inicio, hubo cruce
-                # (Asumiendo que no cruzan en la primera nota)
-                errores.append(f"Compás {cp_curr.measureNumber}: Cruce de voces detectado ({int_cruce.niceName}). Evitar cruces.")
-                ids_rojos.append(cp_curr.id)
-        except: pass
+    # --- NUEVA REGLA: CRUCE DE VOCES ---
+    # Si es intervalo negativo (ej. -P5), hubo cruce
+    if int_armonico is not None and direccion_referencia is not None and int_armonico.direccion != direccion_referencia:
+        # Comparación simple: si la dirección del intervalo cambia respecto al inicio, hubo cruce
+        # (Asumiendo que no cruzan en la primera nota)
+        errores.append(error("cruce", **campos, datos={"intervalo_largo": int_armonico.nombre_largo}))
+        ids_rojos.append(cp_curr.id)
 
-        # --- REGLAS DE TIEMPOS ---
+    # --- REGLAS DE TIEMPOS ---
         
-        # 1. TIEMPO FUERTE (Beat 1)
-        if cp_curr.beat == 1.0:
-            # Disonancia en tiempo fuerte
-            if es_disonancia(cf_curr, cp_curr):
-                int_obj = interval.Interval(cf_curr, cp_curr)
-                errores.append(f"Error en Compás {cp_curr.measureNumber}: Disonancia ({int_obj.simpleName}) en tiempo fuerte. Debe ser consonancia.")
-                ids_rojos.append(cp_curr.id)
+    # 1. TIEMPO FUERTE (Beat 1)
+    if ev.tiempo == 1.0:
+        # Disonancia en tiempo fuerte
+        if disonante:
+            errores.append(error("disonancia", **campos))
+            ids_rojos.append(cp_curr.id)
             
-            # --- NUEVA REGLA: UNÍSONO EN TIEMPO FUERTE ---
-            # Permitido solo en primer y último compás
-            try:
-                int_uni = interval.Interval(cf_curr, cp_curr)
-                if int_uni.simpleName == 'P1':
-                    es_inicio = (i == 0)
-                    es_final = (i == len(cp_notes) - 1)
-                    if not es_inicio and not es_final:
-                        errores.append(f"Error en Compás {cp_curr.measureNumber}: Unísono en tiempo fuerte. Solo permitido al inicio o final.")
-                        ids_rojos.append(cp_curr.id)
-            except: pass
+        # --- NUEVA REGLA: UNÍSONO EN TIEMPO FUERTE ---
+        # Permitido solo en primer y último compás
+        if int_armonico is not None and int_armonico.nombre_simple == 'P1':
+            es_inicio = (i == 0)
+            es_final = (i == len(cp_notes) - 1)
+            if not es_inicio and not es_final:
+                errores.append(error("unisono_fuerte", **campos))
+                ids_rojos.append(cp_curr.id)
         
-        # 2. TIEMPO DÉBIL
-        else:
-            if es_disonancia(cf_curr, cp_curr):
-                es_nota_paso = False
-                problema = "Disonancia no justificada"
+    # 2. TIEMPO DÉBIL
+    else:
+        if disonante:
+            es_nota_paso = False
+            detalles = None  # sin detalles: disonancia no justificada
                 
-                if i > 0 and i < len(cp_notes) - 1:
-                    cp_prev = cp_notes[i-1]; cp_next = cp_notes[i+1]
-                    try:
-                        int_in = interval.Interval(cp_prev, cp_curr)
-                        int_out = interval.Interval(cp_curr, cp_next)
+            if i > 0 and i < len(cp_notes) - 1:
+                cp_prev = cp_notes[i-1]; cp_next = cp_notes[i+1]
+                try:
+                    int_in = clasificar(cp_prev, cp_curr)
+                    int_out = clasificar(cp_curr, cp_next)
                         
-                        step_in = int_in.isStep
-                        step_out = int_out.isStep
-                        mismo_sentido = (int_in.direction == int_out.direction)
+                    step_in = int_in.es_grado_conjunto
+                    step_out = int_out.es_grado_conjunto
+                    mismo_sentido = (int_in.direccion == int_out.direccion)
                         
-                        if step_in and step_out and mismo_sentido:
-                            es_nota_paso = True
-                            observaciones.append(f"Compás {cp_curr.measureNumber}: Nota de paso correcta.")
-                        else:
-                            detalles = []
-                            if not step_in: detalles.append("entrada por salto")
-                            if not step_out: detalles.append("salida por salto")
-                            if not mismo_sentido and step_in and step_out: detalles.append("bordadura (evitar en estricto)")
-                            problema = f"Disonancia mal tratada ({', '.join(detalles)})"
-                    except: pass
+                    if step_in and step_out and mismo_sentido:
+                        es_nota_paso = True
+                        observaciones.append(observacion(
+                            "nota_de_paso", **dict(campos, notas=(cp_prev.id, cp_curr.id, cp_next.id, cf_curr.id))))
+                    else:
+                        detalles = []
+                        if not step_in: detalles.append("entrada por salto")
+                        if not step_out: detalles.append("salida por salto")
+                        if not mismo_sentido and step_in and step_out: detalles.append("bordadura (evitar en estricto)")
+                except: pass
                 
-                if not es_nota_paso:
-                    int_obj = interval.Interval(cf_curr, cp_curr)
-                    errores.append(f"Error en Compás {cp_curr.measureNumber}: {problema}. Disonancia ({int_obj.simpleName}) debe ser nota de paso.")
-                    ids_rojos.append(cp_curr.id)
+            if not es_nota_paso:
+                errores.append(error("disonancia_debil", **campos, datos={"detalles": detalles}))
+                ids_rojos.append(cp_curr.id)
+
+    return Hallazgos(errores, observaciones, ids_rojos)
+
+def _paralelas(ctx, i):
+    """Justas paralelas nota a nota y de tiempo fuerte a tiempo fuerte hacia el evento i."""
+    errores, ids_rojos = [], []
+    ev = ctx["eventos"][i]
+    n_cp = ev.cp
+    if ev.cf is None: return None
+    inter = armonico(ctx, i)
+    if inter is None: return None
+
+    # A. Paralelas Inmediatas (Nota a Nota)
+    flujo = ctx["flujo"]
+    prev = flujo.previo[i]
+    if prev is not None:
+        if perfectas_consecutivas(armonico(ctx, prev), inter):
+            errores.append(error("paralelas", compas=ev.compas, tiempo=ev.tiempo, evento=i + 1,
+                                 notas=(ctx["eventos"][prev].cp.id, ctx["eventos"][prev].cf.id, n_cp.id, ev.cf.id),
+                                 intervalo=inter.nombre_simple, movimiento="parallel"))
+            ids_rojos.extend([n_cp.id, ctx["eventos"][prev].cp.id])
+
+    # B. Paralelas de Tiempo Fuerte a Tiempo Fuerte (Regla Clave de 2da Especie)
+    if ev.tiempo == 1.0:
+        fuerte = flujo.previo_fuerte[i]
+        if fuerte is not None:
+            anterior = ctx["eventos"][fuerte]
+            if perfectas_consecutivas(armonico(ctx, fuerte), inter):
+                errores.append(error("paralelas_fuertes", compas=anterior.compas, compas_fin=ev.compas,
+                                     tiempo=ev.tiempo, evento=i + 1,
+                                     notas=(anterior.cp.id, anterior.cf.id, n_cp.id, ev.cf.id),
+                                     intervalo=inter.nombre_simple, movimiento="parallel"))
+                ids_rojos.extend([n_cp.id, anterior.cp.id])
+    return Hallazgos(errores, (), ids_rojos)
+
+# En el orden en que aparecen en errores, observaciones e ids rojos.
+REGLAS_SEGUNDA = [
+    Regla("inicio_final", (EXTREMOS,), _inicio_final),
+    Regla("figuras", (TERNA,), _figuras),
+    Regla("paralelas", (PAR, PAR_FUERTE), _paralelas),
+]
 
-    return errores, observaciones, ids_rojos
\ No newline at end of file
+def firmas_segunda(ctx):
+    """Firma de cada evento y clave global (lo que leen las reglas fuera de sus ventanas)."""
+    firmas = [(firma_nota(ev.cp), firma_nota(ev.cf), ev.tiempo, ev.compas) for ev in ctx["eventos"]]
+    cf_notas = ctx["cf_voz"].notas
+    clave = (len(firmas), firma_nota(cf_notas[0]) if cf_notas else None,
+             firma_nota(cf_notas[-1]) if cf_notas else None,
+             ctx["cp_voz"].inicio, ctx["direccion_referencia"])
+    return firmas, clave
@@ -0,0 +1,244 @@
+# sesiones.py - Sesiones de re-analisis incremental de un ejercicio.
+#
+# Un alumno corrige una o dos notas y vuelve a enviar el ejercicio. La sesion
+# guarda el score parseado, el estado de las reglas (memo de ventanas, ver
+# analisis_musical_comun/ventanas.py) y la firma de la notacion compas a compas.
+# Cada version nueva, un MusicXML completo o un parche por compases:
+#   - se compara compas a compas con la anterior;
+#   - sin cambios de notacion devuelve el resultado anterior, sin analizar ni
+#     renderizar;
+#   - con cambios re-evalua solo las ventanas de reglas que leen notas cambiadas y
+#     vuelve a generar la partitura anotada y el informe (en memoria).
+# Con un parche no se vuelve a parsear: se editan los compases del score guardado.
+#
+# Las sesiones viven en el proceso que las crea; la API las aloja en un proceso
+# dedicado y llama a las funciones de modulo (crear_sesion, actualizar_sesion...).
+#
+# Parche: {"compases": {"3": {"cp": ["E4", "F4"]}, "7": {"cf": ["D3:4"]}}}
+# Cada nota es "<altura>[:<duracion en negras>]" o "r[:<duracion>]" (silencio); sin
+# duracion se conserva la de la figura que ocupa esa posicion en el compas. Las
+# duraciones de un compas deben sumar lo mismo que antes.
+
+import copy
+import io
+import time
+from collections import OrderedDict
+
+import cli_runner
+from metricas import Traza
+
+MAX_SESIONES = 64
+
+
+class SesionNoEncontrada(KeyError):
+    """La sesion no existe en este proceso (cerrada, expulsada o de otro proceso)."""
+
+
+class ParcheNoValido(ValueError):
+    """El parche no se puede aplicar al score de la sesion."""
+
+
+def firmas_compases(score):
+    """(voz, compas) -> firma de su notacion: figuras, alturas, claves y armaduras."""
+    from music21 import stream
+    firmas = {("voces", 0): tuple(p.partName for p in score.parts)}
+    for v, part in enumerate(score.parts):
+        for m in part.getElementsByClass(stream.Measure):
+            figuras = tuple(
+                (float(el.offset), el.nameWithOctave if el.isNote else el.name,
+                 float(el.duration.quarterLength), el.tie.type if el.tie else None)
+                for el in m.recurse().notesAndRests)
+            contexto = tuple(str(el) for el in (m.clef, m.keySignature, m.timeSignature) if el is not None)
+            firmas[(v, m.number)] = (figuras, contexto)
+    return firmas
+
+
+def _figura(token, duracion_anterior):
+    from music21 import note
+    texto, _, duracion = token.strip().partition(":")
+    if duracion:
+        try:
+            duracion = float(duracion)
+        except ValueError:
+            raise ParcheNoValido(f"Duracion no valida en '{token}'.")
+    elif duracion_anterior is None:
+        raise ParcheNoValido(f"'{token}' necesita duracion: no hay figura en esa posicion del compas.")
+    else:
+        duracion = duracion_anterior
+    if duracion <= 0:
+        raise ParcheNoValido(f"Duracion no valida en '{token}'.")
+    if texto.lower() in ("r", "silencio"):
+        return note.Rest(quarterLength=duracion)
+    try:
+        return note.Note(texto, quarterLength=duracion)
+    except Exception:
+        raise ParcheNoValido(f"Altura no valida: '{texto}'.")
+
+
+def aplicar_parche(voces, parche):
+    """Sustituye las figuras de los compases del parche. voces: {"cp": Part, "cf": Part}.
+
+    Valida todo el parche antes de tocar el score; ParcheNoValido si no es aplicable.
+    """
+    compases = parche.get("compases") if isinstance(parche, dict) else None
+    if not isinstance(compases, dict) or not compases:
+        raise ParcheNoValido('El parche debe ser {"compases": {"<n>": {"cp"|"cf": [notas]}}}.')
+    cambios = []
+    for numero, por_voz in compases.items():
+        if not isinstance(por_voz, dict) or not por_voz:
+            raise ParcheNoValido(f"Compas {numero}: se espera {{\"cp\"|\"cf\": [notas]}}.")
+        for voz, tokens in por_voz.items():
+            if voz not in voces:
+                raise ParcheNoValido(f"Voz no valida: '{voz}'. Use {sorted(voces)}.")
+            if not isinstance(tokens, list) or not tokens:
+                raise ParcheNoValido(f"Compas {numero} ({voz}): se espera una lista de notas.")
+            try:
+                medida = voces[voz].measure(int(numero))
+            except ValueError:
+                raise ParcheNoValido(f"Numero de compas no valido: '{numero}'.")
+            if medida is None:
+                raise ParcheNoValido(f"Compas {numero} ({voz}) no existe.")
+            if medida.hasVoices():
+                raise ParcheNoValido(f"Compas {numero} ({voz}) tiene varias voces: no admite parches.")
+            actuales = list(medida.getElementsByClass(["Note", "Rest"]))
+            nuevas = [_figura(t, actuales[i].duration.quarterLength if i < len(actuales) else None)
+                      for i, t in enumerate(tokens)]
+            antes = sum(el.duration.quarterLength for el in actuales)
+            ahora = sum(el.duration.quarterLength for el in nuevas)
+            if ahora != antes:
+                raise ParcheNoValido(f"Compas {numero} ({voz}): las duraciones suman {ahora:g}, "
+                                     f"se esperaban {antes:g}.")
+            cambios.append((medida, actuales, nuevas))
+
+    for medida, actuales, nuevas in cambios:
+        inicio = actuales[0].offset if actuales else 0.0
+        medida.remove(actuales)
+        for el in nuevas:
+            medida.insert(inicio, el)
+            inicio += el.duration.quarterLength
+    # Los offsets absolutos (flatten) de las partes se recalculan al pedirlos.
+    for part in voces.values():
+        part.coreElementsChanged()
+
+
+class SesionAnalisis:
+    """Estado de un ejercicio entre versiones: score, memo de reglas y ultimos PDFs."""
+
+    def __init__(self, especie, cf_index=1, modo_pdf="raster", capas=None, sin_reglas=None):
+        self.especie = especie
+        self.cf_index = cf_index
+        self.modo_pdf = modo_pdf
+        self.capas = capas
+        self.sin_reglas = sin_reglas
+        self.version = 0
+        self.score = None
+        self.firmas = {}
+        self.memo = {}
+        self.resultado = None
+
+    def voces(self, score=None):
+        """{"cp": Part, "cf": Part} del score (por defecto, el de la sesion)."""
+        score = score if score is not None else self.score
+        parts = cli_runner._normalizar_part_ids(score)
+        if self.especie == "primera":
+            return {"cf": parts[self.cf_index], "cp": parts[1 - self.cf_index]}
+        from segunda_especie.analisis import identificar_cantus_firmus_y_contrapunto
+        cf, cp, _ = identificar_cantus_firmus_y_contrapunto(score)
+        return {"cf": cf, "cp": cp}
+
+    def actualizar(self, datos):
+        """Nueva version completa (bytes del MusicXML)."""
+        return self._analizar(cli_runner._parsear_partitura(datos))
+
+    def parchear(self, parche):
+        """Nueva version editando compases del score guardado, sin volver a parsear."""
+        score = copy.deepcopy(self.score)
+        aplicar_parche(self.voces(score), parche)
+        return self._analizar(score)
+
+    def _analizar(self, score):
+        firmas = firmas_compases(score)
+        distintas = [clave for clave in set(firmas) | set(self.firmas)
+                     if firmas.get(clave) != self.firmas.get(clave)]
+        cambiados = sorted({numero for voz, numero in distintas if voz != "voces"})
+        if self.resultado is not None and not distintas:
+            return dict(self.resultado, compases_cambiados=[], renderizado=False,
+                        reglas_evaluadas=0, reglas_reutilizadas=0, pdf=None, informe=None)
+
+        memo = copy.copy(self.memo)
+        pdf, informe = io.BytesIO(), io.BytesIO()
+        traza = Traza(f"sesion v{self.version + 1}")
+        detalle = {"tiempos": traza}
+        inicio = time.perf_counter()
+        if self.especie == "primera":
+            ruta = cli_runner.procesar_primera(score, pdf, self.cf_index, True, detalle, self.modo_pdf,
+                                               informe, capas=self.capas, memo=memo,
+                                               sin_reglas=self.sin_reglas)
+        else:
+            ruta = cli_runner.procesar_segunda(score, pdf, True, detalle, self.modo_pdf, informe,
+                                               capas=self.capas, memo=memo, sin_reglas=self.sin_reglas)
+        if ruta is None:
+            raise RuntimeError("No se genero el PDF anotado.")
+
+        # Solo una version analizada con exito pasa a ser el estado de la sesion.
+        self.score, self.firmas, self.memo = score, firmas, memo
+        self.version += 1
+        self.resultado = {
+            "version": self.version,
+            "errores": len(detalle["errores"]),
+            "mensajes": detalle["errores"],
+            "diagnosticos": detalle["diagnosticos"],
+            "evaluacion": detalle["evaluacion"],
+            "tiempo_s": round(time.perf_counter() - inicio, 3),
+            "traza": traza.arbol(),
+        }
+        return dict(self.resultado, compases_cambiados=cambiados, renderizado=True,
+                    reglas_evaluadas=memo.get("evaluadas", 0),
+                    reglas_reutilizadas=memo.get("reutilizadas", 0),
+                    pdf=pdf.getvalue(), informe=informe.getvalue())
+
+
+# --- Registro de sesiones del proceso (LRU) ---
+_SESIONES = OrderedDict()
+
+
+def iniciar_proceso(max_sesiones=MAX_SESIONES):
+    """Initializer del proceso de sesiones de la API: limite LRU y pipeline precargado."""
+    global MAX_SESIONES
+    MAX_SESIONES = max_sesiones
+    cli_runner.precalentar()
+
+
+def _sesion(sesion_id):
+    sesion = _SESIONES.get(sesion_id)
+    if sesion is None:
+        raise SesionNoEncontrada(sesion_id)
+    _SESIONES.move_to_end(sesion_id)
+    return sesion
+
+
+def crear_sesion(sesion_id, datos, especie, cf_index=1, modo_pdf="raster", capas=None, sin_reglas=None):
+    """Analiza la primera version y registra la sesion; expulsa la menos usada si sobran."""
+    sesion = SesionAnalisis(especie, cf_index, modo_pdf, capas, sin_reglas)
+    resultado = sesion.actualizar(datos)
+    _SESIONES[sesion_id] = sesion
+    while len(_SESIONES) > MAX_SESIONES:
+        _SESIONES.popitem(last=False)
+    return resultado
+
+
+def actualizar_sesion(sesion_id, datos):
+    """Nueva version completa de la sesion. SesionNoEncontrada si no existe."""
+    return _sesion(sesion_id).actualizar(datos)
+
+
+def parchear_sesion(sesion_id, parche):
+    """Parche por compases sobre la ultima version. SesionNoEncontrada si no existe;
+    ParcheNoValido si no aplica."""
+    return _sesion(sesion_id).parchear(parche)
+
+
+def cerrar_sesion(sesion_id):
+    """Olvida la sesion. SesionNoEncontrada si no existe."""
+    if _SESIONES.pop(sesion_id, None) is None:
+        raise SesionNoEncontrada(sesion_id)
@@ -0,0 +1,683 @@
+# svg_vectorial.py - SVG de Verovio (ya anotado) -> operaciones de dibujo PDF vectoriales.
+#
+# Alternativa al camino raster de verovio_pdf (resvg -> PNG -> reportlab): recorre el
+# arbol SVG y emite trazados, lineas y texto directamente en un canvas de reportlab.
+# El <svg viewBox> anidado de Verovio se aplana como una transformacion mas, de modo
+# que las coordenadas de la partitura y las de las anotaciones quedan en el mismo
+# sistema. Los glifos SMuFL (<use> -> <defs>) se emiten una sola vez como Form
+# XObject por glifo/estilo y se reutilizan, lo que mantiene el PDF pequeno.
+#
+# Cubre el subconjunto de SVG que producen Verovio y los anotadores: svg/g/use,
+# path, line, polyline, polygon, rect, circle, ellipse, text/tspan, marker (en
+# line/polyline) y reglas <style> simples por etiqueta o etiqueta.clase.
+
+import math
+import re
+import xml.etree.ElementTree as ET
+
+from reportlab.lib import colors as rl_colors
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas as rl_canvas
+from reportlab.pdfgen.canvas import FILL_EVEN_ODD, FILL_NON_ZERO
+
+SVG_NS = "http://www.w3.org/2000/svg"
+XLINK_HREF = "{http://www.w3.org/1999/xlink}href"
+
+# Propiedades que heredan los hijos; 'opacity' y 'display' no se heredan.
+_HEREDADAS = (
+    "fill", "fill-opacity", "fill-rule", "stroke", "stroke-width", "stroke-opacity",
+    "stroke-linecap", "stroke-linejoin", "stroke-dasharray", "color",
+    "font-family", "font-size", "font-weight", "font-style",
+    "text-anchor", "dominant-baseline", "visibility",
+)
+_PROPIEDADES = frozenset(_HEREDADAS + ("opacity", "display"))
+
+_ESTILO_INICIAL = {
+    "fill": "black", "fill-opacity": "1", "fill-rule": "nonzero",
+    "stroke": "none", "stroke-width": "1", "stroke-opacity": "1",
+    "stroke-linecap": "butt", "stroke-linejoin": "miter", "stroke-dasharray": "none",
+    "color": "black", "font-family": "serif", "font-size": "16",
+    "font-weight": "normal", "font-style": "normal",
+    "text-anchor": "start", "dominant-baseline": "auto", "visibility": "visible",
+    "opacity": "1", "display": "inline",
+}
+
+_NO_RENDERIZABLES = frozenset((
+    "defs", "symbol", "marker", "clipPath", "mask", "pattern", "linearGradient",
+    "radialGradient", "style", "title", "desc", "metadata", "script",
+))
+
+_CAPS = {"butt": 0, "round": 1, "square": 2}
+_JOINS = {"miter": 0, "round": 1, "bevel": 2}
+
+_RE_NUMERO = re.compile(r"[-+]?(?:\d*\.\d+|\d+\.?)(?:[eE][-+]?\d+)?")
+_RE_TOKEN_PATH = re.compile(r"[MmLlHhVvCcSsQqTtAaZz]|" + _RE_NUMERO.pattern)
+_RE_TRANSFORM = re.compile(r"(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)")
+_RE_REGLA_CSS = re.compile(r"([^{}]+)\{([^{}]*)\}")
+
+_IDENTIDAD = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+
+def _tag(el):
+    return el.tag.rsplit("}", 1)[-1] if isinstance(el.tag, str) else ""
+
+
+def _numero(valor, defecto=0.0, referencia=None):
+    """Longitud SVG en unidades de usuario ('12', '12px', '50%')."""
+    if valor is None:
+        return defecto
+    valor = str(valor).strip()
+    try:
+        if valor.endswith("%"):
+            return float(valor[:-1]) / 100.0 * (referencia if referencia is not None else 0.0)
+        if valor.endswith("px") or valor.endswith("pt"):
+            valor = valor[:-2]
+        return float(valor)
+    except ValueError:
+        return defecto
+
+
+def _numeros(valor):
+    return [float(x) for x in _RE_NUMERO.findall(valor or "")]
+
+
+def _multiplicar(m1, m2):
+    """m1 * m2 en la notacion (a, b, c, d, e, f) de SVG/PDF."""
+    a1, b1, c1, d1, e1, f1 = m1
+    a2, b2, c2, d2, e2, f2 = m2
+    return (a1 * a2 + c1 * b2, b1 * a2 + d1 * b2,
+            a1 * c2 + c1 * d2, b1 * c2 + d1 * d2,
+            a1 * e2 + c1 * f2 + e1, b1 * e2 + d1 * f2 + f1)
+
+
+def _parsear_transform(valor):
+    m = _IDENTIDAD
+    for nombre, args in _RE_TRANSFORM.findall(valor or ""):
+        v = _numeros(args)
+        if nombre == "matrix" and len(v) == 6:
+            t = tuple(v)
+        elif nombre == "translate" and v:
+            t = (1, 0, 0, 1, v[0], v[1] if len(v) > 1 else 0.0)
+        elif nombre == "scale" and v:
+            t = (v[0], 0, 0, v[1] if len(v) > 1 else v[0], 0, 0)
+        elif nombre == "rotate" and v:
+            r = math.radians(v[0])
+            t = (math.cos(r), math.sin(r), -math.sin(r), math.cos(r), 0, 0)
+            if len(v) == 3:
+                t = _multiplicar(_multiplicar((1, 0, 0, 1, v[1], v[2]), t), (1, 0, 0, 1, -v[1], -v[2]))
+        elif nombre == "skewX" and v:
+            t = (1, 0, math.tan(math.radians(v[0])), 1, 0, 0)
+        elif nombre == "skewY" and v:
+            t = (1, math.tan(math.radians(v[0])), 0, 1, 0, 0)
+        else:
+            continue
+        m = _multiplicar(m, t)
+    return m
+
+
+def _matriz_viewbox(viewbox, ancho, alto, aspecto):
+    """Transformacion viewBox -> viewport segun preserveAspectRatio."""
+    vb = _numeros(viewbox)
+    if len(vb) != 4 or vb[2] <= 0 or vb[3] <= 0:
+        return _IDENTIDAD
+    vx, vy, vw, vh = vb
+    sx, sy = ancho / vw, alto / vh
+    partes = (aspecto or "xMidYMid meet").split()
+    alinear = partes[0] if partes else "xMidYMid"
+    if alinear == "none":
+        return (sx, 0, 0, sy, -vx * sx, -vy * sy)
+    s = max(sx, sy) if (len(partes) > 1 and partes[1] == "slice") else min(sx, sy)
+    tx, ty = -vx * s, -vy * s
+    if "xMid" in alinear:
+        tx += (ancho - vw * s) / 2
+    elif "xMax" in alinear:
+        tx += ancho - vw * s
+    if "YMid" in alinear:
+        ty += (alto - vh * s) / 2
+    elif "YMax" in alinear:
+        ty += alto - vh * s
+    return (s, 0, 0, s, tx, ty)
+
+
+def _parsear_css(texto):
+    """Reglas 'etiqueta', '.clase' o 'etiqueta.clase' (el ultimo selector simple)."""
+    reglas = []
+    for selectores, cuerpo in _RE_REGLA_CSS.findall(texto or ""):
+        declaraciones = _parsear_declaraciones(cuerpo)
+        if not declaraciones:
+            continue
+        for selector in selectores.split(","):
+            simple = selector.split()[-1] if selector.split() else ""
+            etiqueta, _, clase = simple.partition(".")
+            if etiqueta.startswith("#") or not (etiqueta or clase):
+                continue
+            reglas.append((etiqueta or None, clase or None, declaraciones))
+    return reglas
+
+
+def _parsear_declaraciones(texto):
+    declaraciones = {}
+    for decl in (texto or "").split(";"):
+        nombre, _, valor = decl.partition(":")
+        nombre = nombre.strip()
+        if nombre in _PROPIEDADES and valor.strip():
+            declaraciones[nombre] = valor.strip()
+    return declaraciones
+
+
+def _color(valor, estilo):
+    """Color de reportlab o None ('none')."""
+    if valor is None or valor == "none":
+        return None
+    if valor == "currentColor":
+        valor = estilo.get("color", "black")
+        if valor == "currentColor":
+            valor = "black"
+    try:
+        return rl_colors.toColor(valor)
+    except ValueError:
+        return rl_colors.black
+
+
+def _fuente(estilo):
+    """Fuente estandar de PDF mas cercana a font-family/weight/style."""
+    familia = estilo["font-family"].lower()
+    peso = estilo["font-weight"]
+    negrita = peso in ("bold", "bolder") or (peso.isdigit() and int(peso) >= 600)
+    cursiva = estilo["font-style"] in ("italic", "oblique")
+    if any(n in familia for n in ("arial", "helvetica", "sans")):
+        base, sufijos = "Helvetica", ("", "-Bold", "-Oblique", "-BoldOblique")
+    elif any(n in familia for n in ("courier", "mono")):
+        base, sufijos = "Courier", ("", "-Bold", "-Oblique", "-BoldOblique")
+    else:
+        base, sufijos = "Times", ("-Roman", "-Bold", "-Italic", "-BoldItalic")
+    return base + sufijos[(2 if cursiva else 0) + (1 if negrita else 0)]
+
+
+class _Renderizador:
+    """Recorre un arbol SVG y lo dibuja sobre un canvas de reportlab."""
+
+    def __init__(self, canvas, raiz, prefijo="svg"):
+        self.c = canvas
+        self.raiz = raiz
+        self.prefijo = prefijo  # nombres de XObject unicos si varias paginas comparten canvas
+        self.por_id = {el.get("id"): el for el in raiz.iter() if el.get("id")}
+        self.css = []
+        for el in raiz.iter(f"{{{SVG_NS}}}style"):
+            self.css.extend(_parsear_css(el.text))
+        self.formas = {}
+
+    # --- estilo ---
+    def estilo_de(self, el, padre):
+        estilo = {k: padre[k] for k in _HEREDADAS}
+        estilo["opacity"], estilo["display"] = "1", "inline"
+        for nombre in _PROPIEDADES:
+            valor = el.get(nombre)
+            if valor is not None and valor != "inherit":
+                estilo[nombre] = valor
+        if self.css:
+            etiqueta, clases = _tag(el), (el.get("class") or "").split()
+            for sel_tag, sel_clase, decl in self.css:
+                if (sel_tag is None or sel_tag == etiqueta) and (sel_clase is None or sel_clase in clases):
+                    estilo.update(decl)
+        if el.get("style"):
+            estilo.update(_parsear_declaraciones(el.get("style")))
+        if estilo["opacity"] != "1":
+            op = _numero(estilo["opacity"], 1.0)
+            estilo["fill-opacity"] = str(_numero(estilo["fill-opacity"], 1.0) * op)
+            estilo["stroke-opacity"] = str(_numero(estilo["stroke-opacity"], 1.0) * op)
+        return estilo
+
+    def _pintar(self, p, estilo, rellenar=True, modo=FILL_NON_ZERO):
+        """Rellena y/o traza el path `p` con el estilo ya resuelto."""
+        c = self.c
+        relleno = _color(estilo["fill"], estilo) if rellenar else None
+        trazo = _color(estilo["stroke"], estilo)
+        ancho = _numero(estilo["stroke-width"], 1.0)
+        if trazo is not None and ancho <= 0:
+            trazo = None
+        if relleno is None and trazo is None:
+            return
+        alfa_relleno = _numero(estilo["fill-opacity"], 1.0)
+        alfa_trazo = _numero(estilo["stroke-opacity"], 1.0)
+        # La transparencia se aisla en su propio q/Q para no filtrarse a los hermanos.
+        aislar = (relleno is not None and alfa_relleno < 1) or (trazo is not None and alfa_trazo < 1)
+        if aislar:
+            c.saveState()
+        if relleno is not None:
+            c.setFillColor(relleno)
+            if alfa_relleno < 1:
+                c.setFillAlpha(alfa_relleno)
+        if trazo is not None:
+            c.setStrokeColor(trazo)
+            if alfa_trazo < 1:
+                c.setStrokeAlpha(alfa_trazo)
+            c.setLineWidth(ancho)
+            c.setLineCap(_CAPS.get(estilo["stroke-linecap"], 0))
+            c.setLineJoin(_JOINS.get(estilo["stroke-linejoin"], 0))
+            guiones = _numeros(estilo["stroke-dasharray"]) if estilo["stroke-dasharray"] != "none" else []
+            c.setDash(guiones if any(guiones) else [])
+        c.drawPath(p, stroke=int(trazo is not None), fill=int(relleno is not None), fillMode=modo)
+        if aislar:
+            c.restoreState()
+
+    # --- recorrido ---
+    def dibujar(self, el, estilo_padre, viewport):
+        etiqueta = _tag(el)
+        if etiqueta in _NO_RENDERIZABLES or not etiqueta:
+            return
+        estilo = self.estilo_de(el, estilo_padre)
+        if estilo["display"] == "none":
+            return
+        metodo = getattr(self, f"_dibujar_{etiqueta}", None)
+        if metodo is None:
+            return
+        transform = el.get("transform")
+        if transform:
+            self.c.saveState()
+            self.c.transform(*_parsear_transform(transform))
+        try:
+            metodo(el, estilo, viewport)
+        finally:
+            if transform:
+                self.c.restoreState()
+
+    def _hijos(self, el, estilo, viewport):
+        for hijo in el:
+            self.dibujar(hijo, estilo, viewport)
+
+    _dibujar_g = _hijos
+    _dibujar_a = _hijos
+
+    def _dibujar_svg(self, el, estilo, viewport):
+        ancho = _numero(el.get("width"), viewport[0], viewport[0])
+        alto = _numero(el.get("height"), viewport[1], viewport[1])
+        m = (1, 0, 0, 1, _numero(el.get("x"), 0.0, viewport[0]), _numero(el.get("y"), 0.0, viewport[1]))
+        if el.get("viewBox"):
+            m = _multiplicar(m, _matriz_viewbox(el.get("viewBox"), ancho, alto, el.get("preserveAspectRatio")))
+            vb = _numeros(el.get("viewBox"))
+            interno = (vb[2], vb[3]) if len(vb) == 4 else (ancho, alto)
+        else:
+            interno = (ancho, alto)
+        self.c.saveState()
+        self.c.transform(*m)
+        self._hijos(el, estilo, interno)
+        self.c.restoreState()
+
+    def _dibujar_use(self, el, estilo, viewport):
+        href = el.get(XLINK_HREF) or el.get("href") or ""
+        destino = self.por_id.get(href[1:]) if href.startswith("#") else None
+        if destino is None:
+            return
+        clave = (href, tuple(estilo[k] for k in _HEREDADAS))
+        nombre = self.formas.get(clave)
+        if nombre is None:
+            # Cada glifo/estilo se dibuja una vez como XObject y se reutiliza.
+            nombre = f"{self.prefijo}{len(self.formas)}"
+            self.c.beginForm(nombre, -1e6, -1e6, 1e6, 1e6)
+            if _tag(destino) == "symbol":
+                self._hijos(destino, self.estilo_de(destino, estilo), viewport)
+            else:
+                self.dibujar(destino, estilo, viewport)
+            self.c.endForm()
+            self.formas[clave] = nombre
+        x, y = _numero(el.get("x")), _numero(el.get("y"))
+        if x or y:
+            self.c.saveState()
+            self.c.translate(x, y)
+            self.c.doForm(nombre)
+            self.c.restoreState()
+        else:
+            self.c.doForm(nombre)
+
+    # --- formas ---
+    def _dibujar_path(self, el, estilo, viewport):
+        p = self.c.beginPath()
+        if _construir_path(p, el.get("d") or ""):
+            modo = FILL_EVEN_ODD if estilo["fill-rule"] == "evenodd" else FILL_NON_ZERO
+            self._pintar(p, estilo, modo=modo)
+
+    def _dibujar_rect(self, el, estilo, viewport):
+        w = _numero(el.get("width"), 0.0, viewport[0])
+        h = _numero(el.get("height"), 0.0, viewport[1])
+        if w <= 0 or h <= 0:
+            return
+        x, y = _numero(el.get("x"), 0.0, viewport[0]), _numero(el.get("y"), 0.0, viewport[1])
+        r = _numero(el.get("rx") or el.get("ry"), 0.0)
+        p = self.c.beginPath()
+        if r > 0:
+            p.roundRect(x, y, w, h, min(r, w / 2, h / 2))
+        else:
+            p.rect(x, y, w, h)
+        self._pintar(p, estilo)
+
+    def _dibujar_circle(self, el, estilo, viewport):
+        r = _numero(el.get("r"))
+        if r > 0:
+            p = self.c.beginPath()
+            p.circle(_numero(el.get("cx")), _numero(el.get("cy")), r)
+            self._pintar(p, estilo)
+
+    def _dibujar_ellipse(self, el, estilo, viewport):
+        rx, ry = _numero(el.get("rx")), _numero(el.get("ry"))
+        if rx > 0 and ry > 0:
+            p = self.c.beginPath()
+            p.ellipse(_numero(el.get("cx")) - rx, _numero(el.get("cy")) - ry, 2 * rx, 2 * ry)
+            self._pintar(p, estilo)
+
+    def _dibujar_line(self, el, estilo, viewport):
+        puntos = [(_numero(el.get("x1")), _numero(el.get("y1"))),
+                  (_numero(el.get("x2")), _numero(el.get("y2")))]
+        self._polilinea(el, estilo, puntos, cerrar=False, rellenar=False)
+
+    def _dibujar_polyline(self, el, estilo, viewport):
+        v = _numeros(el.get("points"))
+        self._polilinea(el, estilo, list(zip(v[0::2], v[1::2])), cerrar=False)
+
+    def _dibujar_polygon(self, el, estilo, viewport):
+        v = _numeros(el.get("points"))
+        self._polilinea(el, estilo, list(zip(v[0::2], v[1::2])), cerrar=True)
+
+    def _polilinea(self, el, estilo, puntos, cerrar, rellenar=True):
+        if len(puntos) < 2:
+            return
+        p = self.c.beginPath()
+        p.moveTo(*puntos[0])
+        for punto in puntos[1:]:
+            p.lineTo(*punto)
+        if cerrar:
+            p.close()
+        self._pintar(p, estilo, rellenar=rellenar)
+        ancho = _numero(estilo["stroke-width"], 1.0)
+        for atributo, punto, previo, inicio in (("marker-start", puntos[0], puntos[1], True),
+                                                ("marker-end", puntos[-1], puntos[-2], False)):
+            referencia = el.get(atributo) or ""
+            m = re.match(r"url\(#([^)]+)\)", referencia)
+            marcador = self.por_id.get(m.group(1)) if m else None
+            if marcador is not None:
+                if inicio:
+                    angulo = math.atan2(previo[1] - punto[1], previo[0] - punto[0])
+                else:
+                    angulo = math.atan2(punto[1] - previo[1], punto[0] - previo[0])
+                self._marcador(marcador, punto, angulo, ancho, inicio)
+
+    def _marcador(self, marcador, punto, angulo, ancho_trazo, inicio):
+        orient = marcador.get("orient", "0")
+        if orient == "auto-start-reverse":
+            angulo = angulo + math.pi if inicio else angulo
+        elif orient != "auto":
+            angulo = math.radians(_numero(orient))
+        escala = ancho_trazo if marcador.get("markerUnits", "strokeWidth") == "strokeWidth" else 1.0
+        mw = _numero(marcador.get("markerWidth"), 3.0) * escala
+        mh = _numero(marcador.get("markerHeight"), 3.0) * escala
+        vb = marcador.get("viewBox")
+        m = _matriz_viewbox(vb, mw, mh, marcador.get("preserveAspectRatio")) if vb else (escala, 0, 0, escala, 0, 0)
+        # refX/refY estan en el sistema del marcador (antes del viewBox).
+        rx, ry = _numero(marcador.get("refX")), _numero(marcador.get("refY"))
+        ref_x, ref_y = m[0] * rx + m[2] * ry + m[4], m[1] * rx + m[3] * ry + m[5]
+        c = self.c
+        c.saveState()
+        c.translate(*punto)
+        c.rotate(math.degrees(angulo))
+        c.translate(-ref_x, -ref_y)
+        c.transform(*m)
+        self._hijos(marcador, self.estilo_de(marcador, _ESTILO_INICIAL), (mw, mh))
+        c.restoreState()
+
+    # --- texto ---
+    def _dibujar_text(self, el, estilo, viewport):
+        tramos = []
+        self._tramos_texto(el, estilo, tramos)
+        cursor_x, cursor_y = 0.0, 0.0
+        bloque = []
+        for tramo in tramos + [None]:
+            # Un x/y absoluto abre un nuevo bloque de texto (anclado por separado).
+            if tramo is None or (bloque and (tramo[2] is not None or tramo[3] is not None)):
+                cursor_x, cursor_y = self._pintar_bloque(bloque, cursor_x, cursor_y)
+                bloque = []
+            if tramo is not None:
+                bloque.append(tramo)
+
+    def _tramos_texto(self, el, estilo, tramos):
+        x, y = el.get("x"), el.get("y")
+        posicion = [_numero(x.split()[0]) if x else None, _numero(y.split()[0]) if y else None,
+                    _numero(el.get("dx")), _numero(el.get("dy"))]
+        if el.text:
+            tramos.append((el.text, estilo, *posicion))
+            posicion = [None, None, 0.0, 0.0]
+        for hijo in el:
+            etiqueta = _tag(hijo)
+            if etiqueta in ("tspan", "a"):
+                if posicion[0] is not None or posicion[1] is not None or posicion[2] or posicion[3]:
+                    tramos.append(("", estilo, *posicion))
+                    posicion = [None, None, 0.0, 0.0]
+                self._tramos_texto(hijo, self.estilo_de(hijo, estilo), tramos)
+            if hijo.tail:
+                tramos.append((hijo.tail, estilo, *posicion))
+                posicion = [None, None, 0.0, 0.0]
+        if posicion[0] is not None or posicion[1] is not None:
+            tramos.append(("", estilo, *posicion))
+
+    def _pintar_bloque(self, bloque, cursor_x, cursor_y):
+        if not bloque:
+            return cursor_x, cursor_y
+        primero = bloque[0]
+        x = primero[2] if primero[2] is not None else cursor_x
+        y = primero[3] if primero[3] is not None else cursor_y
+        # Espacios en blanco como xml:space="default": sin saltos, colapsados.
+        piezas, anterior_espacio = [], True
+        for texto, estilo, _, _, dx, dy in bloque:
+            texto = re.sub(r"[ \t\r\n]+", " ", texto.replace("\n", ""))
+            if anterior_espacio:
+                texto = texto.lstrip(" ")
+            tamano = _numero(estilo["font-size"], 16.0)
+            if texto and tamano > 0:
+                anterior_espacio = texto.endswith(" ")
+            piezas.append([texto, estilo, dx, dy, tamano])
+        for pieza in reversed(piezas):
+            if pieza[4] > 0:
+                pieza[0] = pieza[0].rstrip(" ")
+                if pieza[0]:
+                    break
+
+        ancho_total = sum(stringWidth(t, _fuente(e), tam) + dx
+                          for t, e, dx, _, tam in piezas if tam > 0)
+        ancla = primero[1]["text-anchor"]
+        if ancla == "middle":
+            x -= ancho_total / 2
+        elif ancla == "end":
+            x -= ancho_total
+
+        c = self.c
+        for texto, estilo, dx, dy, tamano in piezas:
+            x, y = x + dx, y + dy
+            if not texto or tamano <= 0:
+                continue
+            fuente = _fuente(estilo)
+            ancho = stringWidth(texto, fuente, tamano)
+            relleno = _color(estilo["fill"], estilo)
+            if relleno is not None and estilo["visibility"] == "visible":
+                base = estilo["dominant-baseline"]
+                ajuste = 0.35 if base in ("middle", "central") else (0.8 if base in ("hanging", "text-before-edge") else 0.0)
+                c.saveState()
+                c.setFillColor(relleno)
+                c.setFillAlpha(_numero(estilo["fill-opacity"], 1.0))
+                c.translate(x, y + ajuste * tamano)
+                c.scale(1, -1)
+                c.setFont(fuente, tamano)
+                c.drawString(0, 0, texto)
+                c.restoreState()
+            x += ancho
+        return x, y
+
+
+def _construir_path(p, d):
+    """Traduce el atributo 'd' a un path de reportlab. False si esta vacio."""
+    tokens = _RE_TOKEN_PATH.findall(d)
+    i, comando = 0, None
+    x = y = x0 = y0 = 0.0
+    ctrl = None           # ultimo punto de control (para S/T reflejados)
+    ultimo_cuadratico = None
+    dibujado = False
+
+    def leer(n):
+        nonlocal i
+        valores = [float(t) for t in tokens[i:i + n]]
+        i += n
+        return valores
+
+    while i < len(tokens):
+        if tokens[i].isalpha():
+            comando = tokens[i]
+            i += 1
+            if comando in "Zz":
+                p.close()
+                x, y = x0, y0
+                ctrl = ultimo_cuadratico = None
+                continue
+        elif comando is None:
+            break
+        relativo = comando.islower()
+        c = comando.upper()
+        aridad = {"M": 2, "L": 2, "H": 1, "V": 1, "C": 6, "S": 4, "Q": 4, "T": 2, "A": 7}[c]
+        if i + aridad > len(tokens) or any(t.isalpha() for t in tokens[i:i + aridad]):
+            break
+        v = leer(aridad)
+        ox, oy = (x, y) if relativo else (0.0, 0.0)
+        nuevo_ctrl = nuevo_cuadratico = None
+        if c == "M":
+            x, y = v[0] + ox, v[1] + oy
+            x0, y0 = x, y
+            p.moveTo(x, y)
+            comando = "l" if relativo else "L"  # pares extra tras M son lineTo
+        elif c == "L":
+            x, y = v[0] + ox, v[1] + oy
+            p.lineTo(x, y)
+        elif c == "H":
+            x = v[0] + (x if relativo else 0.0)
+            p.lineTo(x, y)
+        elif c == "V":
+            y = v[0] + (y if relativo else 0.0)
+            p.lineTo(x, y)
+        elif c in "CS":
+            if c == "C":
+                x1, y1 = v[0] + ox, v[1] + oy
+                v = v[2:]
+            else:
+                x1, y1 = (2 * x - ctrl[0], 2 * y - ctrl[1]) if ctrl else (x, y)
+            x2, y2, x, y = v[0] + ox, v[1] + oy, v[2] + ox, v[3] + oy
+            p.curveTo(x1, y1, x2, y2, x, y)
+            nuevo_ctrl = (x2, y2)
+        elif c in "QT":
+            if c == "Q":
+                qx, qy = v[0] + ox, v[1] + oy
+                v = v[2:]
+            else:
+                qx, qy = (2 * x - ultimo_cuadratico[0], 2 * y - ultimo_cuadratico[1]) \
+                    if ultimo_cuadratico else (x, y)
+            fx, fy = v[0] + ox, v[1] + oy
+            p.curveTo(x + 2 / 3 * (qx - x), y + 2 / 3 * (qy - y),
+                      fx + 2 / 3 * (qx - fx), fy + 2 / 3 * (qy - fy), fx, fy)
+            x, y = fx, fy
+            nuevo_cuadratico = (qx, qy)
+        elif c == "A":
+            fx, fy = v[5] + ox, v[6] + oy
+            for curva in _arco_a_beziers(x, y, v[0], v[1], v[2], v[3] != 0, v[4] != 0, fx, fy):
+                p.curveTo(*curva)
+            x, y = fx, fy
+        ctrl, ultimo_cuadratico = nuevo_ctrl, nuevo_cuadratico
+        dibujado = True
+    return dibujado
+
+
+def _arco_a_beziers(x1, y1, rx, ry, rotacion, grande, barrido, x2, y2):
+    """Arco elíptico SVG (parametrizacion por extremos) -> curvas cubicas."""
+    if rx == 0 or ry == 0 or (x1 == x2 and y1 == y2):
+        return [(x1, y1, x2, y2, x2, y2)]
+    rx, ry = abs(rx), abs(ry)
+    phi = math.radians(rotacion)
+    cos_p, sin_p = math.cos(phi), math.sin(phi)
+    dx, dy = (x1 - x2) / 2, (y1 - y2) / 2
+    x1p, y1p = cos_p * dx + sin_p * dy, -sin_p * dx + cos_p * dy
+    lam = (x1p / rx) ** 2 + (y1p / ry) ** 2
+    if lam > 1:
+        rx, ry = rx * math.sqrt(lam), ry * math.sqrt(lam)
+    num = rx * rx * ry * ry - rx * rx * y1p * y1p - ry * ry * x1p * x1p
+    den = rx * rx * y1p * y1p + ry * ry * x1p * x1p
+    coef = math.sqrt(max(0.0, num / den)) if den else 0.0
+    if grande == barrido:
+        coef = -coef
+    cxp, cyp = coef * rx * y1p / ry, -coef * ry * x1p / rx
+    cx = cos_p * cxp - sin_p * cyp + (x1 + x2) / 2
+    cy = sin_p * cxp + cos_p * cyp + (y1 + y2) / 2
+
+    def angulo(ux, uy, vx, vy):
+        return math.atan2(ux * vy - uy * vx, ux * vx + uy * vy)
+
+    t1 = angulo(1, 0, (x1p - cxp) / rx, (y1p - cyp) / ry)
+    dt = angulo((x1p - cxp) / rx, (y1p - cyp) / ry, (-x1p - cxp) / rx, (-y1p - cyp) / ry)
+    if not barrido and dt > 0:
+        dt -= 2 * math.pi
+    elif barrido and dt < 0:
+        dt += 2 * math.pi
+
+    segmentos = max(1, int(math.ceil(abs(dt) / (math.pi / 2))))
+    paso = dt / segmentos
+    k = 4 / 3 * math.tan(paso / 4)
+    curvas = []
+
+    def punto(t):
+        ex, ey = rx * math.cos(t), ry * math.sin(t)
+        return cx + cos_p * ex - sin_p * ey, cy + sin_p * ex + cos_p * ey
+
+    def derivada(t):
+        ex, ey = -rx * math.sin(t), ry * math.cos(t)
+        return cos_p * ex - sin_p * ey, sin_p * ex + cos_p * ey
+
+    t = t1
+    for _ in range(segmentos):
+        (ax, ay), (bx, by) = punto(t), punto(t + paso)
+        (dax, day), (dbx, dby) = derivada(t), derivada(t + paso)
+        curvas.append((ax + k * dax, ay + k * day, bx - k * dbx, by - k * dby, bx, by))
+        t += paso
+    return curvas
+
+
+def _dibujar_pagina(c, svg_content, prefijo):
+    """Dibuja un SVG como la pagina actual del canvas y la cierra."""
+    texto = svg_content.split("?>", 1)[-1].strip() if svg_content.lstrip().startswith("<?xml") else svg_content
+    raiz = ET.fromstring(texto)
+    vb = _numeros(raiz.get("viewBox"))
+    ancho = _numero(raiz.get("width"), vb[2] if len(vb) == 4 else 0.0)
+    alto = _numero(raiz.get("height"), vb[3] if len(vb) == 4 else 0.0)
+    if ancho <= 0 or alto <= 0:
+        raise ValueError("SVG sin dimensiones de pagina (width/height o viewBox).")
+
+    c.setPageSize((ancho, alto))
+    # SVG tiene el origen arriba a la izquierda y el eje y hacia abajo.
+    c.translate(0, alto)
+    c.scale(1, -1)
+    render = _Renderizador(c, raiz, prefijo)
+    estilo = render.estilo_de(raiz, _ESTILO_INICIAL)
+    # La raiz ya define la pagina: solo se aplica su viewBox, si lo tiene.
+    if len(vb) == 4:
+        c.transform(*_matriz_viewbox(raiz.get("viewBox"), ancho, alto, raiz.get("preserveAspectRatio")))
+        viewport = (vb[2], vb[3])
+    else:
+        viewport = (ancho, alto)
+    render._hijos(raiz, estilo, viewport)
+    c.showPage()
+
+
+def dibujar_svg_en_pdf(svg_content, destino):
+    """Escribe el SVG como PDF vectorial en `destino` (ruta o fichero binario).
+
+    svg_content es un SVG o una lista de SVG (una pagina del PDF por cada uno).
+    El tamano de cada pagina es el width/height de su <svg> raiz (1 px = 1 pt),
+    igual que en el camino raster.
+    """
+    paginas = [svg_content] if isinstance(svg_content, str) else svg_content
+    c = rl_canvas.Canvas(destino)
+    for n, pagina in enumerate(paginas, 1):
+        _dibujar_pagina(c, pagina, "svg" if n == 1 else f"p{n}svg")
+    c.save()
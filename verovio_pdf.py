@@ -2,101 +2,212 @@
 
 import os
 import io
-import verovio
-import shutil
-import traceback
-import xml.etree.ElementTree as ET
+import collections
+import concurrent.futures
+import contextlib
+import itertools
+import json
+import math
 import re
-from music21 import note as m21note
+import threading
 import time
-import resvg_py
-from reportlab.pdfgen import canvas as rl_canvas
-from reportlab.lib.utils import ImageReader
+import traceback
+import xml.etree.ElementTree as ET
+from metricas import avisar, etapa, sumar
+
+# verovio, resvg_py, reportlab y los anotadores (music21) se importan en la funcion
+# que los usa: importar este modulo (p. ej. para MODOS_PDF) no los carga.
 
 SVG_NS_VEROVIO = "http://www.w3.org/2000/svg"
 ET.register_namespace('', SVG_NS_VEROVIO)
 NAMESPACES_SVG_MAP = {'svg': SVG_NS_VEROVIO}
 
-def _get_note_svg_coords(svg_root_et, note_element_g):
-    if note_element_g is None: return None
-    try:
-        notehead_group = note_element_g.find("./svg:g[@class='notehead']", NAMESPACES_SVG_MAP) or \
-                         note_element_g.find("./svg:g[@data-class='notehead']", NAMESPACES_SVG_MAP)
-        if notehead_group is not None:
-            use_element = notehead_group.find("./svg:use", NAMESPACES_SVG_MAP)
-            if use_element is not None:
-                x = use_element.get('x'); y = use_element.get('y')
-                if x and y: return {'x': float(x), 'y': float(y)}
-                # Verovio 4/5+: posicion en transform="translate(x,y) ..." del <use>.
-                use_tr = use_element.get('transform')
-                if use_tr:
-                    m = re.search(r"translate\(\s*([-\d.]+)[,\s]+([-\d.]+)", use_tr)
-                    if m: return {'x': float(m.group(1)), 'y': float(m.group(2))}
-
-        transform = note_element_g.get('transform')
-        if transform and "translate" in transform:
-            match = re.search(r"translate\(\s*([-\d\.]+)\s*[, ]?\s*([-\d\.]+)\s*\)", transform)
-            if match: return {'x': float(match.group(1)), 'y': float(match.group(2))}
-    except: pass 
-    return None
+VEROVIO_OPTS_DEFECTO = {
+    "pageWidth": 2970, "pageHeight": 2100, "scale": 50,
+    "adjustPageHeight": True, 
+    "pageMarginTop": 100, "pageMarginBottom": 100, 
+    "pageMarginLeft": 100, "pageMarginRight": 100, 
+    "header": "none", "footer": "none", "breaks": "auto", "svgHtml5": True
+}
 
-# Importaciones dinámicas
-ANNOTATION_FUNC_1RA_LOADED = False
-try:
-    from primera_especie.anotador_svg_intervalos import anotar_svg_con_intervalos_primera_especie
-    ANNOTATION_FUNC_1RA_LOADED = True
-except ImportError: pass 
-
-ANNOTATION_FUNC_2DA_LOADED = False
-try:
-    from segunda_especie.anotador_svg_segunda import anotar_svg_intervalos_2da_especie
-    ANNOTATION_FUNC_2DA_LOADED = True
-except ImportError: pass 
-
-def generar_svg_de_musicxml(musicxml_path, verovio_options_dict=None):
-    print(f"--- DEBUG (SVG Gen): Iniciando generar_svg_de_musicxml ---")
-    
-    if verovio_options_dict is None: 
-        verovio_options_dict = {
-            "pageWidth": 2970, "pageHeight": 2100, "scale": 50,
-            "adjustPageHeight": True, 
-            "pageMarginTop": 100, "pageMarginBottom": 100, 
-            "pageMarginLeft": 100, "pageMarginRight": 100, 
-            "header": "none", "footer": "none", "breaks": "auto", "svgHtml5": True
-        }
-    
-    svg_content_str = ""
-    error_msg = None
-    
-    try:
-        tk = verovio.toolkit()
-        
-        # --- CARGA DE FUENTES LOCALES (PRIORIDAD ABSOLUTA) ---
-        # Buscamos la carpeta 'data' exactamente donde estamos ejecutando el script
+# --- POOL DE TOOLKITS DE VEROVIO (por proceso) ---
+# Crear un verovio.toolkit(), buscar las fuentes y aplicar setOptions tiene un
+# coste fijo por llamada. Los toolkits ya configurados se guardan por juego de
+# opciones y se reutilizan entre trabajos; cada toolkit lo usa un solo hilo a la vez.
+_POOL_TOOLKITS = {}
+_POOL_LOCK = threading.Lock()
+_RUTA_FUENTES = None  # None: sin sondear
+
+def _clave_opciones(verovio_options_dict):
+    return json.dumps(verovio_options_dict, sort_keys=True)
+
+def _ruta_fuentes_local():
+    """Sondea una sola vez por proceso la carpeta 'data' de fuentes locales."""
+    global _RUTA_FUENTES
+    if _RUTA_FUENTES is None:
         ruta_data_local = os.path.join(os.getcwd(), "data")
-        
-        if os.path.exists(ruta_data_local) and os.path.isdir(ruta_data_local):
-            # Verificar que los archivos existan
-            if os.path.exists(os.path.join(ruta_data_local, "Bravura.woff")):
-                tk.setResourcePath(ruta_data_local)
-                print(f"✅ DEBUG: Fuentes cargadas desde: {ruta_data_local}")
-            else:
-                print(f"⚠️ DEBUG: La carpeta data existe pero no tiene Bravura.woff")
+        if os.path.exists(os.path.join(ruta_data_local, "Bravura.woff")):
+            _RUTA_FUENTES = ruta_data_local
         else:
-            print(f"❌ ADVERTENCIA: No se encontró la carpeta '{ruta_data_local}'")
+            # Fuentes que trae el paquete verovio de pip. Se fija la ruta de forma
+            # explicita: la ruta por defecto solo vale en el hilo que importo verovio,
+            # y un toolkit creado en otro hilo (servidor, TestClient) no encuentra fuentes.
+            import verovio
+            _RUTA_FUENTES = os.path.join(os.path.dirname(verovio.__file__), "data")
+    return _RUTA_FUENTES
 
-        tk.setOptions(verovio_options_dict)
-        with open(musicxml_path, "r", encoding="utf-8") as f: tk.loadData(f.read())
-        svg_content_str = tk.renderToSVG(1).replace('overflow="inherit"', 'overflow="visible"')
-        
-    except Exception as e:
+def _crear_toolkit(verovio_options_dict):
+    import verovio
+    tk = verovio.toolkit(False)  # sin cargar fuentes: las fija setResourcePath
+    tk.setResourcePath(_ruta_fuentes_local())
+    tk.setOptions(verovio_options_dict)
+    return tk
+
+@contextlib.contextmanager
+def toolkit_verovio(verovio_options_dict):
+    """Presta un toolkit ya configurado con esas opciones y lo devuelve al pool.
+
+    Si el trabajo falla, el toolkit se descarta en lugar de devolverse.
+    """
+    clave = _clave_opciones(verovio_options_dict)
+    with _POOL_LOCK:
+        libres = _POOL_TOOLKITS.setdefault(clave, [])
+        tk = libres.pop() if libres else None
+    if tk is None:
+        tk = _crear_toolkit(verovio_options_dict)
+    yield tk
+    with _POOL_LOCK:
+        _POOL_TOOLKITS[clave].append(tk)
+
+def precalentar_toolkits(*lista_opciones, por_opcion=1):
+    """Crea de antemano `por_opcion` toolkits para cada juego de opciones."""
+    for opts in lista_opciones:
+        clave = _clave_opciones(opts)
+        with _POOL_LOCK:
+            faltan = por_opcion - len(_POOL_TOOLKITS.setdefault(clave, []))
+        nuevos = [_crear_toolkit(opts) for _ in range(max(0, faltan))]
+        with _POOL_LOCK:
+            _POOL_TOOLKITS[clave].extend(nuevos)
+
+def generar_svg_de_musicxml(musicxml_data, verovio_options_dict=None):
+    """Primera pagina de generar_paginas_svg; devuelve (SVG, error)."""
+    paginas, error_msg = generar_paginas_svg(musicxml_data, verovio_options_dict)
+    return (paginas[0] if paginas else ""), error_msg
+
+def _pagina_error(error_msg):
+    return f'<svg xmlns="{SVG_NS_VEROVIO}" width="500" height="100"><text x="10" y="50" fill="red">{error_msg}</text></svg>'
+
+def iterar_paginas_svg(musicxml_data, verovio_options_dict=None, tiempos=None, info=None):
+    """Genera una a una las paginas SVG del MusicXML.
+
+    Verovio reparte la partitura en paginas segun pageWidth/pageHeight y breaks;
+    la maquetacion se calcula una vez (loadData) y cada pagina se renderiza al
+    pedirla, asi que solo hay un SVG vivo a la vez. Si Verovio falla, la pagina
+    lleva el error en rojo. info (dict opcional) recibe "paginas" y "error" (el
+    primer mensaje o None); en tiempos se suma la etapa "svg". El toolkit vuelve
+    al pool al agotar o cerrar el generador.
+    """
+    if verovio_options_dict is None:
+        verovio_options_dict = VEROVIO_OPTS_DEFECTO
+    info = {} if info is None else info
+    info.update(paginas=0, error=None)
+
+    def fallo(e):
         error_msg = f"Error Verovio: {e}"
         traceback.print_exc()
-        svg_content_str = f'<svg xmlns="{SVG_NS_VEROVIO}" width="500" height="100"><text x="10" y="50" fill="red">{error_msg}</text></svg>'
-        
-    return svg_content_str, error_msg
+        info["error"] = info["error"] or error_msg
+        return _pagina_error(error_msg)
+
+    with toolkit_verovio(verovio_options_dict) as tk:
+        try:
+            with etapa(tiempos, "svg"):
+                if not tk.loadData(musicxml_data):
+                    raise ValueError("no se pudo cargar la partitura")
+                info["paginas"] = tk.getPageCount()
+        except Exception as e:
+            info["paginas"] = 1
+            yield fallo(e)
+            return
+        for n in range(1, info["paginas"] + 1):
+            try:
+                with etapa(tiempos, "svg"):
+                    svg = tk.renderToSVG(n).replace('overflow="inherit"', 'overflow="visible"')
+            except Exception as e:
+                svg = fallo(e)
+            yield svg
+
+def generar_paginas_svg(musicxml_data, verovio_options_dict=None):
+    """Renderiza a SVG todas las paginas del MusicXML; devuelve (lista de SVG, error)."""
+    info = {}
+    paginas = list(iterar_paginas_svg(musicxml_data, verovio_options_dict, info=info))
+    return paginas, info["error"]
+
+def _descartar_destino(destino):
+    """Borra una salida a medio escribir (solo si es una ruta)."""
+    if isinstance(destino, (str, os.PathLike)):
+        try: os.remove(destino)
+        except OSError: pass
+
+# --- RASTERIZADO POR PAGINAS ---
+# Cada pagina se rasteriza con un zoom limitado a MAX_PIXELES_PAGINA pixeles, asi
+# que la memoria de un PNG no depende de la longitud del ejercicio. Las paginas
+# pueden llegar de un generador y se consumen a medida que avanza el PDF. Con
+# workers > 1 se rasterizan en un pool de procesos (resvg no suelta el GIL) con a
+# lo sumo 2 * workers paginas en vuelo, y se incorporan al PDF en orden.
+MAX_PIXELES_PAGINA = 16_000_000
+_POOL_PAGINAS = None  # (workers, ProcessPoolExecutor), se crea al primer uso
+_POOL_PAGINAS_LOCK = threading.Lock()
+
+def _zoom_pagina(svg_content, zoom, max_pixeles):
+    """Reduce el zoom si la pagina rasterizada superaria max_pixeles."""
+    inicio = svg_content.find("<svg")
+    cabecera = svg_content[inicio:svg_content.find(">", inicio)]
+    ancho = re.search(r'\swidth="([\d.]+)', cabecera)
+    alto = re.search(r'\sheight="([\d.]+)', cabecera)
+    if ancho and alto:
+        area = float(ancho.group(1)) * float(alto.group(1))
+        if area * zoom * zoom > max_pixeles:
+            return math.sqrt(max_pixeles / area)
+    return zoom
+
+def _rasterizar_pagina(svg_content, zoom):
+    """SVG -> PNG (bytes) con resvg. Tambien corre en los procesos del pool de paginas."""
+    import resvg_py
+    return bytes(resvg_py.svg_to_bytes(svg_string=svg_content, zoom=zoom, background="#ffffff"))
+
+def _pool_paginas(workers):
+    global _POOL_PAGINAS
+    with _POOL_PAGINAS_LOCK:
+        if _POOL_PAGINAS is None or _POOL_PAGINAS[0] != workers:
+            if _POOL_PAGINAS is not None:
+                _POOL_PAGINAS[1].shutdown(wait=False)
+            _POOL_PAGINAS = (workers, concurrent.futures.ProcessPoolExecutor(max_workers=workers))
+        return _POOL_PAGINAS[1]
 
-def convertir_svg_a_pdf_local(svg_content, zoom=3.0):
+def _rasterizar_paginas(paginas, zoom, workers, max_pixeles):
+    """(png, zoom usado) de cada pagina (iterable de SVG), en orden."""
+    paginas = iter(paginas)
+    primeras = list(itertools.islice(paginas, 1 if workers <= 1 else 2))
+    if len(primeras) < 2:
+        # Un solo worker, o una sola pagina: sin pool.
+        for svg in itertools.chain(primeras, paginas):
+            z = _zoom_pagina(svg, zoom, max_pixeles)
+            yield _rasterizar_pagina(svg, z), z
+        return
+    pool = _pool_paginas(workers)
+    en_vuelo = collections.deque()
+    for svg in itertools.chain(primeras, paginas):
+        z = _zoom_pagina(svg, zoom, max_pixeles)
+        en_vuelo.append((pool.submit(_rasterizar_pagina, svg, z), z))
+        if len(en_vuelo) >= 2 * workers:
+            fut, z = en_vuelo.popleft()
+            yield fut.result(), z
+    while en_vuelo:
+        fut, z = en_vuelo.popleft()
+        yield fut.result(), z
+
+def convertir_svg_a_pdf_local(svg_content, destino, zoom=3.0, workers=1,
+                              max_pixeles=MAX_PIXELES_PAGINA):
     """
     Convierte el SVG a PDF: resvg (SVG -> PNG) + reportlab (PNG -> PDF).
 
@@ -105,92 +216,199 @@ def convertir_svg_a_pdf_local(svg_content, zoom=3.0):
     Historial: cairosvg fallaba con GDI en Windows; svglib no aplicaba el escalado
     del viewBox anidado (partitura rota). El PDF resultante es raster de alta
     resolucion (zoom por defecto 3x); el informe textual sigue siendo vectorial.
-    """
-    nombre_seguro = "temp_partitura_generada.pdf"
-
-    # Asegurarnos de que no exista o que se pueda borrar
-    if os.path.exists(nombre_seguro):
-        try: os.remove(nombre_seguro)
-        except: pass
 
+    `svg_content` es un SVG o un iterable de paginas SVG (una pagina del PDF por
+    cada una; ver _rasterizar_paginas para workers y max_pixeles). `destino` es una
+    ruta o un fichero binario (p. ej. BytesIO): los PNG y el PDF se generan en
+    memoria, sin archivos temporales. Devuelve True si se escribio.
+    """
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas as rl_canvas
+    paginas = [svg_content] if isinstance(svg_content, str) else svg_content
     try:
-        png_bytes = bytes(resvg_py.svg_to_bytes(
-            svg_string=svg_content, zoom=zoom, background="#ffffff"))
-        img = ImageReader(io.BytesIO(png_bytes))
-        iw, ih = img.getSize()            # pixeles renderizados (a 'zoom')
-        pw, ph = iw / zoom, ih / zoom     # tamano logico en puntos
-        c = rl_canvas.Canvas(nombre_seguro, pagesize=(pw, ph))
-        c.drawImage(img, 0, 0, width=pw, height=ph)
-        c.showPage()
+        c = rl_canvas.Canvas(destino)
+        for png_bytes, z in _rasterizar_paginas(paginas, zoom, workers, max_pixeles):
+            img = ImageReader(io.BytesIO(png_bytes))
+            iw, ih = img.getSize()            # pixeles renderizados (a 'z')
+            pw, ph = iw / z, ih / z           # tamano logico en puntos
+            c.setPageSize((pw, ph))
+            c.drawImage(img, 0, 0, width=pw, height=ph)
+            c.showPage()
         c.save()
-        return nombre_seguro
+        return True
     except Exception as e:
         print(f"Error resvg->PDF: {e}")
         traceback.print_exc()
-        return None
-
-def generar_pdf_partitura(musicxml_path, output_pdf="partitura.pdf", verovio_options=None,
-                          score_m21_obj=None, cf_part_m21_obj=None, cp_part_m21_obj=None, 
-                          species_str="primera", datos_anotacion_especie=None ):
-    
-    svg_str, err = generar_svg_de_musicxml(musicxml_path, verovio_options)
-    if err: print(err)
-    final_svg = svg_str 
-
-    # Lógica de anotación
-    if score_m21_obj and (ANNOTATION_FUNC_1RA_LOADED or ANNOTATION_FUNC_2DA_LOADED):
-        svg_et = None
-        try:
-            clean_svg = svg_str.split('?>', 1)[-1].strip() if '<?xml' in svg_str else svg_str
-            svg_et = ET.fromstring(clean_svg)
-        except: pass
-
-        if svg_et is not None:
-            coords_dict = {}
-            staves = svg_et.findall(".//svg:g[@data-class='staff']", NAMESPACES_SVG_MAP)
-            parts = score_m21_obj.parts
-            if len(parts) > 0 and len(staves) % len(parts) == 0:
-                for i, part in enumerate(parts):
-                    m21_notes = [n for n in part.flatten().notes if hasattr(n,'id') and n.id]
-                    svg_notes = []
-                    for j, staff in enumerate(staves):
-                        if j % len(parts) == i:
-                            svg_notes.extend(staff.findall(".//svg:g[@data-class='note']", NAMESPACES_SVG_MAP))
-                    if len(m21_notes) == len(svg_notes):
-                        for k, n in enumerate(m21_notes):
-                            c = _get_note_svg_coords(svg_et, svg_notes[k])
-                            if c: coords_dict[n.id] = c
-
-            annotated = None
-            if species_str == "segunda" and ANNOTATION_FUNC_2DA_LOADED and datos_anotacion_especie:
-                try:
-                    annotated = anotar_svg_intervalos_2da_especie(
-                        svg_str, datos_anotacion_especie.get('intervalos'), coords_dict,
-                        ids_notas_rojas=datos_anotacion_especie.get('ids_rojos', []),
-                        datos_movimiento_melodico_cp=datos_anotacion_especie.get('movimientos_cp', [])
-                    )
-                except: traceback.print_exc()
-            elif species_str == "primera" and ANNOTATION_FUNC_1RA_LOADED:
-                try:
-                    annotated = anotar_svg_con_intervalos_primera_especie(
-                        svg_str, score_m21_obj, cf_part_m21_obj, cp_part_m21_obj,
-                        datos_movimiento_melodico_cf=datos_anotacion_especie.get('movimientos_cf'),
-                        datos_movimiento_melodico_cp=datos_anotacion_especie.get('movimientos_cp'),
-                        species="primera"
-                    )
-                except: traceback.print_exc()
-            if annotated: final_svg = annotated
-    
-    # Generación Local Segura
-    pdf_local = convertir_svg_a_pdf_local(final_svg)
-    
-    if pdf_local and os.path.exists(pdf_local):
-        try:
-            time.sleep(0.1) 
-            shutil.copy2(pdf_local, output_pdf)
-            return output_pdf
-        except Exception as e:
-            print(f"Error copiando PDF final: {e}")
-            return pdf_local
-    
-    return None
\ No newline at end of file
+        _descartar_destino(destino)
+        return False
+
+def convertir_svg_a_pdf_vectorial(svg_content, destino, workers=1):
+    """
+    Convierte el SVG a PDF vectorial (svg_vectorial -> operaciones de dibujo de reportlab).
+
+    Mismo tamano de pagina que el camino raster, pero los trazos, glifos y
+    anotaciones quedan como vectores: nitido al imprimir y mucho mas ligero.
+    Acepta tambien un iterable de paginas SVG. `workers` se ignora: todas las
+    paginas se dibujan en el mismo canvas de reportlab, en este proceso.
+    """
+    from svg_vectorial import dibujar_svg_en_pdf
+    try:
+        dibujar_svg_en_pdf(svg_content, destino)
+        return True
+    except Exception as e:
+        print(f"Error SVG->PDF vectorial: {e}")
+        traceback.print_exc()
+        _descartar_destino(destino)
+        return False
+
+# Modo de salida de la partitura anotada -> conversor SVG -> PDF.
+MODOS_PDF = {
+    "raster": convertir_svg_a_pdf_local,
+    "vectorial": convertir_svg_a_pdf_vectorial,
+}
+
+# --- CAPAS DE ANOTACION ---
+# Por especie, lista ordenada de capas (nombre, "modulo:funcion"). Cada pagina SVG se
+# parsea una vez, cada capa activa dibuja sobre el mismo arbol y se serializa una vez.
+# Una capa es una funcion capa(ctx) que recibe el contexto de anotacion de una
+# pagina (ver _anotar_pagina); las posteriores ven lo que dejaron las anteriores. Los modulos se
+# importan al anotar: validar nombres de capa no los carga.
+CAPAS_ANOTACION = {
+    "primera": [
+        ("intervalos", "primera_especie.anotador_svg_intervalos:capa_intervalos"),
+        ("flechas", "primera_especie.anotador_svg_intervalos:capa_flechas"),
+    ],
+    "segunda": [
+        ("intervalos", "segunda_especie.anotador_svg_segunda:capa_intervalos"),
+        ("movimiento", "segunda_especie.anotador_svg_segunda:capa_movimiento"),
+        ("flechas", "segunda_especie.anotador_svg_segunda:capa_flechas"),
+        ("notas_rojas", "segunda_especie.anotador_svg_segunda:capa_notas_rojas"),
+    ],
+}
+
+def capas_disponibles(species_str):
+    """Nombres de las capas de la especie, en orden de dibujo."""
+    return [nombre for nombre, _ in CAPAS_ANOTACION.get(species_str, [])]
+
+def _cargar_capa(referencia):
+    import importlib
+    modulo, funcion = referencia.split(":")
+    return getattr(importlib.import_module(modulo), funcion)
+
+def _capas_activas(species_str, capas):
+    """[(nombre, funcion)] de las capas a dibujar (capas None: todas); las que no cargan se omiten."""
+    activas = []
+    for nombre, ref in CAPAS_ANOTACION.get(species_str, []):
+        if capas is None or nombre in capas:
+            try:
+                activas.append((nombre, _cargar_capa(ref)))
+            except Exception:
+                traceback.print_exc()
+    return activas
+
+def _anotar_pagina(svg_str, activas, cf_voz, cp_voz, datos_anotacion_especie,
+                   coords_salida=None, tiempos=None):
+    """Superpone a una pagina SVG de Verovio las capas activas; devuelve la pagina anotada.
+
+    El contexto (arbol parseado una vez e indice de sus notas) es de esta pagina.
+    Cada capa se mide como subetapa "anotacion.<capa>" en `tiempos`; si falla, se
+    registra y el resto de capas (y de paginas) se dibuja igual. Si se pasa
+    `coords_salida` (dict), recibe el mapa id de nota -> coordenadas SVG de la pagina.
+    """
+    if not activas:
+        return svg_str
+    from indice_svg import indexar_notas
+    try:
+        clean_svg = svg_str.split('?>', 1)[-1].strip() if '<?xml' in svg_str else svg_str
+        svg_et = ET.fromstring(clean_svg)
+    except ET.ParseError:
+        return svg_str
+    coords_dict = indexar_notas(svg_et)
+    if coords_salida is not None:
+        coords_salida.update(coords_dict)
+    page_margin_group = svg_et.find(".//svg:g[@class='page-margin']", NAMESPACES_SVG_MAP)
+    ctx = {
+        "raiz": svg_et,
+        "grupo": page_margin_group if page_margin_group is not None else svg_et,
+        "coords": coords_dict,
+        "datos": datos_anotacion_especie or {},
+        "cf": cf_voz, "cp": cp_voz,
+    }
+    for nombre, capa in activas:
+        with etapa(tiempos, f"anotacion.{nombre}"):
+            try:
+                capa(ctx)
+            except Exception:
+                traceback.print_exc()
+    return ET.tostring(svg_et, encoding="unicode")
+
+# --- VOLCADO DE DEPURACION (opcional, por trabajo) ---
+# Solo si el llamador pasa un directorio: el MusicXML que recibe Verovio, el SVG
+# crudo, el SVG anotado y el mapa de coordenadas de las notas. Cada trabajo usa
+# su propio directorio, asi que dos trabajos concurrentes no se pisan.
+# Con varias paginas, los SVG llevan el numero de pagina (verovio_p2.svg...); cada
+# pagina se escribe al pasar por el pipeline.
+def _volcar_depuracion(directorio, archivos):
+    try:
+        os.makedirs(directorio, exist_ok=True)
+        for nombre, contenido in archivos:
+            with open(os.path.join(directorio, nombre), "w", encoding="utf-8") as f:
+                f.write(contenido)
+    except OSError as e:
+        print(f"Aviso: no se pudo volcar la depuracion en {directorio}: {e}")
+
+def generar_pdf_partitura(musicxml_data, output_pdf="partitura.pdf", verovio_options=None,
+                          cf_voz=None, cp_voz=None, species_str="primera", datos_anotacion_especie=None, modo_pdf="raster",
+                          tiempos=None, depuracion=None, capas=None, workers_pdf=1):
+    # Todas las paginas de Verovio van al PDF, una pagina del PDF por cada una.
+    # workers_pdf: procesos para rasterizar las paginas en paralelo (modo raster).
+    # tiempos: dict opcional donde se suman las etapas svg, anotacion y pdf (metricas.etapa).
+    # depuracion: directorio opcional para los artefactos intermedios (None: sin E/S extra).
+    # capas: capas de anotacion a dibujar (None: todas las de la especie, CAPAS_ANOTACION).
+    # cf_voz, cp_voz: voces compactas (analisis_musical_comun.voces); el score de
+    # music21 no llega hasta aqui, el llamador puede liberarlo tras exportar el MusicXML.
+    #
+    # Las paginas van de una en una por Verovio, las capas de anotacion y el
+    # conversor: solo hay una pagina viva a la vez (en raster con workers_pdf > 1,
+    # a lo sumo 2 * workers_pdf en vuelo), asi que la memoria de esta etapa no crece
+    # con el numero de paginas. Las etapas se intercalan pagina a pagina: svg y
+    # anotacion suman lo de todas las paginas y pdf es el resto del tiempo.
+    parciales, info = {}, {}
+    coords = {} if depuracion else None
+    activas = _capas_activas(species_str, capas)
+    inicio = time.perf_counter()
+    avisar(tiempos, "svg")
+    if depuracion:
+        _volcar_depuracion(depuracion, [("partitura.musicxml", musicxml_data)])
+
+    def anotadas():
+        for n, svg_str in enumerate(iterar_paginas_svg(musicxml_data, verovio_options, parciales, info), 1):
+            if n == 1:
+                if info["error"]: print(info["error"])
+                avisar(tiempos, "anotacion")
+            with etapa(parciales, "anotacion"):
+                final_svg = _anotar_pagina(svg_str, activas, cf_voz, cp_voz, datos_anotacion_especie,
+                                           coords, parciales)
+            if depuracion:
+                sufijo = f"_p{n}" if info["paginas"] > 1 else ""
+                _volcar_depuracion(depuracion, [(f"verovio{sufijo}.svg", svg_str),
+                                                (f"anotada{sufijo}.svg", final_svg)])
+            if n == 1:
+                avisar(tiempos, "pdf")
+            yield final_svg
+
+    # El conversor escribe directamente en output_pdf (ruta o fichero binario).
+    paginas = anotadas()
+    try:
+        escrito = MODOS_PDF[modo_pdf](paginas, output_pdf, workers=workers_pdf)
+    finally:
+        paginas.close()  # devuelve el toolkit al pool aunque el conversor falle
+    total = time.perf_counter() - inicio
+    for nombre, segundos in parciales.items():
+        sumar(tiempos, nombre, segundos, inicio)
+    sumar(tiempos, "pdf", max(0.0, total - parciales.get("svg", 0.0) - parciales.get("anotacion", 0.0)), inicio)
+    if depuracion:
+        _volcar_depuracion(depuracion, [("coordenadas.json", json.dumps(coords, indent=1))])
+    if escrito:
+        return output_pdf
+    return None